@@ -0,0 +1,74 @@
+#!/usr/bin/python
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+
+Times the step-statistics decode over a pulse file the way load_motion runs
+it: one StepStatsAccumulator.update() per 256 KB chunk and a result() at the
+end. Each engine available here is timed, alongside the older pattern of
+chaining decode_all_steps() through its data argument, and the engines'
+answers are checked against each other.
+
+    python bench-decode-steps.py [file.puls] [repeat]
+"""
+import sys
+import time
+
+from gfutilities.puls import pulsedata
+from gfutilities.puls.source import PulseSource
+
+_CHUNK = 256 * 1024
+
+path = sys.argv[1] if len(sys.argv) > 1 else '_RESOURCES/MOTION/motions_xxxxx.puls'
+repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+with open(path, 'rb') as f:
+    source = PulseSource(f.read())
+chunks = []
+while True:
+    chunk = source.read(_CHUNK)
+    if not chunk:
+        break
+    chunks.append(chunk)
+payload = sum(len(c) for c in chunks)
+print('%s: %d payload bytes, %d chunks of %d' % (path, payload, len(chunks), _CHUNK))
+
+
+def _accumulate(vectorized: bool) -> dict:
+    stats = pulsedata.StepStatsAccumulator(vectorized=vectorized)
+    for piece in chunks:
+        stats.update(piece)
+    return stats.result()
+
+
+def _chained() -> dict:
+    stat = None
+    for piece in chunks:
+        stat = pulsedata.decode_all_steps(piece, stat)
+    return stat
+
+
+runs = [('python', lambda: _accumulate(False))]
+if pulsedata.np is not None:
+    runs.append(('numpy', lambda: _accumulate(True)))
+else:
+    print('numpy is not installed; timing the Python engine only')
+runs.append(('chained', _chained))
+
+results = {}
+for name, run in runs:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results[name] = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None or elapsed < best else best
+    print('%-7s best of %d: %8.2f ms  (%7.1f MB/s)'
+          % (name, repeat, best * 1000, payload / best / 1e6))
+
+if 'numpy' in results:
+    assert results['python'] == results['numpy'], 'engines disagree'
+    print('engines agree on every counter')
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+
+Runs a fleet of emulated machines in this one process, each with a serial
+and a configuration of its own, and prints the actions they handled per
+second and the latency percentiles, from an action's arrival to its
+terminal event being queued.
+
+    python bench-fleet.py [machines] [seconds] [client] [cfg]
+
+Without a cfg the fleet runs against the mock service on localhost, each
+machine through settings, homing, hunt and a print; seconds is then the
+longest to wait for them. With one, it connects to the service the cfg
+names (a staging service - never the production one) for that many
+seconds, and every machine signs in as serial 90000000 + n with the cfg's
+password. client is 'asyncio' for AsyncWsClient, else the threaded
+WsClient, which with many machines can take up to its 10 s ping timeout
+to stop.
+"""
+import logging
+import sys
+import tempfile
+import time
+
+from gfutilities.configuration import get_cfg, parse, set_cfg
+from gfutilities.service.fleet import Fleet
+
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+client = sys.argv[3] if len(sys.argv) > 3 and sys.argv[3] != '-' else None
+cfg = sys.argv[4] if len(sys.argv) > 4 else None
+
+
+class _Serial(logging.Filter):
+    """Tag every record with the machine it is from: get_cfg reads the
+    scope of the thread logging it."""
+    def filter(self, record):
+        record.serial = get_cfg('MACHINE.SERIAL') or '-'
+        return True
+
+
+handler = logging.StreamHandler()
+handler.addFilter(_Serial())
+handler.setFormatter(logging.Formatter('(%(levelname)s) [%(serial)s] %(module)s:%(funcName)s %(message)s'))
+logger = logging.getLogger('openglow')
+logger.addHandler(handler)
+logger.setLevel(logging.WARNING)
+
+mock = None
+if cfg:
+    parse(cfg)
+else:
+    from gfutilities.service.mockservice import MockService
+    mock = MockService().start()
+    mock.configure()
+    work = tempfile.mkdtemp(prefix='gf-fleet-')
+    for n in range(1, 5):
+        with open('%s/HOME_%d.jpg' % (work, n), 'wb') as f:
+            f.write(b'\xff\xd8 placeholder %d \xff\xd9' % n)
+    set_cfg('EMULATOR.IMAGE_SRC_DIR', work)
+    set_cfg('EMULATOR.MOTION_DL_DIR', work)
+    set_cfg('FACTORY_FIRMWARE.CHECK', False)
+set_cfg('SERVICE.WS_CLIENT', client)
+
+fleet = Fleet(size, ramp=0.005)
+fleet.start()
+if mock is not None:
+    if not mock.wait(machines=size, timeout=seconds):
+        print('not every machine finished the script')
+else:
+    time.sleep(seconds)
+summary = fleet.summary()
+fleet.stop()
+if mock is not None:
+    mock.stop()
+
+print('%d machines, %d actions in %.2fs: %.1f actions/s'
+      % (summary['machines'], summary['actions'], summary['elapsed'], summary['throughput'] or 0))
+print('%-10s %6s %8s %8s %8s %8s' % ('action', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+rows = sorted(summary['by_action'].items()) + [('all', dict(summary['latency'], count=summary['actions']))]
+for action, row in rows:
+    if row['p50'] is None:
+        continue
+    print('%-10s %6d %8.1f %8.1f %8.1f %8.1f' % (action, row['count'], row['p50'] * 1000, row['p90'] * 1000,
+                                                row['p99'] * 1000, row['max'] * 1000))
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+
+Runs the emulator against the mock Glowforge service on localhost, with no
+network and no account: sign-in, the firmware probe, the homing sequence,
+the focus hunt and a number of prints. Prints the action latencies and the
+throughput the service saw. The camera images are placeholders written to
+a temporary directory, and downloaded jobs go there too.
+
+    python bench-mock-service.py [prints] [client]
+
+client is 'asyncio' for AsyncWsClient; the threaded WsClient by default.
+"""
+import logging
+import sys
+import tempfile
+import threading
+
+from gfutilities import Emulator, GFUIService
+from gfutilities.configuration import set_cfg
+from gfutilities.service.mockservice import DEFAULT_SCRIPT, MockService
+
+prints = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+client = sys.argv[2] if len(sys.argv) > 2 else None
+
+logging.basicConfig(format='(%(levelname)s) %(module)s:%(funcName)s %(message)s')
+logging.getLogger('openglow').setLevel(logging.WARNING)
+
+work = tempfile.mkdtemp(prefix='gf-mock-')
+for n in range(1, 5):
+    with open('%s/HOME_%d.jpg' % (work, n), 'wb') as f:
+        f.write(b'\xff\xd8 placeholder %d \xff\xd9' % n)
+set_cfg('EMULATOR.IMAGE_SRC_DIR', work)
+set_cfg('EMULATOR.MOTION_DL_DIR', work)
+set_cfg('FACTORY_FIRMWARE.CHECK', True)
+set_cfg('SERVICE.WS_CLIENT', client)
+
+with MockService(script=DEFAULT_SCRIPT + ('print',) * (prints - 1)) as mock:
+    mock.configure(serial='12345678', password='mock')
+    service = GFUIService(Emulator())
+    if not service.connect():
+        sys.exit('could not connect to the mock service')
+    runner = threading.Thread(target=service.run)
+    runner.start()
+    finished = mock.wait(timeout=60 + 10 * prints)
+    service.request_stop()
+    runner.join(10)
+
+summary = mock.summary()
+if not finished:
+    print('the script did not finish')
+print('%d actions, %d completed, in %.3fs: %.1f actions/s'
+      % (summary['actions'], summary['completed'], summary['elapsed'], summary['throughput']))
+print('%-10s %5s %28s %28s' % ('action', 'count', 'first event mean/p95/max ms', 'terminal mean/p95/max ms'))
+for action, row in summary['by_action'].items():
+    cells = ['/'.join('%.1f' % (row[k][s] * 1000) if row[k][s] is not None else '-'
+                      for s in ('mean', 'p95', 'max')) for k in ('first', 'terminal')]
+    print('%-10s %5d %28s %28s' % (action, row['count'], cells[0], cells[1]))
+print('job bytes served: %d, uploads: %d' % (mock.stats['job_bytes'], mock.stats['uploads']))
@@ -10,6 +10,7 @@ import logging
 
 from gfutilities.configuration import *
 from gfutilities import GFUIService, Emulator
+from gfutilities.service.recording import SessionRecorder
 
 parse('gf-machine-emulator.cfg')
 
@@ -23,6 +24,10 @@ if get_cfg('LOGGING.FILE'):
     fh.setFormatter(logging.Formatter('%(asctime)s (%(levelname)s) %(module)s:%(funcName)s %(message)s'))
     logger.addHandler(fh)
 
+if get_cfg('LOGGING.RECORD_SESSION'):
+    # Replay it with examples/replay-session.py.
+    SessionRecorder(get_cfg('LOGGING.RECORD_SESSION')).start()
+
 service = GFUIService(Emulator())
 service.connect()
 service.run()
@@ -0,0 +1,46 @@
+#!/usr/bin/python
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+
+Replays a recorded session (LOGGING.RECORD_SESSION in the emulator's
+configuration, or a SessionRecorder) to a fresh emulator, on localhost, and
+prints the diff of the events it sent against the recorded ones and how
+long the replay took against the recording.
+
+    python replay-session.py <recording> [speed] [cfg]
+
+speed is how many times faster than recorded, 'max' for as fast as the
+machine goes; 1 by default. The emulator's configuration, its image
+directory first, comes from cfg, gf-machine-emulator.cfg by default.
+"""
+import logging
+import sys
+
+from gfutilities.configuration import parse
+from gfutilities.service.replay import replay
+
+if len(sys.argv) < 2:
+    sys.exit(__doc__)
+path = sys.argv[1]
+speed = sys.argv[2] if len(sys.argv) > 2 else '1'
+parse(sys.argv[3] if len(sys.argv) > 3 else 'gf-machine-emulator.cfg')
+
+logging.basicConfig(format='(%(levelname)s) %(module)s:%(funcName)s %(message)s')
+logging.getLogger('openglow').setLevel(logging.WARNING)
+
+result = replay(path, speed=None if speed == 'max' else float(speed))
+for line in result['diff']:
+    print(line)
+print('%s: %d events recorded, %d replayed, %d frames sent'
+      % ('match' if result['match'] else 'MISMATCH', result['events']['recorded'],
+         result['events']['replayed'], result['frames']))
+for request in result['unmatched']:
+    print('no recorded response: %s' % request)
+if result['elapsed']:
+    print('replayed in %.3fs, recorded in %.3fs: %.1fx'
+          % (result['elapsed'], result['recorded'] or 0, result['speedup'] or 0))
+sys.exit(0 if result['match'] else 1)
@@ -6,11 +6,16 @@ https://community.openglow.org
 SPDX-License-Identifier:    MIT
 """
 import configparser
+from contextlib import contextmanager
+from contextvars import ContextVar
 import logging
-from typing import Any
+from typing import Any, Callable, Union
 
 _CONFIG = {}
 
+# The overrides in force for the code running now, if any (see use_scope).
+_SCOPE = ContextVar('gfutilities_config_scope', default=None)
+
 
 def parse(cfg_file: str) -> None:
     """
@@ -62,6 +67,9 @@ def get_cfg(parameter: str) -> Any:
     :return: The value of the parameter
     :rtype: Any
     """
+    scope = _SCOPE.get()
+    if scope is not None and parameter in scope:
+        return scope[parameter]
     return _CONFIG.get(parameter)
 
 
@@ -77,7 +85,61 @@ def set_cfg(parameter: str, value: Any, keep_value: bool = False):
     """
     if keep_value and get_cfg(parameter) is not None:
         return
-    _CONFIG[parameter] = value
+    scope = _SCOPE.get()
+    if scope is not None:
+        scope[parameter] = value
+    else:
+        _CONFIG[parameter] = value
+
+
+@contextmanager
+def use_scope(scope: Union[dict, None]):
+    """
+    Run the block with a configuration of its own.
+    The configuration is process-wide, and a machine keeps its state in it:
+    serial, tokens, whether its settings have been reported. To run several
+    machines in one process, each gets a scope - a dict of parameters that
+    are its own. Inside the block get_cfg reads the scope first and the
+    process-wide configuration after, and set_cfg writes to the scope only.
+    The scope follows the block into asyncio tasks, but not into threads: a
+    thread started inside it runs in it only if its target is wrapped with
+    scoped(). None is no scope, the process-wide configuration alone.
+    :param scope: the parameters of this scope, updated in place
+    :type scope: Union[dict, None]
+    """
+    token = _SCOPE.set(scope)
+    try:
+        yield scope
+    finally:
+        _SCOPE.reset(token)
+
+
+def current_scope() -> Union[dict, None]:
+    """
+    The scope in force here, if any (see use_scope).
+    :return: the scope
+    :rtype: Union[dict, None]
+    """
+    return _SCOPE.get()
+
+
+def scoped(target: Callable) -> Callable:
+    """
+    Bind a callable to the scope in force where it is wrapped, for a thread
+    or an executor to run it in. Without a scope, the callable itself.
+    :param target: the callable
+    :type target: Callable
+    :return: the callable, bound to the scope
+    :rtype: Callable
+    """
+    scope = _SCOPE.get()
+    if scope is None:
+        return target
+
+    def run(*args, **kwargs):
+        with use_scope(scope):
+            return target(*args, **kwargs)
+    return run
 
 
-__all__ = ['get_cfg', 'parse', 'set_cfg', 'log_level']
+__all__ = ['current_scope', 'get_cfg', 'parse', 'scoped', 'set_cfg', 'log_level', 'use_scope']
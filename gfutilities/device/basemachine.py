@@ -5,19 +5,27 @@ https://community.openglow.org
 
 SPDX-License-Identifier:    MIT
 """
+from collections import OrderedDict, deque
 import logging
 from queue import Queue
 from requests import Session
-from threading import Thread
+from threading import Event, Lock, Thread
+import time
 from typing import Union
 
 from gfutilities._common import *
-from gfutilities.configuration import set_cfg
+from gfutilities.configuration import scoped, set_cfg
 from gfutilities.device.settings import send_report, get_machine_setting
 from gfutilities.service.websocket import send_wss_event, firmware_check
 
 logger = logging.getLogger(LOGGER_NAME)
 
+# Cancelled actions whose timings are kept, most recent last.
+_CANCEL_HISTORY = 32
+
+# Actions whose queue wait and run time are kept, most recent last.
+_ACTION_HISTORY = 256
+
 
 class BaseMachine:
     """
@@ -29,15 +37,25 @@ class BaseMachine:
         """
         Initializes the object, child threads and message queues.
         """
-        self._action_thread: _ActionThread = _ActionThread(self, {})
+        # Runs the actions, one at a time; started with the first one.
+        self._action_worker: Union[_ActionWorker, None] = None
         self._q_msg_tx: Union[Queue, None] = None
         self.running_action_id: Union[int, None] = 0
         self.running_action_type: Union[str, None] = None
         self._running_action_cancelled: bool = False
+        # Held to claim, cancel and release the running action: a cancel
+        # from the WS receive thread that checks the running id and then
+        # sets the flag must not straddle the release of that action and
+        # the claim of the next, or it cancels the next one.
+        self._claim_lock = Lock()
         # Per-shot camera settings the service attaches to the current image
         # action (canonical source for the image handlers; see _image_settings).
         self._action_settings: dict = {}
         self._session: Union[Session, None] = None
+        # action_id -> how long its cancel took to land (see cancel_running).
+        self.cancel_timings: OrderedDict = OrderedDict()
+        # Per action: how long it waited for the worker, and how long it ran.
+        self.action_timings: deque = deque(maxlen=_ACTION_HISTORY)
 
         set_cfg('FACTORY_FIRMWARE.FW_VERSION', get_machine_setting('MCov'), True)
         set_cfg('FACTORY_FIRMWARE.APP_VERSION', get_machine_setting('MCdv'), True)
@@ -62,11 +80,14 @@ class BaseMachine:
         :rtype: bool
         """
         action_id = int(action_id)
-        if action_id == self.running_action_id and status == 'cancelled':
-            logger.debug('action %s (%s) cancellation received' % (action_id, msg_type))
-            self._running_action_cancelled = True
-            return False
         if status == 'cancelled':
+            with self._claim_lock:
+                running = action_id == self.running_action_id
+                if running:
+                    self._running_action_cancelled = True
+                    self._note_cancel(action_id, 'dispatch')
+            if running:
+                logger.debug('action %s (%s) cancellation received' % (action_id, msg_type))
             return False
         # Only a 'ready' action starts. The service uses 'ready' to launch work;
         # the other status values in the protocol (new/started/success/failure)
@@ -75,14 +96,76 @@ class BaseMachine:
         if status != 'ready':
             logger.debug('ignoring status "%s" for action %s (%s)' % (status, action_id, msg_type))
             return False
-        if self.running_action_id:
-            return False
+        with self._claim_lock:
+            if self.running_action_id:
+                return False
+            self.running_action_id = action_id
+            self.running_action_type = msg_type
+            self._running_action_cancelled = False
         logger.debug('running action set to %s (%s)' % (action_id, msg_type))
-        self.running_action_id = action_id
-        self.running_action_type = msg_type
-        self._running_action_cancelled = False
         return True
 
+    def _release_action(self) -> None:
+        """Release the claim on the running action, once it is over."""
+        with self._claim_lock:
+            self.running_action_id = None
+            self.running_action_type = None
+
+    def cancel_running(self, action_id, received: float = None) -> bool:
+        """
+        Cancel the running action now, from whatever thread hears of it.
+        The WS receive thread calls this as a cancel arrives, so it takes
+        effect without waiting behind the frames queued for dispatch; the
+        cancel still reaches _ok_to_run_action later, where it changes
+        nothing more.
+        :param action_id: id of the action the service cancelled
+        :param received: time.monotonic() at which the cancel arrived
+        :return: True when it was the running action and is now cancelled
+        :rtype: bool
+        """
+        try:
+            action_id = int(action_id)
+        except (TypeError, ValueError):
+            return False
+        with self._claim_lock:
+            if not self.running_action_id or action_id != self.running_action_id:
+                return False
+            self._running_action_cancelled = True
+            self._note_cancel(action_id, 'fast', received)
+        logger.debug('action %s cancelled on receipt' % action_id)
+        return True
+
+    def _note_cancel(self, action_id: int, path: str, received: float = None) -> None:
+        """Record when a cancel of the running action took effect; the first
+        record of an action wins. Called holding _claim_lock, as the receive
+        thread and the dispatch thread both record cancels."""
+        if action_id in self.cancel_timings:
+            return
+        now = time.monotonic()
+        received = now if received is None else received
+        self.cancel_timings[action_id] = {'path': path, 'received': received, 'flagged': now,
+                                          'flag_latency': now - received,
+                                          'terminal': None, 'terminal_latency': None}
+        while len(self.cancel_timings) > _CANCEL_HISTORY:
+            self.cancel_timings.popitem(last=False)
+
+    def _note_terminal(self, action_id) -> None:
+        """Record the terminal event of an action that was cancelled."""
+        try:
+            action_id = int(action_id)
+        except (TypeError, ValueError):
+            return
+        with self._claim_lock:
+            timing = self.cancel_timings.get(action_id)
+            if timing is None or timing['terminal'] is not None:
+                return
+            timing['terminal'] = time.monotonic()
+            timing['terminal_latency'] = timing['terminal'] - timing['received']
+            timing = dict(timing)
+        logger.info('action %s: cancel took effect in %.1f ms (%s), terminal event %.1f ms '
+                    'after it arrived' % (action_id, timing['flag_latency'] * 1000, timing['path'],
+                                          timing['terminal_latency'] * 1000))
+
     @staticmethod
     def _image_settings(msg: dict) -> dict:
         """
@@ -145,7 +228,7 @@ class BaseMachine:
         send_wss_event(self._q_msg_tx, msg['id'], 'head_image:starting')
         self._action_settings = self._image_settings(msg)
         self._head_image(msg, self._action_settings or None)
-        send_wss_event(self._q_msg_tx, msg['id'], 'head_image:completed')
+        self._send_terminal(msg['id'], 'head_image:completed')
 
     def _head_image(self, msg: dict, settings: dict = None) -> None:
         """
@@ -202,7 +285,7 @@ class BaseMachine:
         send_wss_event(self._q_msg_tx, msg['id'], 'lid_image:starting')
         self._action_settings = self._image_settings(msg)
         self._lid_image(msg, self._action_settings or None)
-        send_wss_event(self._q_msg_tx, msg['id'], 'lid_image:completed')
+        self._send_terminal(msg['id'], 'lid_image:completed')
 
     @staticmethod
     def lamp_level(settings: dict = None) -> int:
@@ -253,7 +336,7 @@ class BaseMachine:
         send_wss_event(self._q_msg_tx, msg['id'], 'lidar_image:starting')
         self._action_settings = self._image_settings(msg)
         self._head_image(msg, self._action_settings or None)
-        send_wss_event(self._q_msg_tx, msg['id'], 'lidar_image:completed')
+        self._send_terminal(msg['id'], 'lidar_image:completed')
 
     def user_image(self, msg: dict) -> None:
         """
@@ -266,7 +349,7 @@ class BaseMachine:
         send_wss_event(self._q_msg_tx, msg['id'], 'user_image:starting')
         self._action_settings = self._image_settings(msg)
         self._user_image(msg, self._action_settings or None)
-        send_wss_event(self._q_msg_tx, msg['id'], 'user_image:completed')
+        self._send_terminal(msg['id'], 'user_image:completed')
 
     def _user_image(self, msg: dict, settings: dict = None) -> None:
         """
@@ -376,7 +459,13 @@ class BaseMachine:
         """
         event = 'cancelled' if self._running_action_cancelled else 'completed'
         logger.info('%s [%s]: finished with event ":%s"' % (action_type, action_id, event))
-        send_wss_event(self._q_msg_tx, action_id, '%s:%s' % (action_type, event))
+        self._send_terminal(action_id, '%s:%s' % (action_type, event))
+
+    def _send_terminal(self, action_id, event: str) -> None:
+        """Queue an action's terminal event, and time it against a cancel of
+        the action, if there was one."""
+        send_wss_event(self._q_msg_tx, action_id, event)
+        self._note_terminal(action_id)
 
     def _motion(self, msg: dict) -> None:
         """
@@ -391,32 +480,61 @@ class BaseMachine:
 
     def _start_action(self, msg: dict) -> None:
         """
-        Start the accepted action's thread. The previous thread can still be
-        in its final instants after releasing its claim; wait it out rather
-        than dropping an accepted action on the floor - a dropped action has
-        no thread and no terminal event, and its claim would reject every
-        action after it forever.
+        Hand the accepted action to the action worker. The dispatch thread
+        never waits here: the previous action may still be in its final
+        instants after releasing its claim, and the worker takes this one
+        as soon as it is done with that.
         :param msg: Incoming WSS Message
         :type msg: dict
         :return:
         """
-        if self._action_thread.is_alive():
-            self._action_thread.join(timeout=5)
-        if self._action_thread.is_alive():
-            logger.error('previous action thread did not exit; failing %s'
-                         % msg.get('action_type'))
-            send_wss_event(self._q_msg_tx, msg.get('id'),
-                           '%s:failed' % msg.get('action_type'))
-            self.running_action_id = None
-            self.running_action_type = None
-            return
-        self._action_thread = _ActionThread(self, msg)
-        self._action_thread.start()
+        worker = self._action_worker
+        if worker is None or not worker.is_alive():
+            worker = self._action_worker = _ActionWorker(self)
+            worker.start()
+        worker.hand_off(msg)
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """
+        Wait for every action handed to the worker to finish, its claim
+        released.
+        :param timeout: seconds to wait at most; forever when None
+        :type timeout: float
+        :return: whether the machine is idle
+        :rtype: bool
+        """
+        worker = self._action_worker
+        return worker is None or worker.idle.wait(timeout)
+
+    def _note_action(self, msg: dict, queued: float, started: float, finished: float) -> None:
+        """Record how long an action waited for the worker and how long it ran."""
+        timing = {'action_id': msg.get('id'), 'action_type': msg.get('action_type'),
+                  'wait': started - queued, 'run': finished - started}
+        self.action_timings.append(timing)
+        logger.debug('action %s (%s): waited %.1f ms, ran %.1f ms'
+                     % (timing['action_id'], timing['action_type'], timing['wait'] * 1000,
+                        timing['run'] * 1000))
+
+    def action_stats(self) -> dict:
+        """
+        Queue wait and run time per action type, over the actions in
+        ``action_timings``.
+        :return: action_type -> {'count', 'wait': {'mean', 'max'},
+            'run': {'mean', 'max'}}, in seconds
+        :rtype: dict
+        """
+        by_type = {}
+        for timing in list(self.action_timings):
+            by_type.setdefault(timing['action_type'], []).append(timing)
+        return {action_type: {'count': len(timings),
+                              'wait': _mean_max([t['wait'] for t in timings]),
+                              'run': _mean_max([t['run'] for t in timings])}
+                for action_type, timings in by_type.items()}
 
     def run_capture(self, msg: dict) -> None:
         """
         Process capture request.
-        Fires up CaptureThread thread to handle image request.
+        Hands the image request to the action worker.
         Interface for GFUI Service
         :param msg: Incoming WSS Message
         :type msg: dict
@@ -428,7 +546,7 @@ class BaseMachine:
     def run_puls(self, msg: dict) -> None:
         """
         Process pulse file.
-        Fires up MotionThread thread to handle puls file request.
+        Hands the puls file request to the action worker.
         Interface for GFUI Service
         :param msg: Incoming WSS Message
         :type msg: dict
@@ -451,8 +569,7 @@ class BaseMachine:
             # took - inside the accepted branch only: a rejected request
             # (e.g. settings during a print) must not wipe the RUNNING
             # action's id, or a later cancel of that action is dropped.
-            self.running_action_id = None
-            self.running_action_type = None
+            self._release_action()
 
     def _shutdown(self) -> None:
         """
@@ -484,65 +601,110 @@ class BaseMachine:
         """
         logger.debug('stopping')
         self._shutdown()
+        # The next session's actions go to a worker of their own; an action
+        # still running finishes on this one.
+        worker, self._action_worker = self._action_worker, None
+        if worker is not None:
+            worker.retire()
         logger.debug('stopped')
 
 
-class _ActionThread(Thread):
+class _ActionWorker(Thread):
     """
-    ActionThread
-    Responds to incoming WSS events to run an action
+    ActionWorker
+    Runs a machine's actions, one at a time, as the dispatch hands them
+    over. One thread for the machine's session rather than one per action:
+    homing alone is a dozen actions in a few seconds.
     """
-    def __init__(self, machine: BaseMachine, msg: dict):
+    def __init__(self, machine: BaseMachine):
         """
-        Initialize ActionThread Dispatcher
+        Initialize ActionWorker
         :param machine: Machine object
         :type machine: BaseMachine
-        :param msg: Incoming WSS Message
-        :type msg: dict
         """
         self._machine = machine
-        self._msg = msg
+        self._q = Queue()
+        self._pending = 0
+        self._lock = Lock()
+        # Set while no action is queued or running.
+        self.idle = Event()
+        self.idle.set()
         # daemon: a blocked action (e.g. waiting on the button) must not
         # keep the process alive after the service loop exits. Safe hardware
         # state does not depend on this thread finishing - it is enforced by
         # _action_cleanup and, on process exit, the kernel dead man's switch.
-        Thread.__init__(self, daemon=True)
+        Thread.__init__(self, daemon=True, name='action-worker')
+        # Actions run in the configuration scope of the thread that started
+        # the worker: the dispatch loop's, a fleet machine's if it is one.
+        self.run = scoped(self.run)
+
+    def hand_off(self, msg: dict) -> None:
+        """Queue an accepted action; returns at once."""
+        with self._lock:
+            self._pending += 1
+            self.idle.clear()
+        self._q.put((msg, time.monotonic()))
+
+    def retire(self) -> None:
+        """Exit once the actions queued so far are done."""
+        self._q.put(None)
 
     def run(self) -> None:
-        logger.debug('action thread start')
+        logger.debug('action worker start')
+        while True:
+            item = self._q.get()
+            if item is None:
+                break
+            msg, queued = item
+            try:
+                self._run_action(msg, queued)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    if not self._pending:
+                        self.idle.set()
+        logger.debug('action worker stop')
+
+    def _run_action(self, msg: dict, queued: float) -> None:
+        machine = self._machine
+        started = time.monotonic()
         try:
-            if self._msg['action_type'] == 'lid_image':
-                self._machine.lid_image(self._msg)
-            elif self._msg['action_type'] == 'head_image':
-                self._machine.head_image(self._msg)
-            elif self._msg['action_type'] == 'lidar_image':
-                self._machine.lidar_image(self._msg)
-            elif self._msg['action_type'] == 'user_image':
-                self._machine.user_image(self._msg)
-            elif self._msg['action_type'] == 'hunt':
-                self._machine.hunt(self._msg)
-            elif self._msg['action_type'] in ['motion', 'print']:
-                self._machine.motion(self._msg)
+            if msg['action_type'] == 'lid_image':
+                machine.lid_image(msg)
+            elif msg['action_type'] == 'head_image':
+                machine.head_image(msg)
+            elif msg['action_type'] == 'lidar_image':
+                machine.lidar_image(msg)
+            elif msg['action_type'] == 'user_image':
+                machine.user_image(msg)
+            elif msg['action_type'] == 'hunt':
+                machine.hunt(msg)
+            elif msg['action_type'] in ['motion', 'print']:
+                machine.motion(msg)
         except Exception:
             # A crashed action must not leave the job armed: without this,
             # an exception mid-print would leave the action registered as
             # running and the laser latch unlocked.
-            logger.exception('action %s crashed' % self._msg.get('action_type'))
+            logger.exception('action %s crashed' % msg.get('action_type'))
             # The service is waiting on this action: a terminal event lets
             # it resolve instead of hanging on it forever.
             try:
-                send_wss_event(self._machine._q_msg_tx, self._msg.get('id'),
-                               '%s:failed' % self._msg.get('action_type'))
+                machine._send_terminal(msg.get('id'), '%s:failed' % msg.get('action_type'))
             except Exception:
                 logger.exception('could not report the action failure')
         finally:
+            machine._note_action(msg, queued, started, time.monotonic())
             try:
-                self._machine._action_cleanup()
+                machine._action_cleanup()
             except Exception:
                 logger.exception('action cleanup failed')
-            self._machine.running_action_id = None
-            self._machine.running_action_type = None
-            logger.debug('action thread stop')
+            machine._release_action()
+
+
+def _mean_max(values: list) -> dict:
+    if not values:
+        return {'mean': None, 'max': None}
+    return {'mean': sum(values) / len(values), 'max': max(values)}
 
 
 __all__ = ['BaseMachine']
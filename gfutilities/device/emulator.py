@@ -5,14 +5,15 @@ https://community.openglow.org
 
 SPDX-License-Identifier:    MIT
 """
+from functools import partial
 import json
 import logging
-import os
 import time
 
 from gfutilities._common import *
 from gfutilities.configuration import get_cfg, set_cfg
 from gfutilities.device.basemachine import BaseMachine
+from gfutilities.device.imagebank import ImageBank, image_bank
 from gfutilities.service.websocket import load_motion, img_upload, send_wss_event
 
 logger = logging.getLogger(LOGGER_NAME)
@@ -47,36 +48,42 @@ class Emulator(BaseMachine):
         # Used to track the action just before a lid_image request. This is used to detect homing operations after
         # the initial start up (after a print job, for instance)
         self._last_action = None
+        # Read the canned images now, not on the first capture.
+        if get_cfg('EMULATOR.IMAGE_SRC_DIR'):
+            self._images()
 
     def _button_wait(self, msg: dict) -> None:
         pass
 
     def _head_image(self, msg: dict, settings: dict = None) -> None:
+        self._capture_and_upload(msg, partial(self._capture_head, msg, settings))
+
+    def _capture_head(self, msg: dict, settings: dict = None) -> bytes:
         # HCil (head illumination) may be absent from a settings dict, so
         # guard the comparison - a missing key must not raise.
         hcil = (settings or {}).get('HCil')
-        if hcil and hcil > 0:
-            img = 'HEAD_LASER_%s.jpg' % get_cfg('EMULATOR.MATERIAL_THICKNESS')
-        else:
-            img = 'HEAD_NO_LASER_%s.jpg' % get_cfg('EMULATOR.MATERIAL_THICKNESS')
-        self._capture_and_upload(msg, img)
         self._last_action = 'head_image'
+        return self._images().head(bool(hcil and hcil > 0), get_cfg('EMULATOR.MATERIAL_THICKNESS'))
+
+    @staticmethod
+    def _images() -> ImageBank:
+        """The canned images of EMULATOR.IMAGE_SRC_DIR, shared by every
+        emulator capturing from it."""
+        return image_bank(get_cfg('EMULATOR.IMAGE_SRC_DIR'))
 
-    def _capture_and_upload(self, msg: dict, img: str) -> None:
+    def _capture_and_upload(self, msg: dict, capture) -> None:
         """
-        Read the canned image (the "capture") and upload it, emitting the
+        Take the canned image (the "capture") and upload it, emitting the
         capture/upload progress events the v2.6.0 service expects during the
         homing handshake. The service waits for '<action>:upload:completed'
         (the image is now in storage) before fetching and analyzing it.
         :param msg: Incoming WSS message
         :type msg: dict
-        :param img: Image filename within EMULATOR.IMAGE_SRC_DIR
-        :type img: str
+        :param capture: returns the image, taking no arguments
         """
         action = msg['action_type']
         send_wss_event(self._q_msg_tx, msg['id'], '%s:capture:starting' % action)
-        with open('%s/%s' % (get_cfg('EMULATOR.IMAGE_SRC_DIR'), img), 'rb') as f:
-            data = f.read()
+        data = capture()
         send_wss_event(self._q_msg_tx, msg['id'], '%s:capture:completed' % action)
         send_wss_event(self._q_msg_tx, msg['id'], '%s:upload:starting' % action)
         ok = img_upload(self._session, data, msg)
@@ -96,13 +103,11 @@ class Emulator(BaseMachine):
             self._homing_stage = 1
         if self._homing_stage != 0:
             logger.info('HOME Step %s' % self._homing_stage)
-            img = 'HOME_%s.jpg' % self._homing_stage
+            capture = partial(self._images().home, self._homing_stage)
             self._homing_stage = self._homing_stage + 1 if self._homing_stage < 4 else 0
         else:
-            img = 'LID_IMAGE.jpg'
-            if not os.path.isfile('%s/%s' % (get_cfg('EMULATOR.IMAGE_SRC_DIR'), img)):
-                img = 'HOME_4.jpg'
-        self._capture_and_upload(msg, img)
+            capture = self._images().lid
+        self._capture_and_upload(msg, capture)
         self._last_action = 'lid_image'
 
     def _motion(self, msg: dict) -> None:
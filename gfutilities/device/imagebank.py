@@ -0,0 +1,172 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import logging
+import os
+import re
+from threading import Lock
+import time
+
+from gfutilities._common import *
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Seconds between looks at the directory for images added, replaced or
+# removed. A look is one directory listing; the files are read only when
+# they change.
+RELOAD_INTERVAL = 1.0
+
+# The images an emulator captures, by file name.
+_HOME = re.compile(r'^HOME_(\d+)\.jpg$')
+_HEAD = re.compile(r'^HEAD_(LASER|NO_LASER)_(.+)\.jpg$')
+LID_IMAGE = 'LID_IMAGE.jpg'
+
+# What counts as an image in the directory.
+_EXTENSIONS = ('.jpg', '.jpeg')
+
+
+class ImageBank:
+    """
+    An emulator's canned images, held in memory
+    Every image in the directory is read once, and handed out as the same
+    bytes object to every capture that asks for it - by every emulator of
+    the process, through image_bank() - so a homing loop or a fleet costs
+    no file reads and no copies. The directory is looked at again at most
+    every ``reload_interval`` seconds, on the next capture, and only the
+    images added or changed since are read.
+
+    Images are found by role: ``home(stage)`` is HOME_<stage>.jpg, the head
+    camera's shot of a homing stage; ``head(laser, thickness)`` is
+    HEAD_LASER_<thickness>.jpg or HEAD_NO_LASER_<thickness>.jpg; ``lid()``
+    is LID_IMAGE.jpg, or HOME_4.jpg, the bed after homing, without one.
+    """
+    def __init__(self, directory: str, reload_interval: float = RELOAD_INTERVAL):
+        """
+        Class Initializer
+        :param directory: the images' directory
+        :type directory: str
+        :param reload_interval: seconds between looks at the directory for
+            changes; 0 to look on every capture
+        :type reload_interval: float
+        """
+        self.directory = str(directory)
+        self.reload_interval = reload_interval
+        self.loads = 0
+        self._images = {}
+        self._seen = {}
+        self._homes = {}
+        self._heads = {}
+        self._lock = Lock()
+        self._checked = None
+        self.reload()
+
+    def reload(self) -> bool:
+        """
+        Read the images added or changed since the last look, and forget
+        those removed.
+        :return: whether anything changed
+        :rtype: bool
+        """
+        seen = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith(_EXTENSIONS):
+                        stat = entry.stat()
+                        seen[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            logger.warning('image directory %s: %s' % (self.directory, e))
+        with self._lock:
+            self._checked = time.monotonic()
+            if seen == self._seen:
+                return False
+            images = {name: data for name, data in self._images.items()
+                      if name in seen and seen[name] == self._seen.get(name)}
+            for name in seen:
+                if name not in images:
+                    try:
+                        with open(os.path.join(self.directory, name), 'rb') as f:
+                            images[name] = f.read()
+                        self.loads += 1
+                    except OSError as e:
+                        # Being written as we look: the next look reads it.
+                        logger.warning('could not read image %s: %s' % (name, e))
+                        seen.pop(name)
+            self._images, self._seen = images, seen
+            self._homes, self._heads = {}, {}
+            for name in images:
+                match = _HOME.match(name)
+                if match:
+                    self._homes[int(match.group(1))] = name
+                match = _HEAD.match(name)
+                if match:
+                    self._heads[(match.group(1) == 'LASER', match.group(2))] = name
+        logger.info('image bank %s: %d images' % (self.directory, len(images)))
+        return True
+
+    def _fresh(self) -> None:
+        if time.monotonic() - self._checked >= self.reload_interval:
+            self.reload()
+
+    def get(self, name: str) -> bytes:
+        """
+        An image, by file name.
+        :param name: file name within the directory
+        :type name: str
+        :return: the image
+        :rtype: bytes
+        """
+        self._fresh()
+        image = self._images.get(name)
+        if image is None:
+            raise FileNotFoundError('no image %s in %s' % (name, self.directory))
+        return image
+
+    def __contains__(self, name: str) -> bool:
+        self._fresh()
+        return name in self._images
+
+    def home(self, stage: int) -> bytes:
+        """The head camera's image at a homing stage, HOME_<stage>.jpg."""
+        self._fresh()
+        return self.get(self._homes.get(int(stage), 'HOME_%s.jpg' % stage))
+
+    def head(self, laser: bool, thickness) -> bytes:
+        """A head camera image, with the measuring laser on or off, of
+        material of the given thickness (as it is written in the name)."""
+        self._fresh()
+        key = (bool(laser), str(thickness))
+        return self.get(self._heads.get(key, 'HEAD_%s_%s.jpg' % ('LASER' if laser else 'NO_LASER', thickness)))
+
+    def lid(self) -> bytes:
+        """The lid camera's image of the bed: LID_IMAGE.jpg if there is one,
+        else the bed as homing left it."""
+        return self.get(LID_IMAGE) if LID_IMAGE in self else self.home(4)
+
+
+_banks = {}
+_banks_lock = Lock()
+
+
+def image_bank(directory: str) -> ImageBank:
+    """
+    The process-wide ImageBank of a directory, loaded on first use, so
+    every emulator capturing from it shares its images.
+    :param directory: the images' directory
+    :type directory: str
+    :return: the shared bank
+    :rtype: ImageBank
+    """
+    key = os.path.abspath(str(directory))
+    with _banks_lock:
+        bank = _banks.get(key)
+        if bank is None:
+            bank = _banks[key] = ImageBank(key)
+        return bank
+
+
+__all__ = ['ImageBank', 'LID_IMAGE', 'RELOAD_INTERVAL', 'image_bank']
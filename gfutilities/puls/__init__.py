@@ -5,6 +5,10 @@ https://community.openglow.org
 
 SPDX-License-Identifier:    MIT
 """
-from gfutilities.puls.pulsedata import decode_all_steps, generate_linear_puls
+from gfutilities.puls.pulsedata import StepStatsAccumulator, decode_all_steps, generate_linear_puls
+from gfutilities.puls.trace import PositionTrace, trace_source
+from gfutilities.puls.laser import LaserPowerAccumulator
+from gfutilities.puls.planner import MotionSegment, plan_motion, write_motion
 
-__all__ = ['decode_all_steps', 'generate_linear_puls']
+__all__ = ['LaserPowerAccumulator', 'MotionSegment', 'PositionTrace', 'StepStatsAccumulator', 'decode_all_steps',
+           'generate_linear_puls', 'plan_motion', 'trace_source', 'write_motion']
@@ -0,0 +1,132 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import re
+
+from gfutilities.puls import pulsedata
+from gfutilities.puls.pulsedata import _decode_step_codes
+
+# A power byte carries the level in its low seven bits; 127 is full power.
+_POWER_FLAG = _decode_step_codes['LP']['mask']
+_POWER_LEVELS = 128
+_FULL_POWER = _POWER_LEVELS - 1
+
+# Every byte value that is not a laser-on step, for bytes.translate() to
+# delete: what survives is the count of ticks the laser fired.
+_NOT_LASER_ON = bytes(v for v in range(256)
+                      if v & _POWER_FLAG
+                      or (v & _decode_step_codes['LE']['mask']) != _decode_step_codes['LE']['test'])
+
+_POWER_BYTE = re.compile(b'[\x80-\xff]')
+
+
+class LaserPowerAccumulator:
+    """Laser-on time per power level for a job decoded chunk by chunk.
+
+    A power byte sets the level every laser-on step after it fires at, until
+    the next one, and that can be chunks later: the level in force is carried
+    from one ``update()`` to the next, and a job that fires before setting
+    any level fires at ``initial_power``. What is kept is one 128-bin count
+    of laser-on ticks per level; ``result()`` turns it into seconds at the
+    job's step frequency and into energy.
+
+    Energy is reported as full-power seconds (each tick weighted by its level
+    over 127), and in joules as well when ``tube_watts`` is known.
+    ``vectorized`` picks the engine as StepStatsAccumulator does.
+    """
+
+    def __init__(self, initial_power: int = 0, tube_watts: float = None,
+                 vectorized: bool = None):
+        if vectorized is None:
+            vectorized = pulsedata.np is not None
+        elif vectorized and pulsedata.np is None:
+            raise ValueError('the vectorized engine needs numpy')
+        if not 0 <= initial_power <= _FULL_POWER:
+            raise ValueError('power levels run 0..%d' % _FULL_POWER)
+        self.vectorized = vectorized
+        self.tube_watts = tube_watts
+        self.power = initial_power
+        self.ticks = 0
+        self.power_changes = 0
+        if vectorized:
+            self._hist = pulsedata.np.zeros(_POWER_LEVELS, dtype=pulsedata.np.int64)
+        else:
+            self._hist = [0] * _POWER_LEVELS
+
+    def update(self, puls: bytes) -> None:
+        """Add a run of pulse bytes to the job."""
+        if self.vectorized:
+            self._count_numpy(puls)
+        else:
+            self._count_python(bytes(puls))
+        self.ticks += len(puls)
+
+    def _count_numpy(self, puls: bytes) -> None:
+        np = pulsedata.np
+        values = np.frombuffer(puls, dtype=np.uint8)
+        if not len(values):
+            return
+        power_byte = values >= _POWER_FLAG
+        fired = (values & (_POWER_FLAG | _decode_step_codes['LE']['mask'])) \
+            == _decode_step_codes['LE']['test']
+        changes = int(np.count_nonzero(power_byte))
+        if not changes:
+            self._hist[self.power] += np.count_nonzero(fired)
+            return
+        # Forward-fill the level: the index of the last power byte at or
+        # before every tick, -1 ahead of the chunk's first.
+        last = np.maximum.accumulate(np.where(power_byte, np.arange(len(values)), -1))
+        level = np.where(last >= 0, values[np.maximum(last, 0)] & _FULL_POWER, self.power)
+        self._hist += np.bincount(level[fired], minlength=_POWER_LEVELS)
+        self.power = int(values[last[-1]] & _FULL_POWER)
+        self.power_changes += changes
+
+    def _count_python(self, puls: bytes) -> None:
+        # One translate() per run between power bytes: a run costs C time
+        # whatever its length, though a raster that changes level every few
+        # ticks is close to a byte at a time, which is what NumPy is for.
+        start = 0
+        for match in _POWER_BYTE.finditer(puls):
+            self._hist[self.power] += len(puls[start:match.start()].translate(None, _NOT_LASER_ON))
+            self.power = puls[match.start()] & _FULL_POWER
+            self.power_changes += 1
+            start = match.end()
+        self._hist[self.power] += len(puls[start:].translate(None, _NOT_LASER_ON))
+
+    def result(self, stfr: int = None) -> dict:
+        """Laser-on ticks per level so far, and the time and energy they come to.
+
+        :param stfr: the job's step frequency (header ``STfr``), ticks per
+            second; without it only tick counts are reported
+        :return: ``ticks`` and ``on_ticks`` totals, ``levels`` (power level to
+            laser-on ticks, levels that never fired left out),
+            ``power_changes``, and with ``stfr`` the ``seconds`` the job runs,
+            ``on_seconds``, ``duty`` and the ``energy`` in full-power seconds,
+            plus ``joules`` when the tube's wattage is known
+        :rtype: dict
+        """
+        hist = self._hist.tolist() if self.vectorized else list(self._hist)
+        levels = {level: ticks for level, ticks in enumerate(hist) if ticks}
+        on_ticks = sum(levels.values())
+        out = {
+            'ticks': self.ticks,
+            'on_ticks': on_ticks,
+            'levels': levels,
+            'power_changes': self.power_changes,
+        }
+        if stfr:
+            weighted = sum(level * ticks for level, ticks in levels.items())
+            out['seconds'] = self.ticks / stfr
+            out['on_seconds'] = on_ticks / stfr
+            out['duty'] = on_ticks / self.ticks if self.ticks else 0.0
+            out['energy'] = weighted / _FULL_POWER / stfr
+            if self.tube_watts:
+                out['joules'] = out['energy'] * self.tube_watts
+        return out
+
+
+__all__ = ['LaserPowerAccumulator']
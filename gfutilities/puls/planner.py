@@ -0,0 +1,270 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+from contextlib import nullcontext
+from math import ceil, sqrt
+import struct
+from typing import NamedTuple
+import zlib
+
+from gfutilities.puls import pulsedata
+from gfutilities.puls.pulsedata import _decode_step_codes
+
+# The step frequency every job captured from the service runs at.
+DEFAULT_STFR = 10000
+
+# Planner defaults, in steps along the path: at the service's usual 8x XY
+# microstepping a step is 0.01875 mm, so these are 150 mm/s and 3750 mm/s^2.
+DEFAULT_MAX_SPEED = 8000
+DEFAULT_ACCEL = 200000
+
+# Bytes of payload assembled before they are handed on (compressed or not).
+_FLUSH_BYTES = 1024 * 1024
+
+_LASER_ON = _decode_step_codes['LE']['test']
+_POWER_FLAG = _decode_step_codes['LP']['mask']
+_X_BYTES = (_decode_step_codes['XP']['test'], _decode_step_codes['XN']['test'])
+_Y_BYTES = (_decode_step_codes['YP']['test'], _decode_step_codes['YN']['test'])
+
+
+class MotionSegment(NamedTuple):
+    """One straight move: the XY point it ends at, in steps, and the laser
+    power (0-127) it cuts at. Power 0 is a travel move, laser off."""
+    x: int
+    y: int
+    power: int = 0
+
+
+class PlannedSegment(NamedTuple):
+    """A segment with its trapezoidal profile: speeds in steps per second
+    along the path, ``length`` in steps along the path."""
+    dx: int
+    dy: int
+    power: int
+    length: float
+    entry: float
+    cruise: float
+    exit: float
+
+
+def plan_motion(segments, start: tuple = (0, 0), max_speed: float = DEFAULT_MAX_SPEED,
+                accel: float = DEFAULT_ACCEL, junction_deviation: float = 2.0) -> list:
+    """Give every segment of a path a trapezoidal velocity profile.
+
+    Each segment accelerates from its entry speed towards ``max_speed`` and
+    brakes to its exit speed, at ``accel``. The speed carried through a
+    corner is the most it can be without the head deviating more than
+    ``junction_deviation`` steps from the corner, the usual centripetal
+    approximation, and is then cut to what the segments on either side can
+    actually reach or stop from: a backward pass so every segment can brake
+    for what follows, a forward pass so it can reach what it is given. The
+    path starts and ends at rest.
+
+    :param segments: MotionSegment, or (x, y[, power]) tuples, so a plain
+        polyline of points is a path of travel moves
+    :param start: XY point the path starts from, in steps
+    :param max_speed: cruise speed, steps per second along the path
+    :param accel: acceleration, steps per second per second
+    :param junction_deviation: cornering tolerance, steps
+    :return: one PlannedSegment per segment that moves
+    :rtype: list
+    """
+    if max_speed <= 0 or accel <= 0:
+        raise ValueError('max_speed and accel must be positive')
+    moves = []
+    x, y = start
+    for seg in segments:
+        seg = MotionSegment(*seg)
+        if not 0 <= seg.power <= 127:
+            raise ValueError('laser power runs 0..127, not %r' % (seg.power,))
+        dx, dy = int(seg.x) - x, int(seg.y) - y
+        x, y = int(seg.x), int(seg.y)
+        if dx or dy:
+            moves.append((dx, dy, seg.power, sqrt(dx * dx + dy * dy)))
+
+    # The most each junction could carry, from the angle alone.
+    entry = [0.0] * (len(moves) + 1)
+    for i in range(1, len(moves)):
+        (ax, ay, _, al), (bx, by, _, bl) = moves[i - 1], moves[i]
+        cos_theta = -(ax * bx + ay * by) / (al * bl)
+        if cos_theta < -0.999999:
+            entry[i] = max_speed            # straight on
+        elif cos_theta > 0.999999:
+            entry[i] = 0.0                  # a full reversal stops
+        else:
+            sin_half = sqrt(0.5 * (1.0 - cos_theta))
+            entry[i] = min(max_speed, sqrt(accel * junction_deviation * sin_half / (1.0 - sin_half)))
+
+    for i in range(len(moves) - 1, -1, -1):
+        entry[i] = min(entry[i], sqrt(entry[i + 1] ** 2 + 2 * accel * moves[i][3]))
+    for i in range(len(moves)):
+        entry[i + 1] = min(entry[i + 1], sqrt(entry[i] ** 2 + 2 * accel * moves[i][3]))
+
+    planned = []
+    for i, (dx, dy, power, length) in enumerate(moves):
+        v_in, v_out = entry[i], entry[i + 1]
+        # Peak where accelerating and braking meet, if the segment is too
+        # short to reach cruise.
+        peak = sqrt((2 * accel * length + v_in ** 2 + v_out ** 2) / 2)
+        planned.append(PlannedSegment(dx, dy, power, length, v_in, min(max_speed, peak), v_out))
+    return planned
+
+
+def _segment_times(seg: PlannedSegment, accel: float, steps: int) -> list:
+    """Seconds into the segment at which each of its ``steps`` major-axis
+    steps falls, the k-th at k/steps of the way along."""
+    v_in, v_c, v_out, length = seg.entry, seg.cruise, seg.exit, seg.length
+    d_acc = (v_c ** 2 - v_in ** 2) / (2 * accel)
+    d_dec = (v_c ** 2 - v_out ** 2) / (2 * accel)
+    cruise_end = length - d_dec
+    t_acc = (v_c - v_in) / accel
+    t_dec_start = t_acc + ((cruise_end - d_acc) / v_c if v_c else 0.0)
+    times = []
+    for k in range(1, steps + 1):
+        s = length * k / steps
+        if s <= d_acc:
+            t = (sqrt(v_in ** 2 + 2 * accel * s) - v_in) / accel
+        elif s <= cruise_end:
+            t = t_acc + (s - d_acc) / v_c
+        else:
+            t = t_dec_start + (v_c - sqrt(max(v_c ** 2 - 2 * accel * (s - cruise_end), 0.0))) / accel
+        times.append(t)
+    return times
+
+
+def _segment_axes(seg: PlannedSegment) -> tuple:
+    """(major steps, minor steps, major step byte, minor step byte)."""
+    x_byte = _X_BYTES[seg.dx < 0]
+    y_byte = _Y_BYTES[seg.dy < 0]
+    if abs(seg.dx) >= abs(seg.dy):
+        return abs(seg.dx), abs(seg.dy), x_byte, y_byte
+    return abs(seg.dy), abs(seg.dx), y_byte, x_byte
+
+
+def _segment_ticks_python(seg: PlannedSegment, accel: float, stfr: int, power_byte: bool) -> bytearray:
+    """The pulse bytes of one planned segment."""
+    major, minor, maj_byte, min_byte = _segment_axes(seg)
+    ticks = []
+    last = -1
+    for t in _segment_times(seg, accel, major):
+        # Never two steps in one tick, whatever the rounding.
+        last = max(int(ceil(t * stfr - 1e-9)), last + 1)
+        ticks.append(last)
+
+    fill = _LASER_ON if seg.power else 0
+    lead = 1 if power_byte else 0
+    out = bytearray([fill]) * (lead + last + 1)
+    if power_byte:
+        out[0] = _POWER_FLAG | seg.power
+    for k, tick in enumerate(ticks, 1):
+        # Integer Bresenham: the minor axis steps wherever its share of the
+        # move crosses a whole step.
+        step = maj_byte | (min_byte if (k * minor) // major != ((k - 1) * minor) // major else 0)
+        out[lead + tick] = step | fill
+    return out
+
+
+def _segment_ticks_numpy(seg: PlannedSegment, accel: float, stfr: int, power_byte: bool) -> bytearray:
+    """_segment_ticks_python as array arithmetic, byte for byte the same."""
+    np = pulsedata.np
+    major, minor, maj_byte, min_byte = _segment_axes(seg)
+    v_in, v_c, v_out, length = seg.entry, seg.cruise, seg.exit, seg.length
+    d_acc = (v_c ** 2 - v_in ** 2) / (2 * accel)
+    d_dec = (v_c ** 2 - v_out ** 2) / (2 * accel)
+    cruise_end = length - d_dec
+    t_acc = (v_c - v_in) / accel
+    t_dec_start = t_acc + ((cruise_end - d_acc) / v_c if v_c else 0.0)
+
+    k = np.arange(1, major + 1, dtype=np.int64)
+    s = length * k / major
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(s <= d_acc, (np.sqrt(v_in ** 2 + 2 * accel * s) - v_in) / accel,
+                     np.where(s <= cruise_end, t_acc + (s - d_acc) / v_c,
+                              t_dec_start + (v_c - np.sqrt(np.maximum(
+                                  v_c ** 2 - 2 * accel * (s - cruise_end), 0.0))) / accel))
+    ticks = np.ceil(t * stfr - 1e-9).astype(np.int64)
+    # Never two steps in one tick: tick[i] = max(tick[i], tick[i-1] + 1) is
+    # a running maximum once the index is taken out.
+    ticks = np.maximum.accumulate(ticks - k) + k
+    ticks = np.maximum(ticks, k - 1)
+
+    fill = _LASER_ON if seg.power else 0
+    lead = 1 if power_byte else 0
+    out = np.full(lead + int(ticks[-1]) + 1, fill, dtype=np.uint8)
+    if power_byte:
+        out[0] = _POWER_FLAG | seg.power
+    ridden = (k * minor) // major != ((k - 1) * minor) // major
+    out[lead + ticks] = np.where(ridden, maj_byte | min_byte, maj_byte) | fill
+    return bytearray(out.tobytes())
+
+
+def write_motion(segments, outfile, stfr: int = DEFAULT_STFR, serial: int = 0,
+                 compress: bool = False, header: dict = None, start: tuple = (0, 0),
+                 vectorized: bool = None, **planner) -> int:
+    """Plan a path and write it out as a complete GF1 pulse file.
+
+    The file is what the service sends: a header carrying ``STfr``,
+    ``PDfm=0`` and ``MCsn`` (0 leaves the job unlocked), then the step
+    stream, gzip-compressed when ``compress`` is set. It is produced a
+    segment at a time and handed on in blocks, so a synthetic job of any
+    length never sits in memory whole, and PulseSource reads it as it would
+    a download.
+
+    :param segments: the path, as for plan_motion
+    :param outfile: path, or an open binary file object (left open)
+    :param stfr: step frequency, ticks per second
+    :param serial: machine serial to lock the job to, 0 for none
+    :param compress: gzip the file the way the service serves it
+    :param header: further 4-character tags to integers for the header
+    :param start: XY point the path starts from, in steps
+    :param vectorized: engine choice, as for StepStatsAccumulator
+    :param planner: max_speed, accel, junction_deviation for plan_motion
+    :return: payload bytes written, header excluded
+    :rtype: int
+    """
+    if vectorized is None:
+        vectorized = pulsedata.np is not None
+    elif vectorized and pulsedata.np is None:
+        raise ValueError('the vectorized engine needs numpy')
+    segment_ticks = _segment_ticks_numpy if vectorized else _segment_ticks_python
+    if stfr <= 0:
+        raise ValueError('STfr must be positive')
+    if planner.get('max_speed', DEFAULT_MAX_SPEED) > stfr:
+        raise ValueError('max_speed past STfr would need two steps in a tick')
+    tags = dict(header or {})
+    tags.update({'MCsn': int(serial), 'STfr': int(stfr), 'PDfm': 0})
+    fields = b''.join(k.encode() + struct.pack('<I', v) for k, v in tags.items())
+    head = b'\x80GF1' + struct.pack('<I', 8 + len(fields)) + fields
+
+    plan = plan_motion(segments, start=start, **planner)
+    accel = planner.get('accel', DEFAULT_ACCEL)
+    packer = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 31) if compress else None
+    size = 0
+    with (nullcontext(outfile) if hasattr(outfile, 'write') else open(outfile, 'wb')) as f:
+        def emit(data) -> None:
+            f.write(packer.compress(data) if packer else data)
+
+        emit(head)
+        pending = bytearray()
+        power = None
+        for seg in plan:
+            power_byte = bool(seg.power) and seg.power != power
+            if power_byte:
+                power = seg.power
+            pending += segment_ticks(seg, accel, stfr, power_byte)
+            if len(pending) >= _FLUSH_BYTES:
+                size += len(pending)
+                emit(pending)
+                pending = bytearray()
+        size += len(pending)
+        emit(pending)
+        if packer:
+            f.write(packer.flush())
+    return size
+
+
+__all__ = ['DEFAULT_STFR', 'MotionSegment', 'PlannedSegment', 'plan_motion', 'write_motion']
@@ -7,6 +7,13 @@ SPDX-License-Identifier:    MIT
 """
 from collections import Counter
 
+try:
+    import numpy as np
+except ImportError:
+    # Optional: without it the same table is walked in Python, which gives
+    # the same answer at a lower rate.
+    np = None
+
 _decode_step_codes = {
     'LE': {'mask': 0b00010000, 'test': 0b00010000},  # Laser Enable (ON)
     'LP': {'mask': 0b10000000, 'test': 0b01111111},  # Laser Power Setting
@@ -22,6 +29,11 @@ _decode_step_codes = {
 
 _SPEED = 1000
 
+# Travel of one full step: the XY belts and the Z lead screw. A job's
+# microstep mode divides these.
+_XY_MM_PER_STEP = 0.15
+_Z_MM_PER_STEP = 0.70612
+
 # The counters decode_all_steps() reports, in report order.
 _COUNT_KEYS = ('XP', 'XN', 'XTOT', 'XEND', 'YP', 'YN', 'YTOT', 'YEND',
                'ZP', 'ZN', 'ZTOT', 'ZEND', 'LE', 'LP')
@@ -61,101 +73,223 @@ def _build_step_deltas() -> tuple:
 _STEP_DELTAS = _build_step_deltas()
 
 
-def decode_all_steps(puls: bytes, data: dict = None, mode: tuple = (8, 2)) -> dict:
-    """Step and laser statistics for a run of pulse bytes.
+def _build_step_matrix():
+    """_STEP_DELTAS as a dense 256 x counter matrix, for the NumPy engine.
 
-    ``data`` accumulates a previous result, so a job can be decoded chunk by
-    chunk as it arrives. ``mode`` is the (XY, Z) microstep divisor the job runs
-    at, which is what turns step counts into millimeters.
+    With it the whole decode is a histogram and one matrix product, both of
+    which run in C: a 256 KB chunk never touches the interpreter per value.
     """
-    totals = [0] * len(_COUNT_KEYS)
+    matrix = np.zeros((256, len(_COUNT_KEYS)), dtype=np.int64)
+    for value, row in enumerate(_STEP_DELTAS):
+        for index, delta in row:
+            matrix[value, index] = delta
+    return matrix
+
+
+_STEP_MATRIX = _build_step_matrix() if np is not None else None
+
+
+def _count_python(hist: list, puls: bytes) -> None:
+    """Add the byte values of ``puls`` to a 256-bin list histogram."""
     for value, count in Counter(puls).items():
-        for index, delta in _STEP_DELTAS[value]:
-            totals[index] += delta * count
+        hist[value] += count
+
+
+def _count_numpy(hist, puls: bytes) -> None:
+    """Add the byte values of ``puls`` to a 256-bin array histogram."""
+    hist += np.bincount(np.frombuffer(puls, dtype=np.uint8), minlength=256)
+
+
+def _totals_python(hist: list) -> list:
+    """Counter totals for a histogram, walking the table row by row."""
+    totals = [0] * len(_COUNT_KEYS)
+    for value, count in enumerate(hist):
+        if count:
+            for index, delta in _STEP_DELTAS[value]:
+                totals[index] += delta * count
+    return totals
+
+
+def _totals_numpy(hist) -> list:
+    """Counter totals for a histogram as one product against _STEP_MATRIX.
+
+    Returned as plain ints, so a result is indistinguishable from the Python
+    engine's, down to being something json can write out.
+    """
+    return (hist @ _STEP_MATRIX).tolist()
+
+
+class StepStatsAccumulator:
+    """Step and laser statistics for a job decoded chunk by chunk.
+
+    Every counter is a function of how often each byte value occurs, so the
+    only state a job needs is one 256-bin histogram: ``update()`` adds a chunk
+    to it and nothing else, and the counters, millimeters and inches are
+    worked out once, when ``result()`` is asked for.
+
+    ``mode`` is the (XY, Z) microstep divisor the job runs at. ``vectorized``
+    picks the engine; by default NumPy is used when it is installed, and the
+    answer is the same either way.
+    """
+
+    def __init__(self, mode: tuple = (8, 2), vectorized: bool = None):
+        if vectorized is None:
+            vectorized = np is not None
+        elif vectorized and np is None:
+            raise ValueError('the vectorized engine needs numpy')
+        self.mode = mode
+        self.vectorized = vectorized
+        self.size = 0
+        if vectorized:
+            self._hist = np.zeros(256, dtype=np.int64)
+            self._count, self._totals = _count_numpy, _totals_numpy
+        else:
+            self._hist = [0] * 256
+            self._count, self._totals = _count_python, _totals_python
+
+    def update(self, puls: bytes) -> None:
+        """Add a run of pulse bytes to the job."""
+        self._count(self._hist, puls)
+        self.size += len(puls)
+
+    def result(self) -> dict:
+        """The statistics for every byte added so far."""
+        cnt = dict(zip(_COUNT_KEYS, self._totals(self._hist)))
+        return _add_distances(cnt, self.mode)
 
-    cnt = dict(zip(_COUNT_KEYS, totals))
 
+def _add_distances(cnt: dict, mode: tuple) -> dict:
+    """Convert the END counters of ``cnt`` to millimeters and inches, in place."""
     for axis in ('X', 'Y'):
-        cnt[axis + 'MM'] = (cnt[axis + 'END'] / mode[0]) * 0.15
-    cnt['ZMM'] = (cnt['ZEND'] / mode[1]) * 0.70612
+        cnt[axis + 'MM'] = (cnt[axis + 'END'] / mode[0]) * _XY_MM_PER_STEP
+    cnt['ZMM'] = (cnt['ZEND'] / mode[1]) * _Z_MM_PER_STEP
 
     for axis in ('X', 'Y', 'Z'):
         cnt[axis + 'IN'] = cnt[axis + 'MM'] / 25.4
+    return cnt
+
+
+def decode_all_steps(puls: bytes, data: dict = None, mode: tuple = (8, 2)) -> dict:
+    """Step and laser statistics for a run of pulse bytes.
 
+    ``data`` accumulates a previous result, so a job can be decoded chunk by
+    chunk as it arrives. ``mode`` is the (XY, Z) microstep divisor the job runs
+    at, which is what turns step counts into millimeters. A whole job is
+    cheaper through StepStatsAccumulator, which keeps no per-chunk dict.
+    """
+    stats = StepStatsAccumulator(mode)
+    stats.update(puls)
+    cnt = stats.result()
     if data is not None:
         for key, val in cnt.items():
             cnt[key] = val + data.get(key, 0)
     return cnt
 
 
+# Bytes handed to write() at a time by generate_linear_puls().
+_GENERATE_WRITE = 1024 * 1024
+
+# The ramp generate_linear_puls() runs: dwell ticks at full and at starting
+# speed, and the change per step.
+_RAMP_FAST = 5
+_RAMP_SLOW = 55
+_RAMP_ACC = 10
+
+
 def generate_linear_puls(x: int, y: int, outfile) -> None:
-    expected_count = abs(x) if abs(x) >= abs(y) else abs(y)
+    """Write a straight XY move of ``x``, ``y`` steps as a headerless pulse stream.
 
-    max_speed = 5
-    min_speed = 55
-    acc = 10
-    acc_dist = int((min_speed - max_speed) / acc)
-    acc_dist = acc_dist if acc_dist < (expected_count / 2) else int(expected_count / 2)
+    Each step byte is followed by its dwell (idle ticks), which ramps from a
+    slow start to full speed and back down at the end. The whole move is laid
+    out in one buffer and written in large blocks: a move is hundreds of
+    thousands of bytes, and a write per byte made it syscall bound.
+    """
+    pattern = _step_pattern(x, y)
+    runs = _dwell_runs(len(pattern), max(abs(x), abs(y)))
 
-    steps = 0
-    d = min_speed
+    out = bytearray(sum(count * (1 + dwell) for count, dwell in runs))
+    pos = 0
+    step = 0
+    for count, dwell in runs:
+        # Dwell bytes are zero already: drop the steps into every stride-th
+        # slot of the run in one slice assignment.
+        stride = 1 + dwell
+        out[pos:pos + count * stride:stride] = pattern[step:step + count]
+        pos += count * stride
+        step += count
 
     # outfile may be a path or an already-open binary file object (the
     # job-held exclusive pulse-device fd; the caller owns and closes it).
     from contextlib import nullcontext
     with (nullcontext(outfile) if hasattr(outfile, 'write') else open(outfile, 'bw')) as f:
-        for xs, ys in _step_gen(x, y):
-            steps += 1
-            s = 0
-            if xs != 0:
-                s |= 0b00000001 if xs > 0 else 0b00000011
-            if ys != 0:
-                s |= 0b00001100 if ys > 0 else 0b00000100
-            f.write(bytes([s]))
-
-            if steps <= acc_dist:
-                # Accelerating
-                d = d - acc if d > max_speed - acc else max_speed
-            elif steps >= (expected_count - acc_dist):
-                # Decelerating
-                d = d + acc if d < min_speed + acc else min_speed
-            f.write('\0'.encode() * d)
-
-
-def _step_gen(x: int, y: int) -> tuple:
-    xd = 1 if x >= 0 else -1
-    yd = 1 if y >= 0 else -1
+        view = memoryview(out)
+        for start in range(0, len(view), _GENERATE_WRITE):
+            f.write(view[start:start + _GENERATE_WRITE])
+
+
+def _dwell_runs(steps: int, expected: int) -> list:
+    """The dwell after every step of a move, as (step count, dwell) runs.
+
+    Only the ramps at either end change from step to step; the cruise in
+    between is one run however long the move is. ``expected`` is the major
+    axis length the ramps are placed against: a move whose minor axis has
+    steps left over runs past it, still ramping down.
+    """
+    acc_dist = int((_RAMP_SLOW - _RAMP_FAST) / _RAMP_ACC)
+    acc_dist = acc_dist if acc_dist < (expected / 2) else int(expected / 2)
+    decel_from = max(expected - acc_dist, acc_dist + 1)
+
+    runs = []
+    d = _RAMP_SLOW
+
+    def add(count, dwell):
+        if count <= 0:
+            return
+        if runs and runs[-1][1] == dwell:
+            runs[-1] = (runs[-1][0] + count, dwell)
+        else:
+            runs.append((count, dwell))
+
+    for _ in range(min(acc_dist, steps)):
+        # Accelerating
+        d = d - _RAMP_ACC if d > _RAMP_FAST - _RAMP_ACC else _RAMP_FAST
+        add(1, d)
+    add(min(decel_from, steps + 1) - acc_dist - 1, d)
+    for _ in range(decel_from, steps + 1):
+        # Decelerating
+        d = d + _RAMP_ACC if d < _RAMP_SLOW + _RAMP_ACC else _RAMP_SLOW
+        add(1, d)
+    return runs
+
+
+def _step_pattern(x: int, y: int) -> bytearray:
+    """The step byte of every tick of a straight move, dwell left out.
+
+    The major axis steps every tick. The minor axis rides along on the ticks
+    where the major count crosses a multiple of the ratio between them,
+    rounded to four places, and any minor steps the rounding leaves over are
+    taken on their own at the end. The float ratio is carried as the exact
+    integer fraction it is, so the crossings come from integer arithmetic.
+    """
+    x_byte = 0b00000001 if x >= 0 else 0b00000011
+    y_byte = 0b00001100 if y >= 0 else 0b00000100
     xt = abs(x)
     yt = abs(y)
-
     if xt >= yt:
-        maj_target = xt
-        min_target = yt
-        maj_dir = xd
-        min_dir = yd
+        maj_target, min_target, maj_byte, min_byte = xt, yt, x_byte, y_byte
     else:
-        maj_target = yt
-        min_target = xt
-        maj_dir = yd
-        min_dir = xd
-    if min_target > 0:
-        maj_per_min = round(maj_target / min_target, 4)
-    else:
-        maj_per_min = maj_target
-
-    maj_cnt = 0
-    min_cnt = 0
-    while maj_cnt < maj_target or min_cnt < min_target:
-        if maj_cnt < maj_target:
-            maj_cnt += 1
-            if maj_cnt % maj_per_min < 1 and min_cnt < min_target:
-                min_out = min_dir
-                min_cnt += 1
-            else:
-                min_out = 0
-        else:
-            maj_dir = 0
-            min_out = min_dir
-            min_cnt += 1
+        maj_target, min_target, maj_byte, min_byte = yt, xt, y_byte, x_byte
 
-        yield maj_dir if xt >= yt else min_out, min_out if xt >= yt else maj_dir
+    pattern = bytearray([maj_byte]) * maj_target
+    ridden = 0
+    if min_target > 0:
+        num, den = round(maj_target / min_target, 4).as_integer_ratio()
+        # The k-th crossing is the first major count at or past k * ratio.
+        for k in range(1, min_target + 1):
+            tick = -(-k * num // den)
+            if tick > maj_target:
+                break
+            pattern[tick - 1] = maj_byte | min_byte
+            ridden += 1
+    pattern += bytes([min_byte]) * (min_target - ridden)
+    return pattern
@@ -5,8 +5,13 @@ https://community.openglow.org
 
 SPDX-License-Identifier:    MIT
 """
+from bisect import bisect_right
+from collections import deque
+import contextvars
 import logging
 import struct
+import threading
+import time
 import zlib
 
 from gfutilities._common import LOGGER_NAME
@@ -22,6 +27,21 @@ _GZIP_MAGIC = b'\x1f\x8b'
 # behind a four-byte CRC, and the shortest possible stream is 18 bytes.
 _GZIP_MIN = 18
 
+# Most inflater snapshots a seekable source keeps. Each holds the 32 KB
+# inflate window and its state, so this caps the index near a couple of MB.
+_MAX_CHECKPOINTS = 32
+
+# Most payload bytes the inflate-ahead worker decodes per call before it
+# hands them over, so a reader waiting on it is never kept waiting for the
+# whole of a refill.
+_PREFETCH_PIECE = 256 * 1024
+
+# Most body bytes a PulseStream takes off the socket ahead of the inflater.
+_STREAM_AHEAD = 16 * 1024 * 1024
+
+# Max seconds close() or seek() waits for the inflate-ahead worker to stop.
+_WORKER_JOIN = 10
+
 logger = logging.getLogger(LOGGER_NAME)
 
 
@@ -29,6 +49,109 @@ class PulseSourceError(Exception):
     """The body is not a pulse file this machine can play."""
 
 
+class HeaderTruncated(PulseSourceError):
+    """The body, or the part of it at hand, ends before the header does."""
+
+
+def _header_fields(raw: bytes) -> dict:
+    """The tag/value pairs of a whole header, magic and length included."""
+    return {raw[pos:pos + 4].decode(): struct.unpack_from('<I', raw, pos + 4)[0]
+            for pos in range(8, len(raw) - 7, 8)}
+
+
+def read_header(prefix: bytes) -> tuple:
+    """Parse a pulse file's header from the first bytes of its body alone.
+
+    A compressed body is inflated only as far as the prefix goes, so a
+    prefix of a few KB tells what a job is without the rest of it.
+    :param prefix: the start of the body, as the service sent it
+    :return: (header tags, header bytes as they appear in the stream)
+    :rtype: tuple
+    :raises HeaderTruncated: when the prefix ends before the header does
+    :raises PulseSourceError: when this is not a pulse file
+    """
+    prefix = bytes(prefix)
+    if prefix[:2] == _GZIP_MAGIC:
+        try:
+            prefix = zlib.decompressobj(31).decompress(prefix)
+        except zlib.error as e:
+            raise PulseSourceError('puls body does not inflate: %s' % e) from None
+    if len(prefix) < 8 or prefix[1:4] != b'GF1':
+        raise PulseSourceError('received data not a GF puls file')
+    total = struct.unpack_from('<I', prefix, 4)[0]
+    if total < 8:
+        raise PulseSourceError('puls header length %d is impossible' % total)
+    if len(prefix) < total:
+        raise HeaderTruncated('puls file ended before header was complete')
+    return _header_fields(prefix[:total]), prefix[:total]
+
+
+class _Staging:
+    """Decoded payload waiting to be handed out, kept as the pieces it was
+    decoded in.
+
+    Every piece is a view of memory that never changes under it: a buffer
+    the inflater returned, or a span of a plain body. Nothing is joined and
+    nothing shifts as bytes are taken from the front, so handing bytes out
+    costs at most the one copy into the caller's buffer, and none at all
+    through ``view()``. How much is staged is bounded by what ``_fill()``
+    was asked for, so this is the fixed-size window it always was.
+    """
+
+    def __init__(self):
+        self._pieces = deque()
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, piece) -> None:
+        if len(piece):
+            self._pieces.append(memoryview(piece).cast('B'))
+            self._len += len(piece)
+
+    def clear(self) -> None:
+        self._pieces.clear()
+        self._len = 0
+
+    def peek(self, count: int) -> bytes:
+        """The first ``count`` staged bytes, copied and left in place."""
+        out = bytearray()
+        for piece in self._pieces:
+            if len(out) >= count:
+                break
+            out += piece[:count - len(out)]
+        return bytes(out)
+
+    def view(self, count: int) -> memoryview:
+        """Up to ``count`` bytes from the front, no further than the first
+        piece goes, without copying them."""
+        head = self._pieces[0]
+        if count >= len(head):
+            self._pieces.popleft()
+        else:
+            self._pieces[0] = head[count:]
+            head = head[:count]
+        self._len -= len(head)
+        return head
+
+    def readinto(self, buffer: memoryview) -> int:
+        """Move staged bytes into ``buffer``, as many as fit."""
+        done = 0
+        while self._pieces and done < len(buffer):
+            piece = self.view(len(buffer) - done)
+            buffer[done:done + len(piece)] = piece
+            done += len(piece)
+        return done
+
+    def drop(self, count: int) -> int:
+        """Discard up to ``count`` bytes from the front."""
+        dropped = 0
+        while self._pieces and dropped < count:
+            dropped += len(self.view(count - dropped))
+        return dropped
+
+
 class PulseSource:
     """A downloaded pulse file, held in memory, handed out as the ring asks.
 
@@ -40,41 +163,111 @@ class PulseSource:
 
     The header is parsed at construction. ``read()`` then returns payload
     bytes, inflating only as far as it is asked to, so the decoded window
-    never grows to the size of the job.
+    never grows to the size of the job. ``readinto()`` and ``read_view()``
+    hand out the same bytes without the copies ``read()`` makes: the first
+    copies straight from the inflater's output into the caller's buffer,
+    the second lends a view of that output and copies nothing, for a
+    caller that writes it on to the pulse device and lets it go.
+
+    A compressed stream can only be inflated forwards, so resuming a job
+    part way through would mean inflating everything before the resume
+    point. With ``checkpoint_every`` set, the first pass through the stream
+    snapshots the inflater each time that many more payload bytes have been
+    decoded, and ``seek()`` restarts from the nearest snapshot at or before
+    its target: a resume or rewind costs at most one interval of inflation,
+    wherever in the job it lands. At most ``max_checkpoints`` are kept; past
+    that every second one is dropped and the interval doubled.
+
+    Inflation normally happens inside the read, on the thread feeding the
+    ring, and a slow call there while the ring runs low is an underrun in
+    the middle of a cut. With ``prefetch`` set, a worker thread inflates
+    ahead instead (zlib lets go of the GIL while it works): it keeps going
+    until ``prefetch`` payload bytes are staged, sleeps until reads drain
+    them to ``low_water`` (half of ``prefetch`` unless given), and refills.
+    Reads then only take what is staged, and ``prefetch_stats`` says how
+    often one found too little and waited. ``exhausted``, ``served`` and
+    ``program_size`` mean what they always do. ``close()`` stops the worker
+    of a job that will not be read to the end.
+
+    A caller that has parsed this body's header before, as a job cache has,
+    passes it as ``header``, ``(tags, header bytes)`` as read_header gives
+    them, and the header is stepped over instead of parsed again.
     """
 
-    def __init__(self, body: bytes):
+    def __init__(self, body: bytes, checkpoint_every: int = 0,
+                 max_checkpoints: int = _MAX_CHECKPOINTS, prefetch: int = 0,
+                 low_water: int = None, header: tuple = None):
+        if prefetch < 0:
+            raise ValueError('prefetch must be >= 0')
+        if low_water is None:
+            low_water = prefetch // 2
+        if prefetch and not 0 <= low_water < prefetch:
+            raise ValueError('low_water must be >= 0 and below prefetch')
         self._body = body
         self._in = 0
         self._decomp = zlib.decompressobj(31) if body[:2] == _GZIP_MAGIC else None
         self.compressed = self._decomp is not None
-        self._out = bytearray()
+        self._out = _Staging()
         self._eof = False
         self._served = 0
+        # Stream bytes the inflater has produced, header included.
+        self._produced = 0
+        self._checkpoint_every = checkpoint_every
+        self._max_checkpoints = max(2, max_checkpoints)
+        # (stream offset, body offset, inflater) snapshots, in stream order.
+        self._checkpoints = []
+        if self._decomp is not None and checkpoint_every > 0:
+            self._checkpoints.append((0, 0, self._decomp.copy()))
         self.header = {}
         self.header_len = 0
         self.header_raw = b''
         self.program_size = None
-        self._parse_header()
+        # Guards everything the worker and the reader share: the staging,
+        # the end-of-stream flag and the worker's orders.
+        self._ready = threading.Condition()
+        self._worker = None
+        self._high_water = prefetch
+        self._low_water = low_water
+        self._wanted = 0
+        self._stopping = False
+        self._error = None
+        self._stats = {'reads': 0, 'waits': 0, 'wait_seconds': 0.0,
+                       'max_wait_seconds': 0.0, 'refills': 0}
+        if header is None:
+            self._parse_header()
+        else:
+            self._skip_header(*header)
         self._measure_program()
+        if prefetch:
+            self._start_worker()
 
     # -- header ----------------------------------------------------------
     def _parse_header(self) -> None:
         self._fill(8)
-        if len(self._out) < 8 or bytes(self._out[1:4]) != b'GF1':
+        head = self._out.peek(8)
+        if len(head) < 8 or head[1:4] != b'GF1':
             raise PulseSourceError('received data not a GF puls file')
-        total = struct.unpack_from('<I', self._out, 4)[0]
+        total = struct.unpack_from('<I', head, 4)[0]
         if total < 8:
             raise PulseSourceError('puls header length %d is impossible' % total)
         self._fill(total)
         if len(self._out) < total:
-            raise PulseSourceError('puls file ended before header was complete')
-        for pos in range(8, total - 7, 8):
-            self.header[bytes(self._out[pos:pos + 4]).decode()] = \
-                struct.unpack_from('<I', self._out, pos + 4)[0]
+            raise HeaderTruncated('puls file ended before header was complete')
+        raw = self._out.peek(total)
+        self.header = _header_fields(raw)
         self.header_len = total - 8
-        self.header_raw = bytes(self._out[:total])
-        del self._out[:total]
+        self.header_raw = raw
+        self._out.drop(total)
+
+    def _skip_header(self, tags: dict, raw: bytes) -> None:
+        total = len(raw)
+        self._fill(total)
+        if len(self._out) < total:
+            raise HeaderTruncated('puls file ended before header was complete')
+        self.header = dict(tags)
+        self.header_len = total - 8
+        self.header_raw = bytes(raw)
+        self._out.drop(total)
 
     # -- how long the job is ---------------------------------------------
     def _measure_program(self) -> None:
@@ -97,7 +290,7 @@ class PulseSource:
             return
         if len(self._body) < _GZIP_MIN:
             return
-        isize = struct.unpack_from('<I', self._body, len(self._body) - 4)[0]
+        isize = struct.unpack('<I', self._span(len(self._body) - 4, len(self._body)))[0]
         if isize < header_bytes:
             # A truncated body, a multi-member stream, or a job past what
             # the trailer can count: not a number to divide by.
@@ -109,39 +302,287 @@ class PulseSource:
 
     # -- payload ---------------------------------------------------------
     def _fill(self, want: int) -> None:
-        """Decode until ``want`` payload bytes are staged, or the body ends."""
+        """Decode until ``want`` payload bytes are staged, or the body ends.
+
+        Called holding ``_ready``. With a worker running, waits for it
+        instead of decoding here.
+        """
+        if self._worker is not None:
+            self._await(want)
+            return
         while len(self._out) < want and not self._eof:
-            if self._decomp is None:
-                piece = self._body[self._in:self._in + _INPUT_CHUNK]
-                self._in += len(piece)
-                if not piece:
-                    self._eof = True
-                    break
-                self._out += piece
-                continue
-            src = self._decomp.unconsumed_tail
-            if not src:
-                src = self._body[self._in:self._in + _INPUT_CHUNK]
-                self._in += len(src)
-            if not src:
-                self._out += self._decomp.flush()
-                self._eof = True
-                break
-            # Bounded: never inflate further ahead than the caller asked for.
-            self._out += self._decomp.decompress(src, max(want - len(self._out), 1))
-            if self._decomp.eof:
-                self._eof = True
+            piece, ended = self._decode(want - len(self._out))
+            self._out.append(piece)
+            self._eof = ended
+
+    def _span(self, start: int, end: int) -> memoryview:
+        """Body bytes ``start`` to ``end``: a view of the body, not a copy."""
+        return memoryview(self._body)[start:end]
+
+    def _decode(self, limit: int) -> tuple:
+        """Take the next step through the body: (payload piece, stream ended).
+
+        ``limit`` bounds what one call inflates; a plain body is handed out
+        a fixed span at a time whatever it is.
+        """
+        if self._decomp is None:
+            piece = self._span(self._in, self._in + _INPUT_CHUNK)
+            self._in += len(piece)
+            return piece, not piece
+        src = self._decomp.unconsumed_tail
+        if not src:
+            src = self._span(self._in, self._in + _INPUT_CHUNK)
+            self._in += len(src)
+        if not src:
+            tail = self._decomp.flush()
+            self._produced += len(tail)
+            return tail, True
+        # Bounded: never inflate further ahead than the caller asked for,
+        # nor past the next checkpoint, so each lands on its interval.
+        if self._checkpoints:
+            limit = min(limit, self._checkpoints[-1][0] + self._checkpoint_every - self._produced)
+        piece = self._decomp.decompress(src, max(limit, 1))
+        self._produced += len(piece)
+        if self._checkpoints:
+            self._checkpoint()
+        return piece, self._decomp.eof
+
+    # -- inflate-ahead ---------------------------------------------------
+    def _start_worker(self) -> None:
+        self._stopping = False
+        self._worker = threading.Thread(target=self._prefetch, name='pulse-inflate', daemon=True)
+        self._worker.start()
+
+    def _stop_worker(self) -> None:
+        worker = self._worker
+        if worker is None:
+            return
+        with self._ready:
+            self._stopping = True
+            self._ready.notify_all()
+        worker.join(_WORKER_JOIN)
+        if worker.is_alive():
+            # Still inside the inflater: it is kept as the source's worker,
+            # so nothing decodes alongside it, and reads fail, not wait.
+            logger.warning('pulse inflate worker still running %ds after it was stopped'
+                           % _WORKER_JOIN)
+            with self._ready:
+                self._error = PulseSourceError('the inflate-ahead worker did not stop')
+                self._ready.notify_all()
+            return
+        self._worker = None
+
+    def _prefetch(self) -> None:
+        """The worker: inflate up to the high watermark, sleep until reads
+        drain the staging to the low one, repeat until the stream ends."""
+        try:
+            with self._ready:
+                while not self._stopping and not self._eof:
+                    target = max(self._high_water, self._wanted)
+                    if len(self._out) >= target:
+                        self._ready.wait_for(lambda: self._stopping
+                                             or len(self._out) <= self._low_water
+                                             or self._wanted > len(self._out))
+                        if not self._stopping:
+                            self._stats['refills'] += 1
+                        continue
+                    limit = min(target - len(self._out), _PREFETCH_PIECE)
+                    # Inflate unlocked, so reads go on taking what is staged.
+                    self._ready.release()
+                    try:
+                        piece, ended = self._decode(limit)
+                    finally:
+                        self._ready.acquire()
+                    self._out.append(piece)
+                    self._eof = ended
+                    self._ready.notify_all()
+        except Exception as e:  # zlib.error: the reader raises it as its own
+            with self._ready:
+                self._error = e
+                self._ready.notify_all()
+
+    def _await(self, want: int) -> None:
+        """Wait, holding ``_ready``, until the worker has staged ``want``
+        bytes or the stream has ended."""
+        self._stats['reads'] += 1
+        if len(self._out) >= want or self._eof:
+            return
+        if self._error is None:
+            self._stats['waits'] += 1
+            start = time.monotonic()
+            self._wanted = want
+            self._ready.notify_all()
+            self._ready.wait_for(lambda: len(self._out) >= want or self._eof
+                                 or self._error is not None)
+            self._wanted = 0
+            waited = time.monotonic() - start
+            self._stats['wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+        if self._error is not None and len(self._out) < want:
+            raise self._error
+
+    def _taken(self) -> None:
+        """Called holding ``_ready`` after a read: wake the worker once the
+        staging is down to the low watermark."""
+        if self._worker is not None and len(self._out) <= self._low_water:
+            self._ready.notify_all()
+
+    @property
+    def prefetch_stats(self) -> dict:
+        """How the inflate-ahead worker has kept up, or None without one.
+
+        ``reads`` is reads that asked it for bytes, ``waits`` the ones that
+        found too few staged and waited, for ``wait_seconds`` in all and
+        ``max_wait_seconds`` at most; ``refills`` counts the worker waking at
+        the low watermark.
+        """
+        if not self._high_water:
+            return None
+        with self._ready:
+            return dict(self._stats, high_water=self._high_water, low_water=self._low_water)
+
+    def close(self) -> None:
+        """Stop the inflate-ahead worker; reads after this inflate in place."""
+        self._stop_worker()
+
+    def _checkpoint(self) -> None:
+        """Snapshot the inflater if the stream is an interval past the last one."""
+        last = self._checkpoints[-1][0]
+        if self._produced < last + self._checkpoint_every:
+            return
+        self._checkpoints.append((self._produced, self._in, self._decomp.copy()))
+        if len(self._checkpoints) > self._max_checkpoints:
+            # What is left is what the doubled interval would have taken;
+            # the first one, at the start of the stream, always stays.
+            del self._checkpoints[1::2]
+            self._checkpoint_every *= 2
 
     def read(self, count: int) -> bytes:
         """Up to ``count`` payload bytes, or b'' once the job is spent."""
         if count <= 0:
             return b''
-        self._fill(count)
-        out = bytes(self._out[:count])
-        del self._out[:count]
-        self._served += len(out)
+        with self._ready:
+            self._fill(count)
+            views = []
+            while self._out and count > 0:
+                views.append(self._out.view(count))
+                count -= len(views[-1])
+            out = b''.join(views)
+            self._served += len(out)
+            self._taken()
         return out
 
+    def readinto(self, buffer) -> int:
+        """Fill ``buffer`` with the next payload bytes.
+
+        The bytes are copied once, from the inflater's output into the
+        buffer, and the buffer can be reused call after call, so a feed
+        loop allocates nothing per chunk.
+        :param buffer: anything writable that supports the buffer protocol
+        :return: bytes written to the front of ``buffer``, 0 once the job is
+            spent (or for an empty buffer)
+        :rtype: int
+        """
+        view = memoryview(buffer).cast('B')
+        if not len(view):
+            return 0
+        with self._ready:
+            self._fill(len(view))
+            done = self._out.readinto(view)
+            self._served += done
+            self._taken()
+        return done
+
+    def read_view(self, count: int) -> memoryview:
+        """Up to ``count`` payload bytes as a read-only view, copying nothing.
+
+        The view may be shorter than ``count`` even mid-job: it never spans
+        two of the pieces the payload was decoded in, so a caller loops
+        until it comes back empty. It is the source's own memory, the
+        inflater's output or the body itself, and stays valid after later
+        reads; writing it on and dropping it is what it is for.
+        :param count: most payload bytes wanted
+        :return: the bytes, empty once the job is spent
+        :rtype: memoryview
+        """
+        if count <= 0:
+            return memoryview(b'')
+        with self._ready:
+            if not self._out:
+                # The worker need only have staged something.
+                self._fill(count if self._worker is None else 1)
+            if not self._out:
+                return memoryview(b'')
+            view = self._out.view(count)
+            self._served += len(view)
+            self._taken()
+        return view.toreadonly()
+
+    def seek(self, offset: int) -> int:
+        """Move the reader to payload byte ``offset``, back or forward.
+
+        A plain body is a slice. A compressed one restarts the inflater from
+        the nearest checkpoint at or before the target, or carries on from
+        where it is when that is nearer, and inflates the remainder a window
+        at a time without keeping it. A target past the end leaves the
+        source exhausted. Without checkpoints a backwards seek inflates from
+        the start of the stream. An inflate-ahead worker is stopped for the
+        seek and restarted from the new position.
+        :param offset: payload byte to read next
+        :return: the payload offset the reader is now at
+        :rtype: int
+        """
+        if offset < 0:
+            raise ValueError('cannot seek before the payload')
+        prefetching = self._worker is not None
+        self._stop_worker()
+        if self._worker is not None:
+            raise self._error
+        try:
+            with self._ready:
+                self._error = None
+                return self._seek(offset)
+        finally:
+            if prefetching:
+                self._start_worker()
+
+    def _seek(self, offset: int) -> int:
+        target = self.header_len + 8 + offset
+        if self._decomp is None:
+            self._in = min(target, len(self._body))
+            self._out.clear()
+            self._eof = self._in >= len(self._body)
+            self._served = self._in - self.header_len - 8
+            return self._served
+        best = None
+        for checkpoint in self._checkpoints:
+            if checkpoint[0] > target:
+                break
+            best = checkpoint
+        here = self._produced - len(self._out)
+        if here > target or (best is not None and best[0] > here):
+            # Restart: from the snapshot (copied, so it can be used again)
+            # or, with none before the target, from the top of the stream.
+            produced, body_at, decomp = best if best is not None else (0, 0, None)
+            self._decomp = decomp.copy() if decomp is not None else zlib.decompressobj(31)
+            self._in = body_at
+            self._produced = produced
+            self._out.clear()
+            self._eof = False
+        # Inflate up to the target and let it go.
+        skip = target - (self._produced - len(self._out))
+        while skip > 0:
+            self._fill(min(skip, _INPUT_CHUNK))
+            if not self._out:
+                break
+            skip -= self._out.drop(skip)
+        self._served = self._produced - len(self._out) - self.header_len - 8
+        return self._served
+
+    def tell(self) -> int:
+        """The payload offset read() hands out next."""
+        return self._served
+
     @property
     def exhausted(self) -> bool:
         """True once every payload byte has been handed out."""
@@ -149,7 +590,8 @@ class PulseSource:
 
     @property
     def served(self) -> int:
-        """Payload bytes handed out so far."""
+        """Payload bytes handed out so far, counted from where seek() last
+        put the reader as if everything before it had been read."""
         return self._served
 
     @property
@@ -161,3 +603,175 @@ class PulseSource:
     def body_size(self) -> int:
         """Size of the body as it arrived, compressed or not."""
         return len(self._body)
+
+
+class _StreamBody:
+    """A body still arriving: the pieces received so far, in order.
+
+    Pieces are kept as they came off the socket, never joined into one
+    buffer, so appending one cannot move memory a view is lent from.
+    """
+
+    def __init__(self):
+        self._pieces = []
+        # Body offset at which each piece starts.
+        self._starts = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __bytes__(self) -> bytes:
+        return b''.join(self._pieces)
+
+    def __getitem__(self, index) -> bytes:
+        return bytes(self)[index]
+
+    def append(self, piece) -> None:
+        if len(piece):
+            self._starts.append(self._len)
+            self._pieces.append(bytes(piece))
+            self._len += len(piece)
+
+    def span(self, start: int, end: int) -> memoryview:
+        """Bytes ``start`` to ``end`` of what has arrived; a view when they
+        sit in one piece, a copy when they straddle two."""
+        end = min(end, self._len)
+        if start >= end:
+            return memoryview(b'')
+        first = bisect_right(self._starts, start) - 1
+        offset = start - self._starts[first]
+        piece = self._pieces[first]
+        if offset + (end - start) <= len(piece):
+            return memoryview(piece)[offset:offset + end - start]
+        out = bytearray(piece[offset:])
+        for piece in self._pieces[first + 1:]:
+            if len(out) >= end - start:
+                break
+            out += piece[:end - start - len(out)]
+        return memoryview(bytes(out))
+
+
+class PulseStream(PulseSource):
+    """A PulseSource read while its body is still downloading.
+
+    A PulseSource is built from the whole body, so nothing about a job is
+    known, and nothing reaches the ring, until its last byte is in. This one
+    takes the download itself, an iterable of body pieces, and reads it on a
+    thread of its own: the header is parsed as soon as its bytes arrive, so
+    the job can be refused while the rest is still on the wire, and reads
+    hand out payload as fast as it inflates, waiting only when they catch up
+    with the download. Time to the first step is the header's download, not
+    the body's.
+
+    The download is held back once it is ``max_ahead`` body bytes in front
+    of the inflater, which stops the socket being read and lets TCP push
+    back on the service. The default is past any body the service has been
+    seen to send, so in practice a job still downloads at the network's
+    pace and the connection is not kept open for the length of the print.
+
+    Until the download completes, ``program_size`` is None, as for any body
+    whose length cannot be trusted, and ``body`` and ``body_size`` are what
+    has arrived. A download that fails or is abandoned fails the read that
+    needs the missing bytes with PulseSourceError. ``on_done`` is called once
+    the download is over, however it ends, to release the connection.
+    """
+
+    def __init__(self, chunks, max_ahead: int = _STREAM_AHEAD, on_done=None, **kwargs):
+        self._arrived = threading.Condition()
+        self._done = False
+        self._closing = False
+        self._failure = None
+        self._header_ready = False
+        self._max_ahead = max_ahead
+        self._on_done = on_done
+        self._in = 0
+        self._body = _StreamBody()
+        # In the caller's context: a resumed download signs in again on a
+        # 401, in the configuration scope of the machine it is for.
+        self._download = threading.Thread(target=contextvars.copy_context().run,
+                                          args=(self._receive, chunks),
+                                          name='pulse-download', daemon=True)
+        self._download.start()
+        with self._arrived:
+            # The gzip magic decides how the body is read.
+            self._arrived.wait_for(lambda: len(self._body) >= 2 or self._done)
+        try:
+            super().__init__(self._body, **kwargs)
+        except BaseException:
+            self.close()
+            raise
+
+    def _receive(self, chunks) -> None:
+        """The download thread: take pieces as they come, until the body ends,
+        the download fails, or the source is closed."""
+        try:
+            for piece in chunks:
+                with self._arrived:
+                    self._arrived.wait_for(lambda: self._closing
+                                           or len(self._body) - self._in < self._max_ahead)
+                    if self._closing:
+                        break
+                    self._body.append(piece)
+                    self._arrived.notify_all()
+        except Exception as e:
+            logger.error('pulse download failed after %d bytes: %s' % (len(self._body), e))
+            with self._arrived:
+                self._failure = e
+        with self._arrived:
+            self._done = True
+            if self._header_ready and self._failure is None and not self._closing:
+                PulseSource._measure_program(self)
+            self._arrived.notify_all()
+        self._release()
+
+    def _release(self) -> None:
+        with self._arrived:
+            on_done, self._on_done = self._on_done, None
+        if on_done is not None:
+            on_done()
+
+    def _measure_program(self) -> None:
+        # Only the whole body knows its length; the download thread measures
+        # it at the end, once the header it is measured against is parsed.
+        with self._arrived:
+            self._header_ready = True
+            if self._done and self._failure is None and not self._closing:
+                PulseSource._measure_program(self)
+
+    def _span(self, start: int, end: int) -> memoryview:
+        with self._arrived:
+            # The inflater has moved on; the download may be waiting on it.
+            self._arrived.notify_all()
+            self._arrived.wait_for(lambda: len(self._body) > start or self._done or self._closing)
+            if len(self._body) <= start and (self._failure is not None or self._closing):
+                raise PulseSourceError('pulse download ended after %d bytes: %s'
+                                       % (len(self._body), self._failure or 'closed'))
+            return self._body.span(start, end)
+
+    def _seek(self, offset: int) -> int:
+        if self._decomp is None:
+            # A plain body is sliced, so the target has to have arrived.
+            target = self.header_len + 8 + offset
+            with self._arrived:
+                self._arrived.wait_for(lambda: len(self._body) > target or self._done
+                                       or self._closing)
+        return super()._seek(offset)
+
+    @property
+    def downloaded(self) -> bool:
+        """True once the whole body has arrived."""
+        return self._done and self._failure is None and not self._closing
+
+    def close(self) -> None:
+        """Stop the worker and abandon the download, if either is running."""
+        # Closing first: a worker waiting in _span for bytes that are not
+        # coming gives up, and can then be stopped.
+        with self._arrived:
+            abandon = not self._done
+            if abandon:
+                self._closing = True
+                self._arrived.notify_all()
+        super().close()
+        if abandon:
+            self._release()
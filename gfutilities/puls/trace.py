@@ -0,0 +1,196 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+from itertools import accumulate
+
+from gfutilities.puls import pulsedata
+from gfutilities.puls.pulsedata import (_COUNT_INDEX, _STEP_DELTAS, _XY_MM_PER_STEP,
+                                        _Z_MM_PER_STEP)
+
+# Pulse bytes traced at a time. A chunk handed to update() is walked in
+# windows of this size, so the position arrays never outgrow it whatever the
+# caller reads from the source.
+_TRACE_WINDOW = 64 * 1024
+
+# Payload bytes drained from a PulseSource per update() by trace_source().
+_SOURCE_CHUNK = 256 * 1024
+
+_AXES = ('X', 'Y', 'Z')
+
+
+def _build_axis_deltas() -> dict:
+    """How far one pulse byte moves each axis, for all 256 values.
+
+    Taken from the END column of the step table, so a trace and the
+    statistics can never disagree about which way a byte goes.
+    """
+    deltas = {}
+    for axis in _AXES:
+        index = _COUNT_INDEX[axis + 'END']
+        deltas[axis] = tuple(dict(row).get(index, 0) for row in _STEP_DELTAS)
+    return deltas
+
+
+_AXIS_DELTAS = _build_axis_deltas()
+_AXIS_DELTAS_NP = ({axis: pulsedata.np.array(table, dtype=pulsedata.np.int8)
+                    for axis, table in _AXIS_DELTAS.items()}
+                   if pulsedata.np is not None else None)
+
+
+class PositionTrace:
+    """Where a job takes the head, worked out from its pulse bytes alone.
+
+    The statistics say where a job ends; this says everywhere it goes on the
+    way, which is what decides whether it stays on the bed. Feed it the
+    payload with ``update()`` as it is read, chunk by chunk, and ``result()``
+    reports the excursion of each axis and the XY/Z bounding box.
+
+    Memory is bounded whatever the job's length: chunks are traced a window
+    at a time, and the optional polyline (one point every ``sample_every``
+    ticks, starting at the origin) halves its own resolution whenever it
+    would pass ``max_points``.
+
+    Positions are in steps relative to ``origin`` and converted to
+    millimeters with the job's (XY, Z) microstep ``mode``. ``vectorized``
+    picks the engine as StepStatsAccumulator does.
+    """
+
+    def __init__(self, mode: tuple = (8, 2), origin: tuple = (0, 0, 0),
+                 sample_every: int = 0, max_points: int = 4096,
+                 vectorized: bool = None):
+        if vectorized is None:
+            vectorized = pulsedata.np is not None
+        elif vectorized and pulsedata.np is None:
+            raise ValueError('the vectorized engine needs numpy')
+        if sample_every < 0 or max_points < 2:
+            raise ValueError('sample_every must be >= 0 and max_points >= 2')
+        self.mode = mode
+        self.vectorized = vectorized
+        self.ticks = 0
+        self._pos = dict(zip(_AXES, origin))
+        self._min = dict(self._pos)
+        self._max = dict(self._pos)
+        self._stride = sample_every
+        self._max_points = max_points
+        self._points = [(0,) + tuple(origin)] if sample_every else None
+
+    def update(self, puls: bytes) -> None:
+        """Trace a run of pulse bytes on from where the last one left off."""
+        view = memoryview(puls).cast('B')
+        for start in range(0, len(view), _TRACE_WINDOW):
+            self._trace(view[start:start + _TRACE_WINDOW])
+
+    def _trace(self, window) -> None:
+        positions = {}
+        starts = dict(self._pos)
+        if self.vectorized:
+            np = pulsedata.np
+            values = np.frombuffer(window, dtype=np.uint8)
+        for axis in _AXES:
+            start = self._pos[axis]
+            if self.vectorized:
+                # Relative to the window's start: a window is short enough
+                # for int32, which is half the memory traffic of int64.
+                run = np.cumsum(np.take(_AXIS_DELTAS_NP[axis], values), dtype=np.int32)
+                low, high, end = (start + int(run.min()), start + int(run.max()),
+                                  start + int(run[-1]))
+            else:
+                run = list(accumulate(map(_AXIS_DELTAS[axis].__getitem__, window),
+                                      initial=start))[1:]
+                low, high, end = min(run), max(run), run[-1]
+            positions[axis] = run
+            self._pos[axis] = end
+            self._min[axis] = min(self._min[axis], low)
+            self._max[axis] = max(self._max[axis], high)
+        if self._points is not None:
+            self._sample(positions, starts, len(window))
+        self.ticks += len(window)
+
+    def _sample(self, positions: dict, starts: dict, count: int) -> None:
+        # The point for tick t is the position after its byte: index t - 1
+        # of a window that begins at self.ticks.
+        first = (self._stride - 1 - self.ticks) % self._stride
+        picks = [positions[axis][first::self._stride] for axis in _AXES]
+        if self.vectorized:
+            # Back from window-relative steps to positions.
+            picks = [[starts[axis] + v for v in p.tolist()]
+                     for axis, p in zip(_AXES, picks)]
+        ticks = range(self.ticks + first + 1, self.ticks + count + 1, self._stride)
+        self._points.extend(zip(ticks, *picks))
+        while len(self._points) > self._max_points:
+            # Keep every second point: what is left is exactly what a stride
+            # twice as long would have taken from the start.
+            del self._points[1::2]
+            self._stride *= 2
+
+    def _to_mm(self, axis: str, steps: int) -> float:
+        if axis == 'Z':
+            return (steps / self.mode[1]) * _Z_MM_PER_STEP
+        return (steps / self.mode[0]) * _XY_MM_PER_STEP
+
+    @property
+    def polyline(self) -> list:
+        """(tick, x, y, z) points in steps, ending at the current position;
+        None unless the trace was asked to sample."""
+        if self._points is None:
+            return None
+        last = (self.ticks,) + tuple(self._pos[axis] for axis in _AXES)
+        if self._points[-1][0] == self.ticks:
+            return list(self._points)
+        return self._points + [last]
+
+    def result(self) -> dict:
+        """Excursion of every axis so far, in steps and millimeters.
+
+        ``<axis>MIN``/``<axis>MAX``/``<axis>END`` are steps, the ``MM``
+        suffixed keys the same in millimeters, ``BBOX`` is the XY box as
+        (xmin, ymin, xmax, ymax) mm and ``ZRANGE`` the (zmin, zmax) mm.
+        """
+        out = {'TICKS': self.ticks}
+        for axis in _AXES:
+            for key, steps in (('MIN', self._min[axis]), ('MAX', self._max[axis]),
+                               ('END', self._pos[axis])):
+                out[axis + key] = steps
+                out[axis + key + 'MM'] = self._to_mm(axis, steps)
+        out['BBOX'] = (out['XMINMM'], out['YMINMM'], out['XMAXMM'], out['YMAXMM'])
+        out['ZRANGE'] = (out['ZMINMM'], out['ZMAXMM'])
+        return out
+
+    def outside(self, limits: dict) -> list:
+        """The axes whose excursion leaves ``limits``.
+
+        :param limits: axis name to (low, high) millimeters; axes left out
+            are not checked
+        :return: the offending axis names, in X, Y, Z order
+        :rtype: list
+        """
+        result = self.result()
+        return [axis for axis in _AXES if axis in limits and
+                (result[axis + 'MINMM'] < limits[axis][0] or
+                 result[axis + 'MAXMM'] > limits[axis][1])]
+
+
+def trace_source(source, chunk: int = _SOURCE_CHUNK, **kwargs) -> PositionTrace:
+    """Trace every payload byte a PulseSource has left.
+
+    The source is drained, so a pre-flight check runs over its own source
+    built from the same body, never the one that feeds the ring.
+    :param source: PulseSource to drain
+    :param chunk: payload bytes read at a time
+    :param kwargs: passed to PositionTrace
+    :return: the finished trace
+    :rtype: PositionTrace
+    """
+    trace = PositionTrace(**kwargs)
+    while True:
+        piece = source.read(chunk)
+        if not piece:
+            return trace
+        trace.update(piece)
+
+
+__all__ = ['PositionTrace', 'trace_source']
@@ -0,0 +1,417 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import asyncio
+import concurrent.futures
+import logging
+from queue import Queue
+from threading import Event, Thread
+import time
+
+from gfutilities._common import *
+from gfutilities.configuration import get_cfg, scoped
+from gfutilities.service.recording import record_open, record_rx, record_tx
+from gfutilities.service.websocket import FrameCoalescer, ReconnectPolicy, TxQueue, peek_message, split_frame
+
+try:
+    import websockets
+    from websockets.asyncio.client import connect
+except ImportError:
+    websockets = None
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class EventLoopThread(Thread):
+    """
+    An asyncio event loop on a thread of its own, for AsyncWsClients to share
+    A client normally runs its loop on a thread of its own. Given one of
+    these instead, it runs as a task on this loop, so that a process with
+    many connections, a fleet's, has one thread for all of them.
+    """
+    def __init__(self):
+        """
+        Class Initializer
+        """
+        Thread.__init__(self, daemon=True, name='asyncws-loop')
+        self.loop = asyncio.new_event_loop()
+
+    def run(self) -> None:
+        """Thread loop: run the event loop until shutdown()."""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def shutdown(self, timeout: float = 10) -> bool:
+        """
+        Stop the loop, once the clients on it are down, and wait for its
+        thread to exit.
+        :param timeout: max seconds to wait for the thread
+        :type timeout: float
+        :return: True when the thread is down
+        :rtype: bool
+        """
+        try:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        except RuntimeError:
+            pass                # the loop has already closed
+        if self.is_alive():
+            self.join(timeout)
+        return not self.is_alive()
+
+
+class AsyncWsClient(Thread):
+    """
+    Web Socket Client on asyncio
+    A drop-in alternative to WsClient: the same queues, the same ``ready`` /
+    ``stop`` / ``shutdown()`` surface, the same reconnect-with-a-fresh-token
+    behaviour, but event driven. WsClient's transmit pump looks at its queue
+    ten times a second, so every outbound event, a cancel acknowledgement
+    included, waits up to 100 ms and an idle machine still wakes constantly.
+    Here a frame is on the wire as soon as it is queued, and nothing runs
+    while there is nothing to do.
+
+    The event loop runs in this thread, or, given an EventLoopThread as
+    ``loop``, the client runs as a task on that loop, shared with other
+    clients, and ``is_alive()`` and ``join()`` follow the task. A bridge
+    thread blocks on ``q_tx``
+    and hands each message to the loop's send queue one at a time, so
+    ``send_wss_event`` callers on any thread are served unchanged, and
+    messages queued while the socket is down stay in ``q_tx``, where its
+    depth limit still applies. What is queued together goes out together,
+    packed by FrameCoalescer. Coroutines on the loop can ``await send()``
+    instead. ``on_receive`` is called as for WsClient.
+
+    The connection is pinged every ``ping_interval`` seconds and the
+    round trip kept in ``stats``; a ping unanswered within ``ping_timeout``
+    drops the connection and it is re-established, on the same terms as
+    WsClient's (see ReconnectPolicy). Needs the ``websockets`` package
+    (``pip install gfutilities[asyncio]``).
+    """
+    # Seconds of the first backoff wait, after the immediate retry.
+    reconnect_delay = 0.5
+    ping_interval = 30
+    ping_timeout = 10
+
+    def __init__(self, q_rx: Queue, q_tx: Queue, session=None, loop: EventLoopThread = None):
+        """
+        Class Initializer
+        :param q_rx: WSS RX Message Queue
+        :type q_rx: Queue
+        :param q_tx: WSS TX Message Queue
+        :type q_tx: Queue
+        :param session: authenticated requests Session used to refresh the
+            single-use ws_token before each reconnect, as for WsClient
+        :param loop: the shared loop to run on, None for a loop of its own
+        :type loop: EventLoopThread
+        """
+        if websockets is None:
+            raise ValueError('the asyncio client needs the websockets package')
+        self.msg_q_rx = q_rx
+        self.msg_q_tx = q_tx
+        self.stop = False
+        self.ready = False
+        self._session = session
+        self.ws = None
+        self._shared = loop
+        # The client's task on the shared loop.
+        self._task = None
+        self._loop = None
+        self._outbox = None
+        self._stopping = None
+        # The message being sent. If the connection drops first, it goes
+        # back to q_tx, with anything else taken for that connection.
+        self._held = None
+        # Set while the sender is connected and waiting: the bridge takes a
+        # frame from q_tx only then, so through an outage every frame stays
+        # in q_tx, under its latest-wins and terminal-first rules.
+        self._wanted = Event()
+        self._bridge_thread = None
+        # Frames of the coalescer's the loop has taken from the bridge.
+        self._frames_handed = 0
+        self._loop_ready = Event()
+        self.coalescer = FrameCoalescer()
+        self.on_receive = None
+        self.reconnect = ReconnectPolicy(base=self.reconnect_delay)
+        self.stats = {'connects': 0, 'sent': 0, 'pings': 0, 'ping_timeouts': 0,
+                      'rtt_last': None, 'rtt_min': None, 'rtt_max': None, 'rtt_mean': None}
+        Thread.__init__(self, daemon=True)
+        # As for WsClient: in the scope of the machine that made it.
+        self.run = scoped(self.run)
+
+    def start(self) -> None:
+        """Start the client: on a thread of its own, or on the shared loop."""
+        if self._shared is None:
+            Thread.start(self)
+            return
+        self._loop = self._shared.loop
+        # The task is made in a copy of this thread's context: the client
+        # runs in the scope of the machine that started it.
+        self._task = asyncio.run_coroutine_threadsafe(self._serve(), self._loop)
+
+    def is_alive(self) -> bool:
+        """True while the client runs, on its thread or as its task."""
+        if self._shared is None:
+            return Thread.is_alive(self)
+        return self._task is not None and not self._task.done()
+
+    def join(self, timeout: float = None) -> None:
+        """Wait for the client's thread, or its task, to end."""
+        if self._shared is None:
+            Thread.join(self, timeout)
+        elif self._task is not None:
+            concurrent.futures.wait([self._task], timeout)
+
+    def run(self) -> None:
+        """Thread loop: run the client's event loop until stop is requested."""
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+        logger.info('CLOSING')
+
+    async def _serve(self) -> None:
+        """The client as a task on the shared loop."""
+        try:
+            await self._main()
+        finally:
+            logger.info('CLOSING')
+
+    async def _main(self) -> None:
+        self._outbox = asyncio.Queue()
+        self._stopping = asyncio.Event()
+        self._loop_ready.set()
+        self._bridge_thread = Thread(target=scoped(self._bridge), daemon=True)
+        self._bridge_thread.start()
+        policy = self.reconnect
+        first = True
+        while not self.stop:
+            # As in WsClient: nothing that goes wrong in one attempt may end
+            # the client, or the machine goes quietly offline for good.
+            token = get_cfg('SESSION.WS_TOKEN')
+            try:
+                if not first and self._session is not None:
+                    if policy.needs_sign_in(token):
+                        policy.stats['sign_ins'] += 1
+                        # Lazy import: authentication imports the websocket module.
+                        from gfutilities.service.authentication import authenticate_machine
+                        logger.info('re-authenticating for a fresh ws_token')
+                        if not await self._loop.run_in_executor(None, scoped(authenticate_machine),
+                                                                self._session):
+                            logger.error('re-auth failed; will retry')
+                            policy.closed()
+                            if await self._sleep_or_stop(max(policy.next_delay(), policy.base)):
+                                break
+                            continue
+                        token = get_cfg('SESSION.WS_TOKEN')
+                    else:
+                        policy.stats['sign_ins_skipped'] += 1
+                first = False
+                await self._session_once(token)
+            except (OSError, asyncio.TimeoutError):
+                # Never reached the service: the token is still unused.
+                logger.exception('WS session attempt failed; will reconnect')
+            except Exception:
+                policy.presented(token)
+                logger.exception('WS session attempt failed; will reconnect')
+            self.ready = False
+            policy.closed()
+            if self.stop:
+                break
+            delay = policy.next_delay()
+            logger.info('RECONNECTING in %.1fs' % delay)
+            if delay and await self._sleep_or_stop(delay):
+                break
+
+    async def _session_once(self, token: str) -> None:
+        """One connection, from handshake to close."""
+        async with connect(get_cfg('SERVICE.STATUS_SERVICE_URL') + '/' + token,
+                           subprotocols=['glowforge'],
+                           user_agent_header=get_cfg('SESSION.USER_AGENT'),
+                           compression=None, ping_interval=None) as ws:
+            self.ws = ws
+            self.reconnect.connected(token)
+            self.stats['connects'] += 1
+            logger.info('RX-EVENT: ready')
+            record_open(get_cfg('SERVICE.STATUS_SERVICE_URL'))
+            self.ready = True
+            tasks = [asyncio.ensure_future(job) for job in
+                     (self._receiver(ws), self._sender(ws), self._pinger(ws), self._stopping.wait())]
+            try:
+                # Whichever ends first ends the connection: the socket closed,
+                # a ping went unanswered, or the client is stopping.
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                self.ready = False
+                self._wanted.clear()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                self._requeue()
+            logger.info('RX-EVENT: closed (%s, %s)' % (ws.close_code, ws.close_reason))
+
+    async def _receiver(self, ws) -> None:
+        async for message in ws:
+            if isinstance(message, (bytes, bytearray)):
+                logger.error('UNEXPECTED BINARY RX-EVENT (%s bytes)' % len(message))
+                continue
+            logger.debug(message)
+            record_rx(message)
+            for obj in split_frame(message):
+                peek_message(self.on_receive, obj)
+                self.msg_q_rx.put(obj)
+
+    async def _sender(self, ws) -> None:
+        while True:
+            if self._held is None:
+                self._wanted.set()
+                self._held = await self._outbox.get()
+            logger.info('TX-EVENT: ' + self._held.strip())
+            await ws.send(self._held)
+            record_tx(self._held)
+            self._held = None
+            self.stats['sent'] += 1
+
+    async def _pinger(self, ws) -> None:
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            start = time.monotonic()
+            pong = await ws.ping()
+            try:
+                await asyncio.wait_for(pong, self.ping_timeout)
+            except asyncio.TimeoutError:
+                self.stats['ping_timeouts'] += 1
+                logger.error('no pong within %ss; dropping the connection' % self.ping_timeout)
+                return
+            self._record_rtt(time.monotonic() - start)
+
+    def _record_rtt(self, rtt: float) -> None:
+        stats = self.stats
+        stats['pings'] += 1
+        stats['rtt_last'] = rtt
+        stats['rtt_min'] = rtt if stats['rtt_min'] is None else min(stats['rtt_min'], rtt)
+        stats['rtt_max'] = rtt if stats['rtt_max'] is None else max(stats['rtt_max'], rtt)
+        mean = stats['rtt_mean'] or 0.0
+        stats['rtt_mean'] = mean + (rtt - mean) / stats['pings']
+
+    async def _sleep_or_stop(self, secs: float) -> bool:
+        """Sleep up to secs seconds, returning True as soon as stop is set."""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), secs)
+        except asyncio.TimeoutError:
+            pass
+        return self.stop
+
+    async def send(self, msg: str) -> None:
+        """Queue a message from a coroutine on this client's loop; it goes
+        out as soon as the socket is open."""
+        await self._outbox.put(msg)
+
+    @property
+    def tx_pending(self) -> bool:
+        """True while anything queued to send has yet to go out: in q_tx,
+        in the coalescer, on its way to the loop, or waiting for the
+        sender."""
+        return (not self.msg_q_tx.empty() or self.coalescer.pending
+                or self.coalescer.stats['frames'] != self._frames_handed
+                or self._held is not None
+                or (self._outbox is not None and not self._outbox.empty()))
+
+    def _requeue(self) -> None:
+        """Put what was taken for a connection that has dropped back into
+        q_tx, where it is ordered against everything queued since."""
+        frames = [] if self._held is None else [self._held]
+        self._held = None
+        while not self._outbox.empty():
+            frames.append(self._outbox.get_nowait())
+        for frame in frames:
+            self._put_back(frame)
+
+    def _put_back(self, frame: str) -> None:
+        if isinstance(self.msg_q_tx, TxQueue):
+            self.msg_q_tx.requeue(frame)
+        else:
+            self.msg_q_tx.put(frame)
+
+    def _accept(self, frame: str, connects: int) -> None:
+        """On the loop: hand a frame the bridge took to the sender, or, when
+        the connection it was taken for has dropped since, put it back."""
+        self._frames_handed += 1
+        if self.ready and self.stats['connects'] == connects:
+            self._outbox.put_nowait(frame)
+            return
+        self._put_back(frame)
+        if self.ready and self._held is None:
+            # The sender of the new connection asked while the bridge held
+            # this frame, and the bridge cleared the request.
+            self._wanted.set()
+
+    def _wait_for_frame(self) -> bool:
+        """Block until q_tx has something to send, or shutdown() wakes the
+        bridge; False once the client is stopping."""
+        q = self.msg_q_tx
+        with q.not_empty:
+            while not q._qsize() and not self.stop:
+                q.not_empty.wait()
+        return not self.stop
+
+    def _bridge(self) -> None:
+        """Carry q_tx to the loop, a frame at a time: take one only when the
+        connected sender asks for it, and block, not poll, until it can;
+        shutdown() wakes it to exit."""
+        while True:
+            self._wanted.wait()
+            if self.stop:
+                return
+            connects = self.stats['connects']
+            if not self.coalescer.pending and not self._wait_for_frame():
+                return
+            frame = self.coalescer.next_frame(self.msg_q_tx)
+            if frame is None:
+                continue        # another consumer of q_tx was first
+            if self.stop:
+                self._frames_handed += 1
+                self._put_back(frame)
+                return
+            self._wanted.clear()
+            try:
+                self._loop.call_soon_threadsafe(self._accept, frame, connects)
+            except RuntimeError:
+                # The loop has closed: leave the frame for whoever is next.
+                self._frames_handed += 1
+                self._put_back(frame)
+                return
+
+    def shutdown(self, timeout: float = 10) -> bool:
+        """
+        Stop the client and wait for its thread to exit: request the loops
+        to stop, close any open socket and join the thread.
+        :param timeout: max seconds to wait for the thread
+        :type timeout: float
+        :return: True when the thread is down
+        :rtype: bool
+        """
+        self.stop = True
+        # Wake the bridge, wherever it waits, without putting anything in
+        # q_tx: the queue is the service's, and outlives this client.
+        self._wanted.set()
+        with self.msg_q_tx.not_empty:
+            self.msg_q_tx.not_empty.notify_all()
+        if self._loop_ready.wait(timeout if self.is_alive() else 0):
+            try:
+                self._loop.call_soon_threadsafe(self._stopping.set)
+            except RuntimeError:
+                pass            # the loop has already closed
+        if self.is_alive():
+            self.join(timeout)
+        return not self.is_alive()
+
+
+__all__ = ['AsyncWsClient', 'EventLoopThread']
@@ -6,6 +6,7 @@ https://community.openglow.org
 SPDX-License-Identifier:    MIT
 """
 import logging
+import time
 from requests import Session
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -49,6 +50,8 @@ def authenticate_machine(s: Session) -> bool:
         # the single-use ws_token verbatim.
         logger.debug('sign-in response received (keys: %s)' % sorted(rj.keys()))
         set_cfg('SESSION.WS_TOKEN', rj['ws_token'])
+        # How old the token is decides whether a reconnect can use it.
+        set_cfg('SESSION.WS_TOKEN_ISSUED', time.monotonic())
         set_cfg('SESSION.AUTH_TOKEN', rj['auth_token'])
         update_header(s, 'Authorization', "Bearer %s" % get_cfg('SESSION.AUTH_TOKEN'))
         logger.info('SUCCESS')
@@ -0,0 +1,265 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+from collections import deque
+import json
+import logging
+import os
+from threading import Event, Lock, Thread
+import time
+from typing import Callable, Union
+
+from gfutilities._common import *
+from gfutilities.configuration import get_cfg, use_scope
+from gfutilities.device.emulator import Emulator
+from gfutilities.service.asyncws import EventLoopThread
+from gfutilities.service.gfuiservice import GFUIService
+from gfutilities.service.websocket import TX_TERMINAL, TxQueue
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# The first serial of a fleet unless told otherwise. Eight digits, as a
+# machine's are.
+SERIAL_BASE = 90000000
+
+# Action timings kept per machine, newest last.
+_TIMING_HISTORY = 1024
+
+
+class _TimedTxQueue(TxQueue):
+    """A TxQueue that notes when each action's terminal event is queued."""
+    def __init__(self, on_terminal: Callable):
+        self._on_terminal = on_terminal
+        TxQueue.__init__(self)
+
+    def _put(self, item) -> None:
+        if isinstance(item, tuple) and len(item) == 3 and item[0] == TX_TERMINAL:
+            self._on_terminal(item[1])
+        TxQueue._put(self, item)
+
+
+class FleetMachine:
+    """
+    One machine of a fleet: its configuration scope, its service connector,
+    and the timings of the actions it has handled. An action is timed from
+    the moment its message arrives on the receive thread to the moment its
+    terminal event is queued to go out.
+    """
+    def __init__(self, index: int, serial: str, scope: dict):
+        self.index = index
+        self.serial = serial
+        self.scope = scope
+        self.service = None
+        self.connects = 0
+        self.timings = deque(maxlen=_TIMING_HISTORY)
+        self._received = {}
+        self._lock = Lock()
+
+    def received(self, raw: str) -> None:
+        """Receive-thread hook: note when an action arrives."""
+        now = time.monotonic()
+        if '"ready"' not in raw:
+            return
+        try:
+            msg = json.loads(raw)
+        except (ValueError, TypeError):
+            return
+        if isinstance(msg, dict) and msg.get('status') == 'ready' and msg.get('id') is not None:
+            with self._lock:
+                self._received[int(msg['id'])] = (now, msg.get('action_type'))
+
+    def terminal(self, action_id) -> None:
+        """TX-queue hook: an action's terminal event is on its way."""
+        now = time.monotonic()
+        try:
+            action_id = int(action_id)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            arrival = self._received.pop(action_id, None)
+        if arrival is not None:
+            self.timings.append({'action_type': arrival[1], 'latency': now - arrival[0],
+                                 'finished': now})
+
+
+class _FleetService(GFUIService):
+    """GFUIService that times its machine's actions for the fleet."""
+    def __init__(self, machine, member: FleetMachine, ws_loop: EventLoopThread = None):
+        GFUIService.__init__(self, machine, on_receive=member.received, ws_loop=ws_loop)
+        self.q_msg_tx = _TimedTxQueue(member.terminal)
+
+
+class Fleet:
+    """
+    Many emulated machines in one process
+    A load test needs hundreds of machines, and a machine per process is
+    hundreds of interpreters. Here each machine is a GFUIService with its
+    own machine object (an Emulator by default) on a thread of its own, and
+    its own configuration scope (see use_scope): a serial, a hostname, the
+    tokens it signs in for and every other value the machine keeps in the
+    configuration are its alone, while whatever the process has parsed is
+    shared by all. The WS client, transmit and action threads a machine
+    starts run in its scope too. With the asyncio client (SERVICE.WS_CLIENT)
+    the machines' connections are tasks on one event loop, in the machine's
+    scope each, rather than a loop and a thread each.
+
+    Machine ``n`` is serial ``serial_base + n`` and hostname ``FLEET-n``;
+    ``config`` adds to that - a dict for every machine, or a callable given
+    the index and serial that returns one. A machine's downloads go to a
+    directory of its own under EMULATOR.MOTION_DL_DIR. Machines are
+    started ``ramp`` seconds apart, so a fleet does not sign in all at once,
+    and one that loses its session connects again until the fleet stops.
+
+    ``summary()`` has the actions handled per second over the fleet's run
+    and the latency percentiles, over all and per action_type, from each
+    action's arrival to its terminal event being queued.
+    """
+    def __init__(self, size: int, config: Union[dict, Callable] = None, serial_base: int = SERIAL_BASE,
+                 machine: Callable = Emulator, ramp: float = 0.0):
+        """
+        Class Initializer
+        :param size: how many machines
+        :type size: int
+        :param config: configuration for every machine, or a callable
+            (index, serial) giving each its own
+        :type config: Union[dict, Callable]
+        :param serial_base: the first machine's serial
+        :type serial_base: int
+        :param machine: makes a machine (a BaseMachine), called in its scope
+        :type machine: Callable
+        :param ramp: seconds between machine starts
+        :type ramp: float
+        """
+        if size <= 0:
+            raise ValueError('a fleet needs at least one machine')
+        self.machines = []
+        for index in range(size):
+            serial = str(serial_base + index)
+            scope = {'MACHINE.SERIAL': serial, 'MACHINE.HOSTNAME': 'FLEET-%d' % index}
+            extra = config(index, serial) if callable(config) else config
+            scope.update(extra or {})
+            base = scope.get('EMULATOR.MOTION_DL_DIR', get_cfg('EMULATOR.MOTION_DL_DIR'))
+            if base:
+                scope['EMULATOR.MOTION_DL_DIR'] = os.path.join(base, serial)
+            self.machines.append(FleetMachine(index, serial, scope))
+        self._make_machine = machine
+        self.ramp = ramp
+        self._stop = Event()
+        self._threads = []
+        self._ws_loop = None
+        self._started = None
+        self._stopped = None
+
+    def start(self) -> 'Fleet':
+        """Start every machine, ``ramp`` seconds apart."""
+        self._started = time.monotonic()
+        if get_cfg('SERVICE.WS_CLIENT') == 'asyncio':
+            self._ws_loop = EventLoopThread()
+            self._ws_loop.start()
+        for member in self.machines:
+            if self._stop.is_set():
+                break
+            thread = Thread(target=self._run, args=(member,), daemon=True,
+                            name='fleet-%s' % member.serial)
+            thread.start()
+            self._threads.append(thread)
+            if self.ramp and self._stop.wait(self.ramp):
+                break
+        return self
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop every machine, and wait for them to shut down."""
+        self._stop.set()
+        for member in self.machines:
+            if member.service is not None:
+                member.service.request_stop()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        if self._ws_loop is not None:
+            self._ws_loop.shutdown(max(0.0, deadline - time.monotonic()))
+            self._ws_loop = None
+        self._stopped = time.monotonic()
+
+    def __enter__(self) -> 'Fleet':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @property
+    def connected(self) -> int:
+        """How many machines have a session up."""
+        return sum(1 for m in self.machines
+                   if m.service is not None and m.service._ws is not None and m.service._ws.ready)
+
+    def _run(self, member: FleetMachine) -> None:
+        """A machine's thread: connect, serve, connect again, until stopped."""
+        with use_scope(member.scope):
+            directory = get_cfg('EMULATOR.MOTION_DL_DIR')
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            machine = self._make_machine()
+            retry = 0.5
+            while not self._stop.is_set():
+                member.service = service = _FleetService(machine, member, self._ws_loop)
+                try:
+                    if not service.connect():
+                        logger.warning('machine %s could not connect; retrying' % member.serial)
+                        self._stop.wait(retry)
+                        retry = min(retry * 2, 30.0)
+                        continue
+                    retry = 0.5
+                    member.connects += 1
+                    if self._stop.is_set():
+                        service.request_stop()
+                    service.run()
+                except Exception:
+                    # One machine's failure is a data point, not the test's end.
+                    logger.exception('machine %s failed; reconnecting' % member.serial)
+                    self._stop.wait(retry)
+
+    def summary(self) -> dict:
+        """
+        Throughput and latency over the fleet's run so far.
+        :return: ``machines``, ``connected``, ``actions`` handled,
+            ``elapsed`` seconds, ``throughput`` in actions per second, and
+            ``latency`` ({'p50', 'p90', 'p99', 'max', 'mean'}, seconds) over
+            all actions and per action_type in ``by_action``
+        :rtype: dict
+        """
+        timings = [t for m in self.machines for t in list(m.timings)]
+        elapsed = None
+        if self._started is not None:
+            elapsed = (self._stopped or time.monotonic()) - self._started
+        by_action = {}
+        for t in timings:
+            by_action.setdefault(t['action_type'], []).append(t['latency'])
+        return {
+            'machines': len(self.machines),
+            'connected': self.connected,
+            'actions': len(timings),
+            'elapsed': elapsed,
+            'throughput': len(timings) / elapsed if elapsed else None,
+            'latency': _percentiles([t['latency'] for t in timings]),
+            'by_action': {action: dict(_percentiles(values), count=len(values))
+                          for action, values in by_action.items()},
+        }
+
+
+def _percentiles(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {'p50': None, 'p90': None, 'p99': None, 'max': None, 'mean': None}
+
+    def rank(p):
+        return values[min(len(values) - 1, max(0, -(-len(values) * p // 100) - 1))]
+    return {'p50': rank(50), 'p90': rank(90), 'p99': rank(99), 'max': values[-1],
+            'mean': sum(values) / len(values)}
+
+
+__all__ = ['Fleet', 'FleetMachine', 'SERIAL_BASE']
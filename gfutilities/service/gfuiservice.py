@@ -9,13 +9,14 @@ import logging
 import json
 import time
 from queue import Queue, Empty
+from typing import Callable
 
 from gfutilities._common import *
 from gfutilities.configuration import *
 from gfutilities.device.basemachine import BaseMachine
 from gfutilities.service.authentication import authenticate_machine
 from gfutilities.service.dispatch import dispatch_action
-from gfutilities.service.websocket import get_session, firmware_check, ws_connect
+from gfutilities.service.websocket import TxQueue, get_session, firmware_check, ws_connect
 
 logger = logging.getLogger(LOGGER_NAME)
 
@@ -25,17 +26,27 @@ class GFUIService:
     Glowforge UI Service Connector
     This connects to the servers specified in the configuration, and interfaces with the service.
     """
-    def __init__(self, machine: BaseMachine):
+    def __init__(self, machine: BaseMachine, on_receive: Callable = None, ws_loop=None):
         """
         Class Initialization
         Initialized WSS Queues, and configures logging.
+        :param machine: the machine to serve
+        :type machine: BaseMachine
+        :param on_receive: called on the WS receive thread with every message
+            before it is queued for run(), after a cancel in it has been
+            applied; it must be quick, as the next message waits on it
+        :type on_receive: Callable
+        :param ws_loop: an asyncws EventLoopThread for the asyncio client to
+            run on, shared with other services; None for a loop of its own
         """
         self.session = None
         self.q_msg_rx = Queue()
-        self.q_msg_tx = Queue()
+        self.q_msg_tx = TxQueue()
         self.q_capture = Queue()
         self._machine = machine
         self._ws = None
+        self.on_receive = on_receive
+        self.ws_loop = ws_loop
         self.stop = False
         logger.info('INITIALIZED')
 
@@ -62,14 +73,43 @@ class GFUIService:
         if get_cfg('FACTORY_FIRMWARE.CHECK'):
             firmware_check(self.session)
         # Establish WebSocket Connection. Pass the session so the client can
-        # re-sign-in for a fresh single-use ws_token on every reconnect.
+        # re-sign-in for a fresh single-use ws_token when a reconnect needs one.
         # Keep the client so run() can stop its thread when the session ends.
-        ws = ws_connect(self.q_msg_rx, self.q_msg_tx, self.session)
+        # Cancels are also picked out on the receive thread (_fast_cancel),
+        # so one for the running action lands without queueing.
+        ws = ws_connect(self.q_msg_rx, self.q_msg_tx, self.session, on_receive=self._received,
+                        loop=self.ws_loop)
         if not ws:
             return False
         self._ws = ws
         return True
 
+    def _received(self, raw: str) -> None:
+        """Receive-thread hook: the fast cancel, then on_receive."""
+        self._fast_cancel(raw)
+        if self.on_receive is not None:
+            self.on_receive(raw)
+
+    def _fast_cancel(self, raw: str) -> None:
+        """
+        Receive-thread hook: apply a cancel of the running action the moment
+        it arrives, rather than after the frames queued ahead of it and the
+        run loop's poll. Anything else, or a cancel of another action, is
+        left to dispatch as before.
+        :param raw: one message, as queued for run()
+        :type raw: str
+        """
+        received = time.monotonic()
+        # Cheap enough for every frame: only a cancel is worth decoding here.
+        if '"cancelled"' not in raw:
+            return
+        try:
+            msg = json.loads(raw)
+        except (ValueError, TypeError):
+            return
+        if isinstance(msg, dict) and msg.get('status') == 'cancelled':
+            self._machine.cancel_running(msg.get('id'), received=received)
+
     def run(self) -> None:
         """
         Processes messages from WSS service
@@ -125,15 +165,15 @@ class GFUIService:
 
     def _disconnect(self) -> None:
         """
-        Flush any final queued events to the service, then stop the WS
+        Flush any final queued events to the service - those the client
+        has taken from the queue but not sent yet too - then stop the WS
         client thread so nothing of the session outlives run().
         :return:
         """
         if self._ws is None:
             return
         deadline = time.monotonic() + 2
-        while (self._ws.ready and not self.q_msg_tx.empty()
-               and time.monotonic() < deadline):
+        while self._ws.ready and self._ws.tx_pending and time.monotonic() < deadline:
             time.sleep(0.05)
         if not self._ws.shutdown():
             logger.warning('WS client thread did not exit cleanly')
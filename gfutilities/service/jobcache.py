@@ -0,0 +1,304 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from threading import Lock
+import time
+from typing import Union
+from urllib.parse import urlsplit
+
+from gfutilities._common import *
+from gfutilities.configuration import get_cfg
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Bytes of job bodies kept on disk unless MOTION.CACHE_BYTES says otherwise.
+# Bodies are stored as the service compressed them, so this is dozens of
+# hours-long jobs.
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+_INDEX = 'index.json'
+
+# What is kept of a job's info besides its body: all that the download, the
+# header parse and the statistics pass produce.
+_KEPT = ('header_data', 'header_len', 'size', 'stats', 'laser')
+
+
+def _url_key(url: str) -> str:
+    """The job's address without its query: a presigned URL is signed afresh
+    for every action, while the object it names stays the same."""
+    parts = urlsplit(str(url))
+    return '%s://%s%s' % (parts.scheme, parts.netloc, parts.path)
+
+
+class JobCache:
+    """
+    Pulse jobs kept on disk between prints
+    A production run prints the same job over and over, and every print
+    downloads it again. This keeps each job's body, as the service sent it,
+    under the SHA-256 of its bytes, with what load_motion worked out from it:
+    the parsed header, with its bytes, ``size`` (the program size) and the
+    step and laser statistics. A job already here costs neither the header
+    parse, nor the statistics pass, nor, once the service confirms it
+    unchanged, the download.
+
+    Jobs are found two ways. By address: the job's URL less its query (the
+    signature of a presigned URL changes every time), with the ETag or
+    Last-Modified the service gave, which ``conditional()`` turns into the
+    headers of a conditional GET; a 304 answers from here. By content: a
+    body downloaded under a new address that hashes to one already kept is
+    the same job, and is linked to its address without being stored twice.
+
+    The bodies share a budget of ``max_bytes``. Past it the least recently
+    used are deleted. Nothing is trusted from disk without a check: a body
+    whose bytes no longer hash to its name is dropped and reported missing.
+    The index is rewritten whole, atomically, after every change, a job
+    being used included, so the order of eviction survives a restart.
+    """
+    def __init__(self, directory: Union[str, Path], max_bytes: int = DEFAULT_CACHE_BYTES):
+        """
+        Class Initializer
+        :param directory: where the cache lives; created if missing
+        :type directory: Union[str, Path]
+        :param max_bytes: budget for the bodies kept, in bytes
+        :type max_bytes: int
+        """
+        if max_bytes <= 0:
+            raise ValueError('max_bytes must be positive')
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self.stats = {'hits': 0, 'content_hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._urls, self._bodies = self._read_index()
+
+    def _read_index(self) -> tuple:
+        try:
+            with open(self.directory / _INDEX) as f:
+                index = json.load(f)
+            return index['urls'], index['bodies']
+        except FileNotFoundError:
+            return {}, {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # An index that cannot be read costs the cache, never a job.
+            logger.warning('job cache index unreadable, starting empty: %s' % e)
+            return {}, {}
+
+    def _write_index(self) -> None:
+        tmp = self.directory / (_INDEX + '.tmp')
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'urls': self._urls, 'bodies': self._bodies}, f)
+            os.replace(tmp, self.directory / _INDEX)
+        except OSError as e:
+            logger.warning('job cache index not written: %s' % e)
+
+    def _path(self, sha: str) -> Path:
+        return self.directory / (sha + '.puls')
+
+    @property
+    def size(self) -> int:
+        """Bytes of bodies kept."""
+        with self._lock:
+            return sum(b['bytes'] for b in self._bodies.values())
+
+    def conditional(self, url: str) -> dict:
+        """
+        Headers for a conditional GET of a job kept under this address.
+        :param url: the job's URL
+        :type url: str
+        :return: If-None-Match / If-Modified-Since, or empty when the job is
+            not kept or the service gave no validator for it
+        :rtype: dict
+        """
+        with self._lock:
+            entry = self._urls.get(_url_key(url))
+            if entry is None or entry['sha'] not in self._bodies:
+                return {}
+            if entry.get('etag'):
+                return {'If-None-Match': entry['etag']}
+            if entry.get('last_modified'):
+                return {'If-Modified-Since': entry['last_modified']}
+            return {}
+
+    def get(self, url: str) -> Union[dict, None]:
+        """
+        The job kept under an address, once the service has said it has not
+        changed (a 304).
+        :param url: the job's URL
+        :type url: str
+        :return: the kept info, with the body under ``body``; None when it
+            is gone
+        :rtype: Union[dict, None]
+        """
+        with self._lock:
+            entry = self._urls.get(_url_key(url))
+            job = self._load(entry['sha']) if entry else None
+            self.stats['hits' if job else 'misses'] += 1
+            if job:
+                self._write_index()
+            return job
+
+    def match(self, url: str, body: bytes, etag: str = None, last_modified: str = None) -> Union[dict, None]:
+        """
+        The kept job a freshly downloaded body is, if any. A match is linked
+        to ``url`` so the next fetch from there can be conditional.
+        :param url: the address the body came from
+        :type url: str
+        :param body: the body as downloaded
+        :type body: bytes
+        :param etag: the ETag it came with
+        :param last_modified: the Last-Modified it came with
+        :return: the kept info, with the body under ``body``, or None
+        :rtype: Union[dict, None]
+        """
+        sha = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            if sha not in self._bodies:
+                return None
+            job = self._load(sha)
+            if job is None:
+                return None
+            self.stats['content_hits'] += 1
+            self._link(url, sha, etag, last_modified)
+            self._write_index()
+            return job
+
+    def store(self, url: str, body: bytes, info: dict, etag: str = None,
+              last_modified: str = None, header_raw: bytes = None) -> Union[str, None]:
+        """
+        Keep a job and what load_motion worked out from it.
+        :param url: the address it came from
+        :type url: str
+        :param body: the body as downloaded
+        :type body: bytes
+        :param info: load_motion's info for it
+        :type info: dict
+        :param etag: the ETag it came with
+        :param last_modified: the Last-Modified it came with
+        :param header_raw: the header's bytes as they appear in the stream
+        :type header_raw: bytes
+        :return: the body's SHA-256, or None when it was not kept
+        :rtype: Union[str, None]
+        """
+        body = bytes(body)
+        if len(body) > self.max_bytes:
+            logger.info('job of %d bytes is past the cache budget; not kept' % len(body))
+            return None
+        sha = hashlib.sha256(body).hexdigest()
+        meta = {key: info.get(key) for key in _KEPT}
+        meta['header_raw'] = header_raw.hex() if header_raw else None
+        with self._lock:
+            try:
+                if sha not in self._bodies:
+                    self._write_file(self._path(sha), body)
+                with open(self._path(sha).with_suffix('.json'), 'w') as f:
+                    json.dump(meta, f)
+            except OSError as e:
+                logger.warning('job not cached: %s' % e)
+                return None
+            self._bodies[sha] = {'bytes': len(body), 'used': time.time()}
+            self._link(url, sha, etag, last_modified)
+            self.stats['stored'] += 1
+            self._evict()
+            self._write_index()
+        logger.info('job cached: %d bytes as %s' % (len(body), sha[:12]))
+        return sha
+
+    @staticmethod
+    def _write_file(path: Path, data: bytes) -> None:
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _link(self, url: str, sha: str, etag: str, last_modified: str) -> None:
+        self._urls[_url_key(url)] = {'sha': sha, 'etag': etag, 'last_modified': last_modified}
+
+    def _load(self, sha: str) -> Union[dict, None]:
+        """A kept job, checked against its name, and marked used."""
+        if sha not in self._bodies:
+            return None
+        try:
+            body = self._path(sha).read_bytes()
+            with open(self._path(sha).with_suffix('.json')) as f:
+                job = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning('cached job %s unreadable: %s' % (sha[:12], e))
+            self._drop(sha)
+            self._write_index()
+            return None
+        if hashlib.sha256(body).hexdigest() != sha:
+            logger.warning('cached job %s is corrupt; dropped' % sha[:12])
+            self._drop(sha)
+            self._write_index()
+            return None
+        if job.get('laser'):
+            # JSON keys are strings; the levels are power levels.
+            job['laser']['levels'] = {int(k): v for k, v in job['laser']['levels'].items()}
+        # Kept as hex; missing from a job kept before headers were.
+        job['header_raw'] = bytes.fromhex(job['header_raw']) if job.get('header_raw') else None
+        self._bodies[sha]['used'] = time.time()
+        job['body'] = body
+        return job
+
+    def _drop(self, sha: str) -> None:
+        self._bodies.pop(sha, None)
+        for key in [k for k, e in self._urls.items() if e['sha'] == sha]:
+            del self._urls[key]
+        for path in (self._path(sha), self._path(sha).with_suffix('.json')):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning('cached job file not removed: %s' % e)
+
+    def _evict(self) -> None:
+        total = sum(b['bytes'] for b in self._bodies.values())
+        for sha in sorted(self._bodies, key=lambda k: self._bodies[k]['used']):
+            if total <= self.max_bytes:
+                break
+            total -= self._bodies[sha]['bytes']
+            self._drop(sha)
+            self.stats['evicted'] += 1
+
+
+# One cache per directory: machines configured with the same one share it,
+# and its lock, however their scopes interleave.
+_job_caches = {}
+_job_cache_lock = Lock()
+
+
+def job_cache() -> Union[JobCache, None]:
+    """
+    The cache named by MOTION.CACHE_DIR, budgeted at MOTION.CACHE_BYTES;
+    None when no directory is configured.
+    :return: the shared cache
+    :rtype: Union[JobCache, None]
+    """
+    directory = get_cfg('MOTION.CACHE_DIR')
+    if not directory:
+        return None
+    directory = Path(directory)
+    with _job_cache_lock:
+        cache = _job_caches.get(directory)
+        if cache is None:
+            try:
+                cache = JobCache(directory, int(get_cfg('MOTION.CACHE_BYTES') or DEFAULT_CACHE_BYTES))
+            except (OSError, ValueError) as e:
+                logger.warning('job cache disabled: %s' % e)
+                return None
+            _job_caches[directory] = cache
+        return cache
+
+
+__all__ = ['DEFAULT_CACHE_BYTES', 'JobCache', 'job_cache']
@@ -0,0 +1,589 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import asyncio
+from collections import deque
+import hashlib
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+import json
+import logging
+from math import ceil
+import re
+import secrets
+from threading import Event, Lock, Thread
+import time
+from typing import Union
+from urllib.parse import parse_qs, urlsplit
+
+from gfutilities._common import *
+from gfutilities.configuration import get_cfg, set_cfg
+from gfutilities.puls.planner import MotionSegment, write_motion
+from gfutilities.service.websocket import split_frame
+
+try:
+    import websockets
+    from websockets.asyncio.server import serve
+except ImportError:
+    websockets = None
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# What the service runs a machine through after it connects: the settings
+# report, the four lid images of homing, the focus hunt, then a print.
+DEFAULT_SCRIPT = ('settings', 'lid_image', 'lid_image', 'lid_image', 'lid_image', 'hunt', 'print')
+
+# Seconds the service waits for an action's terminal event before it gives
+# up on it and moves on.
+ACTION_TIMEOUT = 30.0
+
+# Events kept in ``events``, newest last.
+_EVENT_HISTORY = 4096
+
+_TERMINAL = ('completed', 'cancelled', 'failed')
+
+_BLOCK = 65536
+
+# A Range header the job host serves: a single byte range.
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def make_job(segments, compress: bool = True, **kwargs) -> bytes:
+    """
+    A pulse file for a path, as the service would serve it.
+    :param segments: the path, as for write_motion
+    :param compress: gzip it, as the service does
+    :param kwargs: further write_motion arguments
+    :return: the file
+    :rtype: bytes
+    """
+    out = BytesIO()
+    write_motion(segments, out, compress=compress, vectorized=False, **kwargs)
+    return out.getvalue()
+
+
+def default_jobs() -> dict:
+    """The jobs DEFAULT_SCRIPT runs: a short focus move for ``hunt`` and a
+    few seconds of raster for ``print``. The same bytes every time."""
+    raster = []
+    for line in range(12):
+        y = line * 40
+        raster += [MotionSegment(0 if line % 2 else 3000, y),
+                   MotionSegment(3000 if line % 2 else 0, y, power=64)]
+    return {'hunt': make_job([MotionSegment(0, 1500), MotionSegment(0, 0)]),
+            'print': make_job(raster)}
+
+
+class _Machine:
+    """One machine's run through the script: where it is, and the socket
+    it is on. A reconnect picks up where the last connection left off."""
+    def __init__(self, serial: str, script: list):
+        self.serial = serial
+        self.script = script
+        self.position = 0
+        self.conn = None
+        self.connected = asyncio.Event()
+        self.pending = None
+        self.terminal = None
+        self.task = None
+        self.started = None
+        self.finished = None
+
+
+class MockService:
+    """
+    The Glowforge service on localhost
+    Everything a machine talks to, offline: the app server's
+    ``/machines/sign_in`` and ``/update/current``, the storage host's pulse
+    files (gzip, with ETag, Range and If-Range, and 304 for a conditional
+    GET) and presigned image uploads, and the status service's WebSocket.
+    Point a machine at it with ``configure()``, and it is put through
+    ``script`` the way the service does it: one action at a time, each
+    sent ``ready`` and the next only once the machine has sent the
+    terminal event (``<action>:completed``, ``:cancelled`` or ``:failed``)
+    of the last, or ``action_timeout`` has passed.
+
+    A script entry is an action_type, or a dict of the fields of the action
+    message. A puls action runs the job of ``jobs`` named by its ``job``
+    field, by default its action_type; an image action is given a presigned
+    ``endpoint`` unless its ``endpoint`` is False, when it falls back to the
+    legacy upload. ``cancel_after`` sends the action's cancel that many
+    seconds after the action itself.
+
+    One service serves a fleet: each serial that signs in gets its own
+    run of the script, and ws_tokens are single-use, as they are live. Every
+    action is timed from its send: to the machine's first event for it
+    (``first``), to its terminal event (``terminal``), and from its cancel,
+    when it had one, to the terminal event (``cancel``). ``results`` has a
+    dict per action, ``summary()`` the throughput and latencies. The status
+    service needs the ``websockets`` package (``pip install
+    gfutilities[asyncio]``).
+    """
+    def __init__(self, script=DEFAULT_SCRIPT, jobs: dict = None, password: str = None,
+                 firmware_version: str = None, action_timeout: float = ACTION_TIMEOUT,
+                 host: str = '127.0.0.1'):
+        """
+        Class Initializer
+        :param script: the actions each machine is run through
+        :param jobs: pulse files served, by name; default_jobs() when None
+        :type jobs: dict
+        :param password: the password every machine must sign in with; any
+            when None
+        :type password: str
+        :param firmware_version: advertised by /update/current; the tested
+            baseline (FACTORY_FIRMWARE.FW_VERSION) when None
+        :type firmware_version: str
+        :param action_timeout: seconds to wait for an action's terminal event
+        :type action_timeout: float
+        :param host: address to listen on
+        :type host: str
+        """
+        if websockets is None:
+            raise ValueError('the mock status service needs the websockets package')
+        self.script = [{'action_type': s} if isinstance(s, str) else dict(s) for s in script]
+        self.jobs = default_jobs() if jobs is None else dict(jobs)
+        self.password = password
+        self.firmware_version = firmware_version
+        self.action_timeout = action_timeout
+        self.host = host
+        self.results = []
+        self.events = deque(maxlen=_EVENT_HISTORY)
+        self.uploads = {}
+        self.stats = {'sign_ins': 0, 'sign_ins_refused': 0, 'ws_connects': 0, 'ws_refused': 0,
+                      'job_requests': 0, 'job_bytes': 0, 'not_modified': 0, 'uploads': 0,
+                      'uploads_refused': 0}
+        self._lock = Lock()
+        self._ws_tokens = {}
+        self._auth_tokens = {}
+        self._signatures = {}
+        self._machines = {}
+        self._action_id = 1000
+        self._done = Event()
+        self._http = None
+        self._loop = None
+        self._stop = None
+        self._ws_thread = None
+        self._started = Event()
+        self.ws_port = None
+
+    # ---- lifecycle ---------------------------------------------------------
+
+    def start(self) -> 'MockService':
+        """Start listening: the HTTP server (app server and storage host in
+        one) and the status service, each on a port of its own."""
+        self._http = ThreadingHTTPServer((self.host, 0), _Handler)
+        self._http.daemon_threads = True
+        self._http.mock = self
+        Thread(target=self._http.serve_forever, args=(0.05,), daemon=True).start()
+        self._loop = asyncio.new_event_loop()
+        self._ws_thread = Thread(target=self._run, daemon=True)
+        self._ws_thread.start()
+        if not self._started.wait(5):
+            raise RuntimeError('mock status service did not start')
+        logger.info('mock service on %s and %s' % (self.server_url, self.status_url))
+        return self
+
+    def stop(self) -> None:
+        """Stop listening and drop every connection."""
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._ws_thread.join(5)
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+
+    def __enter__(self) -> 'MockService':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @property
+    def server_url(self) -> str:
+        """What SERVICE.SERVER_URL is, for a machine of this service."""
+        return 'http://%s:%d' % (self.host, self._http.server_port)
+
+    @property
+    def status_url(self) -> str:
+        """What SERVICE.STATUS_SERVICE_URL is, for a machine of this service."""
+        return 'ws://%s:%d' % (self.host, self.ws_port)
+
+    def configure(self, serial: str = None, password: str = None) -> None:
+        """
+        Point this process's machine at the mock.
+        :param serial: MACHINE.SERIAL to sign in with, when given
+        :param password: MACHINE.PASSWORD to sign in with, when given
+        """
+        set_cfg('SERVICE.SERVER_URL', self.server_url)
+        set_cfg('SERVICE.STATUS_SERVICE_URL', self.status_url)
+        if serial is not None:
+            set_cfg('MACHINE.SERIAL', serial)
+        if password is not None:
+            set_cfg('MACHINE.PASSWORD', password)
+
+    def wait(self, machines: int = 1, timeout: float = None) -> bool:
+        """
+        Wait for ``machines`` machines to finish the script.
+        :param machines: how many
+        :param timeout: seconds to wait at most; forever when None
+        :return: whether they did
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                done = sum(1 for m in self._machines.values() if m.finished is not None)
+                self._done.clear()
+            if done >= machines:
+                return True
+            left = None if deadline is None else deadline - time.monotonic()
+            if left is not None and left <= 0:
+                return False
+            self._done.wait(left)
+
+    def summary(self) -> dict:
+        """
+        Throughput and latency over the actions run so far.
+        ``elapsed`` runs from the first script started to the last one
+        finished, and ``throughput`` is actions per second over it. Per
+        action_type: how many, how many completed, and the mean, 95th
+        percentile and worst of ``first`` and ``terminal``.
+        :return: the summary
+        :rtype: dict
+        """
+        with self._lock:
+            results = list(self.results)
+            runs = [(m.started, m.finished) for m in self._machines.values() if m.started]
+        elapsed = None
+        if runs:
+            end = max(f if f is not None else time.monotonic() for _, f in runs)
+            elapsed = end - min(s for s, _ in runs)
+        by_action = {}
+        for r in results:
+            by_action.setdefault(r['action_type'], []).append(r)
+        return {
+            'machines': len(runs),
+            'actions': len(results),
+            'completed': sum(1 for r in results if r['outcome'] == 'completed'),
+            'elapsed': elapsed,
+            'throughput': len(results) / elapsed if elapsed else None,
+            'by_action': {action: {'count': len(rs),
+                                   'completed': sum(1 for r in rs if r['outcome'] == 'completed'),
+                                   'first': _spread([r['first'] for r in rs]),
+                                   'terminal': _spread([r['terminal'] for r in rs])}
+                          for action, rs in by_action.items()},
+        }
+
+    # ---- HTTP --------------------------------------------------------------
+
+    def _sign_in(self, form: dict) -> Union[dict, None]:
+        serial = form.get('serial', [''])[0]
+        password = form.get('password', [''])[0]
+        with self._lock:
+            if not serial or (self.password is not None and password != self.password):
+                self.stats['sign_ins_refused'] += 1
+                return None
+            self.stats['sign_ins'] += 1
+            ws_token, auth_token = secrets.token_hex(16), secrets.token_hex(16)
+            self._ws_tokens[ws_token] = serial
+            self._auth_tokens[auth_token] = serial
+        return {'ws_token': ws_token, 'auth_token': auth_token}
+
+    def _authorized(self, header: Union[str, None]) -> bool:
+        if not header or not header.startswith('Bearer '):
+            return False
+        with self._lock:
+            return header[7:] in self._auth_tokens
+
+    def _job_url(self, name: str) -> str:
+        # Signed afresh for each action, as a presigned URL is.
+        return '%s/jobs/%s.puls?X-Signature=%s' % (self.server_url, name, secrets.token_hex(8))
+
+    def _upload_url(self, action_id: int) -> str:
+        path = '/upload/%d.jpg' % action_id
+        signature = secrets.token_hex(8)
+        with self._lock:
+            self._signatures[path] = signature
+        return '%s%s?X-Signature=%s' % (self.server_url, path, signature)
+
+    def _accept_upload(self, path: str, query: dict, body: bytes) -> bool:
+        with self._lock:
+            if self._signatures.get(path) != query.get('X-Signature', [None])[0]:
+                self.stats['uploads_refused'] += 1
+                return False
+            self.stats['uploads'] += 1
+            self.uploads[path] = body
+            return True
+
+    # ---- status service ----------------------------------------------------
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+
+    async def _serve(self) -> None:
+        self._stop = asyncio.Event()
+        async with serve(self._session, self.host, 0, subprotocols=['glowforge'],
+                         process_request=self._check_token) as server:
+            self.ws_port = server.sockets[0].getsockname()[1]
+            self._started.set()
+            await self._stop.wait()
+
+    def _check_token(self, conn, request):
+        """Refuse the handshake for a ws_token that was never issued, or
+        has been used already."""
+        with self._lock:
+            serial = self._ws_tokens.pop(request.path.lstrip('/'), None)
+            if serial is None:
+                self.stats['ws_refused'] += 1
+                return conn.respond(HTTPStatus.UNAUTHORIZED, 'unknown or spent ws_token\n')
+            self.stats['ws_connects'] += 1
+        conn.serial = serial
+        return None
+
+    async def _session(self, conn) -> None:
+        with self._lock:
+            machine = self._machines.get(conn.serial)
+            if machine is None:
+                machine = self._machines[conn.serial] = _Machine(conn.serial, self.script)
+        machine.conn = conn
+        machine.connected.set()
+        if machine.task is None:
+            machine.task = asyncio.ensure_future(self._run_script(machine))
+        try:
+            async for message in conn:
+                self._receive(machine, message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if machine.conn is conn:
+                machine.connected.clear()
+
+    async def _send(self, machine: _Machine, msg: dict) -> None:
+        """Send to the machine, on whichever connection it is on now,
+        waiting out a reconnect."""
+        text = json.dumps(msg)
+        while True:
+            await machine.connected.wait()
+            try:
+                await machine.conn.send(text)
+                return
+            except websockets.ConnectionClosed:
+                machine.connected.clear()
+
+    async def _run_script(self, machine: _Machine) -> None:
+        machine.started = time.monotonic()
+        while machine.position < len(machine.script):
+            await self._run_action(machine, machine.script[machine.position])
+            machine.position += 1
+        machine.finished = time.monotonic()
+        logger.info('machine %s finished the script' % machine.serial)
+        self._done.set()
+
+    async def _run_action(self, machine: _Machine, step: dict) -> None:
+        with self._lock:
+            self._action_id += 1
+            action_id = self._action_id
+        msg = {'id': action_id, 'status': 'ready'}
+        msg.update(step)
+        action = msg['action_type']
+        job = msg.pop('job', action)
+        cancel_after = msg.pop('cancel_after', None)
+        if action in ('hunt', 'motion', 'print'):
+            msg.setdefault('motion_url', self._job_url(job))
+        if action.endswith('_image'):
+            if msg.get('endpoint') is False:
+                del msg['endpoint']
+            else:
+                msg.setdefault('endpoint', self._upload_url(action_id))
+        result = {'serial': machine.serial, 'id': action_id, 'action_type': action,
+                  'sent': time.monotonic(), 'first': None, 'terminal': None, 'cancel': None,
+                  'cancelled_at': None, 'outcome': None, 'events': 0}
+        machine.pending = result
+        machine.terminal = asyncio.get_running_loop().create_future()
+        await self._send(machine, msg)
+        canceller = None
+        if cancel_after is not None:
+            canceller = asyncio.ensure_future(self._cancel(machine, msg, result, cancel_after))
+        try:
+            await asyncio.wait_for(machine.terminal, self.action_timeout)
+        except asyncio.TimeoutError:
+            result['outcome'] = 'timeout'
+            logger.warning('machine %s: no terminal event for %s [%s]'
+                           % (machine.serial, action, action_id))
+        finally:
+            if canceller is not None:
+                canceller.cancel()
+            machine.pending = None
+        del result['cancelled_at']
+        with self._lock:
+            self.results.append(result)
+
+    async def _cancel(self, machine: _Machine, msg: dict, result: dict, delay: float) -> None:
+        await asyncio.sleep(delay)
+        result['cancelled_at'] = time.monotonic()
+        await self._send(machine, {'id': msg['id'], 'action_type': msg['action_type'],
+                                   'status': 'cancelled'})
+
+    def _receive(self, machine: _Machine, message: str) -> None:
+        now = time.monotonic()
+        for line in split_frame(message):
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                logger.warning('machine %s sent an unparseable frame' % machine.serial)
+                continue
+            self.events.append((now, machine.serial, obj))
+            pending = machine.pending
+            if pending is None or obj.get('action_id') != pending['id']:
+                continue
+            pending['events'] += 1
+            if pending['first'] is None:
+                pending['first'] = now - pending['sent']
+            action, _, outcome = str(obj.get('event', '')).rpartition(':')
+            if action == pending['action_type'] and outcome in _TERMINAL:
+                pending['terminal'] = now - pending['sent']
+                pending['outcome'] = outcome
+                if pending['cancelled_at'] is not None:
+                    pending['cancel'] = now - pending['cancelled_at']
+                if not machine.terminal.done():
+                    machine.terminal.set_result(outcome)
+
+
+def _spread(values: list) -> dict:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {'mean': None, 'p95': None, 'max': None}
+    return {'mean': sum(values) / len(values),
+            'p95': values[max(0, ceil(0.95 * len(values)) - 1)],
+            'max': values[-1]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """The app server and the storage host. Connections are kept alive."""
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status: int, body: bytes = b'', headers: dict = None) -> None:
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _json(self, obj: dict) -> None:
+        self._reply(200, json.dumps(obj).encode(), {'Content-Type': 'application/json'})
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def do_POST(self) -> None:
+        mock = self.server.mock
+        path = urlsplit(self.path).path
+        body = self._body()
+        if path == '/machines/sign_in':
+            tokens = mock._sign_in(parse_qs(body.decode('latin-1')))
+            if tokens is None:
+                self._reply(401)
+            else:
+                self._json(tokens)
+        elif path.startswith('/api/machines/'):
+            # The pre-2.6.0 image upload, on the app server's credentials.
+            if not mock._authorized(self.headers.get('Authorization')):
+                self._reply(401)
+                return
+            with mock._lock:
+                mock.stats['uploads'] += 1
+                mock.uploads[path] = body
+            self._reply(200)
+        else:
+            self._reply(404)
+
+    def do_PUT(self) -> None:
+        mock = self.server.mock
+        parts = urlsplit(self.path)
+        body = self._body()
+        # A presigned URL carries its own credentials; storage rejects a
+        # request that brings others.
+        if self.headers.get('Authorization') or not mock._accept_upload(
+                parts.path, parse_qs(parts.query), body):
+            self._reply(403)
+        else:
+            self._reply(200)
+
+    def do_GET(self) -> None:
+        mock = self.server.mock
+        path = urlsplit(self.path).path
+        if path == '/update/current':
+            if not mock._authorized(self.headers.get('Authorization')):
+                self._reply(401)
+                return
+            version = mock.firmware_version or get_cfg('FACTORY_FIRMWARE.FW_VERSION')
+            self._json({'version': version,
+                        'download_url': '%s/firmware/%s.fw' % (mock.server_url, version)})
+        elif path.startswith('/jobs/') and path.endswith('.puls'):
+            body = mock.jobs.get(path[len('/jobs/'):-len('.puls')])
+            if body is None:
+                self._reply(404)
+            else:
+                self._job(mock, body)
+        else:
+            self._reply(404)
+
+    def _job(self, mock: MockService, body: bytes) -> None:
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        with mock._lock:
+            mock.stats['job_requests'] += 1
+        if self.headers.get('If-None-Match') == etag:
+            with mock._lock:
+                mock.stats['not_modified'] += 1
+            self._reply(304, headers={'ETag': etag})
+            return
+        start, end = 0, len(body) - 1
+        spec = self.headers.get('Range')
+        if spec and self.headers.get('If-Range', etag) == etag:
+            # One range, first-last, first- or -suffix: all a machine asks
+            # for. Anything else is refused rather than guessed at.
+            match = _RANGE.match(spec.strip())
+            if not match or not any(match.groups()):
+                self._reply(416, headers={'Content-Range': 'bytes */%d' % len(body)})
+                return
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(end, int(last)) if last else end
+            else:
+                start = max(0, len(body) - int(last))
+            if start > end:
+                self._reply(416, headers={'Content-Range': 'bytes */%d' % len(body)})
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(body)))
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        try:
+            for at in range(start, end + 1, _BLOCK):
+                piece = body[at:min(at + _BLOCK, end + 1)]
+                self.wfile.write(piece)
+                with mock._lock:
+                    mock.stats['job_bytes'] += len(piece)
+        except OSError:
+            pass                # the machine read what it wanted and left
+
+    def log_message(self, *args) -> None:
+        logger.debug('mock service: ' + args[0] % args[1:])
+
+
+__all__ = ['ACTION_TIMEOUT', 'DEFAULT_SCRIPT', 'MockService', 'default_jobs', 'make_job']
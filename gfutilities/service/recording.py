@@ -0,0 +1,338 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import hashlib
+from io import BytesIO
+import json
+import logging
+import struct
+from threading import Lock
+import time
+from typing import Iterator, NamedTuple, Union
+from urllib.parse import urlsplit
+
+from urllib3 import HTTPResponse
+
+from gfutilities._common import *
+from gfutilities.configuration import get_cfg
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# First bytes of every recording; the digit is the format's version.
+MAGIC = b'GFREC1\n'
+
+# Record kinds.
+REC_SESSION = 0     # the recording's header: where the machine was pointed
+REC_RX = 1          # a WSS text frame from the service, as received
+REC_TX = 2          # a WSS text frame to the service, as sent
+REC_HTTP = 3        # an HTTP request and its response
+REC_OPEN = 4        # the WSS handshake completed
+_REC_BLOB = 5       # a large body, written once and referred to by hash
+
+# Every record: kind, seconds since the recording started, then the lengths
+# of its JSON meta and its body, which follow it.
+_RECORD = struct.Struct('<BdII')
+
+# HTTP bodies longer than this are stored once per recording, however many
+# times they are requested or uploaded: the same job downloaded for a
+# retry, or every print of one job, costs its bytes once.
+BLOB_MIN = 4096
+
+# The request headers kept: those that change what the response is. The
+# rest, Authorization first, stay out of the log.
+_REQUEST_HEADERS = ('Content-Type', 'Range', 'If-Range', 'If-None-Match', 'If-Modified-Since')
+
+# Response headers that describe the connection rather than the body, and
+# the cookies, which are credentials.
+_DROPPED_RESPONSE_HEADERS = ('transfer-encoding', 'content-length', 'connection', 'keep-alive', 'set-cookie')
+
+# Fields of a sign-in response that are credentials.
+_TOKENS = ('ws_token', 'auth_token')
+
+_active = None
+_active_lock = Lock()
+
+
+class Record(NamedTuple):
+    """
+    One record of a recording.
+    ``meta`` is the record's JSON header; ``body`` is a frame's text, or
+    for REC_HTTP the request body followed by the response body (see
+    ``request`` and ``response``).
+    """
+    kind: int
+    time: float
+    meta: dict
+    body: bytes
+
+    @property
+    def text(self) -> str:
+        """A frame, as the str it was sent or received as."""
+        return self.body.decode('utf-8')
+
+    @property
+    def request(self) -> bytes:
+        return self.body[:self.meta.get('request_bytes', 0)]
+
+    @property
+    def response(self) -> bytes:
+        return self.body[self.meta.get('request_bytes', 0):]
+
+
+class SessionRecorder:
+    """
+    Records a machine's service traffic to an append-only log
+    Every WSS frame in and out and every HTTP request the machine makes,
+    sign-in, firmware probe, job downloads and image uploads included, with
+    the response it got, each stamped with its time from the start of the
+    recording. Replaying the log (see gfutilities.service.replay) puts a
+    machine through the same session again, without the service.
+
+    A recording is a MAGIC line followed by records of a fixed struct
+    header, a JSON meta and a body. Each record is flushed as it is written,
+    so the recording of a session that crashed reads up to its last
+    record. Long HTTP bodies are stored once, by hash (see BLOB_MIN).
+
+    Credentials are not recorded: no request headers but those that select
+    the response, and the sign-in's password and tokens are replaced. The
+    presigned URLs in the frames are kept, as replaying needs them; they
+    expire as they do live.
+
+    One recorder is active at a time, for the whole process; records carry
+    MACHINE.SERIAL, so the traffic of a fleet can be told apart. While it
+    records, streamed HTTP bodies are read whole before the caller sees
+    them.
+    """
+    def __init__(self, path: str):
+        """
+        Class Initializer
+        :param path: file to record to; replaced if it exists
+        :type path: str
+        """
+        self.path = path
+        self.records = 0
+        self.bytes = 0
+        self._file = None
+        self._lock = Lock()
+        self._blobs = set()
+        self._start = None
+
+    def start(self) -> 'SessionRecorder':
+        """Open the log and start recording this process's traffic."""
+        global _active
+        with _active_lock:
+            if _active is not None:
+                raise RuntimeError('a session is already being recorded to %s' % _active.path)
+            self._file = open(self.path, 'wb')
+            self._file.write(MAGIC)
+            self._start = time.monotonic()
+            self._write(REC_SESSION, {'server_url': get_cfg('SERVICE.SERVER_URL'),
+                                      'status_service_url': get_cfg('SERVICE.STATUS_SERVICE_URL'),
+                                      'serial': get_cfg('MACHINE.SERIAL'),
+                                      'recorded': time.time()})
+            _active = self
+        logger.info('recording service traffic to %s' % self.path)
+        return self
+
+    def stop(self) -> None:
+        """Stop recording and close the log."""
+        global _active
+        with _active_lock:
+            if _active is self:
+                _active = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        logger.info('recorded %d records, %d bytes, to %s' % (self.records, self.bytes, self.path))
+
+    def __enter__(self) -> 'SessionRecorder':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _write(self, kind: int, meta: dict, body: bytes = b'') -> None:
+        meta_bytes = json.dumps(meta, separators=(',', ':')).encode()
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(_RECORD.pack(kind, time.monotonic() - self._start, len(meta_bytes), len(body)))
+            self._file.write(meta_bytes)
+            self._file.write(body)
+            self._file.flush()
+            self.records += 1
+            self.bytes += _RECORD.size + len(meta_bytes) + len(body)
+
+    def frame(self, kind: int, frame: str) -> None:
+        """Record a WSS frame, REC_RX or REC_TX."""
+        self._write(kind, {'serial': get_cfg('MACHINE.SERIAL')}, frame.encode('utf-8'))
+
+    def opened(self, url: str) -> None:
+        """Record a WSS handshake to the status service at url (without
+        the token)."""
+        self._write(REC_OPEN, {'serial': get_cfg('MACHINE.SERIAL'), 'url': url})
+
+    def _inline(self, meta: dict, field: str, body: bytes) -> bytes:
+        """A body to write in the record, or, when it is long, a reference
+        in meta to a blob written once."""
+        meta[field + '_bytes'] = len(body)
+        if len(body) <= BLOB_MIN:
+            return body
+        sha = hashlib.sha256(body).hexdigest()
+        meta[field + '_blob'] = sha
+        meta[field + '_bytes'] = 0
+        with self._lock:
+            new = sha not in self._blobs
+            self._blobs.add(sha)
+        if new:
+            self._write(_REC_BLOB, {'sha': sha}, body)
+        return b''
+
+    def http(self, r) -> None:
+        """
+        Record a requests Response and the request it answers.
+        :param r: the response
+        :type r: Response
+        """
+        req = r.request
+        meta = {'serial': get_cfg('MACHINE.SERIAL'), 'method': req.method, 'url': req.url,
+                'status': r.status_code,
+                'request_headers': {k: req.headers[k] for k in _REQUEST_HEADERS if k in req.headers},
+                'headers': {k: v for k, v in r.headers.items() if k.lower() not in _DROPPED_RESPONSE_HEADERS}}
+        request_body = req.body
+        if isinstance(request_body, str):
+            request_body = request_body.encode('utf-8')
+        elif not isinstance(request_body, (bytes, bytearray)):
+            # A file streamed as it was sent; it is gone by now.
+            meta['request_streamed'] = request_body is not None
+            request_body = b''
+        if r._content is False:
+            # Streamed and not read yet: record the body as sent, encoded,
+            # and put it back for the caller, who may read it either way.
+            response_body = _rewind(r)
+        else:
+            # requests has decoded it already.
+            response_body = r.content or b''
+            meta['headers'] = {k: v for k, v in meta['headers'].items() if k.lower() != 'content-encoding'}
+        if urlsplit(req.url).path.endswith('/machines/sign_in'):
+            request_body, response_body = b'', _redact(response_body)
+            meta['redacted'] = True
+        body = self._inline(meta, 'request', bytes(request_body))
+        body += self._inline(meta, 'response', response_body)
+        self._write(REC_HTTP, meta, body)
+
+
+def _rewind(r) -> bytes:
+    """Read a streamed response's body off the wire, undecoded, and give
+    the response a raw stream that reads it again."""
+    wire = r.raw
+    body = wire.read(decode_content=False) or b''
+    wire.release_conn()
+    r.raw = HTTPResponse(body=BytesIO(body), headers=wire.headers, status=wire.status, reason=wire.reason,
+                         preload_content=False, decode_content=True)
+    return body
+
+
+def _redact(body: bytes) -> bytes:
+    try:
+        tokens = json.loads(body)
+    except ValueError:
+        return b''
+    if isinstance(tokens, dict):
+        for key in _TOKENS:
+            if key in tokens:
+                tokens[key] = 'REDACTED'
+    return json.dumps(tokens).encode()
+
+
+def recording() -> Union[SessionRecorder, None]:
+    """The active recorder, if a session is being recorded."""
+    return _active
+
+
+def record_rx(frame: str) -> None:
+    """Record a frame received from the service, if recording."""
+    recorder = _active
+    if recorder is not None:
+        recorder.frame(REC_RX, frame)
+
+
+def record_tx(frame: str) -> None:
+    """Record a frame sent to the service, if recording."""
+    recorder = _active
+    if recorder is not None:
+        recorder.frame(REC_TX, frame)
+
+
+def record_open(url: str) -> None:
+    """Record a completed WSS handshake, if recording."""
+    recorder = _active
+    if recorder is not None:
+        recorder.opened(url)
+
+
+def record_response(r, *_args, **_kwargs):
+    """
+    A requests response hook that records the exchange, if recording.
+    get_session() and UploadSession install it on their sessions.
+    """
+    recorder = _active
+    if recorder is not None:
+        try:
+            recorder.http(r)
+        except Exception:
+            # A recording with a hole beats a machine that stops.
+            logger.exception('could not record %s %s' % (r.request.method, r.url))
+    return r
+
+
+def read_recording(path: str) -> Iterator[Record]:
+    """
+    The records of a recording, in the order they were written. Long HTTP
+    bodies are put back in place; a record cut short at the end of the file
+    (the recorder was killed mid-write) ends the recording.
+    :param path: the recording
+    :type path: str
+    :return: its records
+    :rtype: Iterator[Record]
+    """
+    blobs = {}
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a session recording' % path)
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            kind, at, meta_len, body_len = _RECORD.unpack(head)
+            meta_bytes = f.read(meta_len)
+            body = f.read(body_len)
+            if len(meta_bytes) < meta_len or len(body) < body_len:
+                return
+            meta = json.loads(meta_bytes)
+            if kind == _REC_BLOB:
+                blobs[meta['sha']] = body
+                continue
+            if kind == REC_HTTP:
+                parts, offset = [], 0
+                for field in ('request', 'response'):
+                    size = meta[field + '_bytes']
+                    part = body[offset:offset + size]
+                    offset += size
+                    sha = meta.pop(field + '_blob', None)
+                    if sha is not None:
+                        part = blobs.get(sha, b'')
+                        meta[field + '_bytes'] = len(part)
+                    parts.append(part)
+                body = b''.join(parts)
+            yield Record(kind, at, meta, body)
+
+
+__all__ = ['BLOB_MIN', 'MAGIC', 'REC_HTTP', 'REC_OPEN', 'REC_RX', 'REC_SESSION', 'REC_TX', 'Record',
+           'SessionRecorder', 'read_recording', 'record_open', 'record_response', 'record_rx', 'record_tx',
+           'recording']
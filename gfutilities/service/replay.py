@@ -0,0 +1,400 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import asyncio
+from collections import deque
+import difflib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+from threading import Event, Lock, Thread
+import time
+from typing import Callable, Union
+from urllib.parse import urlsplit
+
+from gfutilities._common import *
+from gfutilities.configuration import scoped, use_scope
+from gfutilities.service.recording import REC_HTTP, REC_OPEN, REC_RX, REC_SESSION, REC_TX, read_recording
+from gfutilities.service.websocket import split_frame
+
+try:
+    import websockets
+    from websockets.asyncio.server import serve
+except ImportError:
+    websockets = None
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Seconds a replayed frame waits for the events the machine had sent before
+# it in the recording, before it goes out regardless.
+GATE_TIMEOUT = 30.0
+
+# Where the replay server serves a recorded origin: /_/<scheme>/<host>.
+_PREFIX = '/_/'
+
+
+class SessionReplay:
+    """
+    Replays a recorded session (see SessionRecorder) to a machine
+    Stands in for the service the session was recorded against: the HTTP
+    hosts, whose recorded responses it serves, in order, to the requests
+    that match them by method and URL, and the status service, which sends
+    the recorded frames. Every URL of the recording, the presigned ones in
+    the frames included, is rewritten to point here.
+
+    A frame waits for the machine to have sent what it had sent before
+    that frame in the recording - an action is not sent before the last
+    one's terminal event - then for as long after that, divided by
+    ``speed``, as it did in the recording. With ``speed`` None the frames
+    go as fast as the machine takes them. ``run()`` puts a GFUIService and
+    a new machine through the session, and diffs the events the machine
+    sent, per action, against the recorded ones.
+
+    Reconnects are not replayed: the frames go out on whichever connection
+    the machine has open. The status service needs the ``websockets``
+    package (``pip install gfutilities[asyncio]``).
+    """
+    def __init__(self, path: str, speed: Union[float, None] = 1.0, serial: str = None,
+                 gate_timeout: float = GATE_TIMEOUT, host: str = '127.0.0.1'):
+        """
+        Class Initializer
+        :param path: the recording
+        :type path: str
+        :param speed: how many times faster than recorded; None for as fast
+            as the machine goes
+        :type speed: Union[float, None]
+        :param serial: replay this machine's traffic, in a recording of a
+            fleet; by default, the recording's every record
+        :type serial: str
+        :param gate_timeout: seconds a frame waits for the events before it
+        :type gate_timeout: float
+        :param host: address to listen on
+        :type host: str
+        """
+        if websockets is None:
+            raise RuntimeError('replaying needs the websockets package')
+        self.path = path
+        self.speed = speed
+        self.gate_timeout = gate_timeout
+        self.host = host
+        self.session = {}
+        self.rx = []
+        self.tx = []
+        self.http = {}
+        self.opened = None
+        for record in read_recording(path):
+            if record.kind == REC_SESSION:
+                if not self.session:
+                    self.session = record.meta
+                continue
+            if serial is not None and record.meta.get('serial') != serial:
+                continue
+            if record.kind == REC_RX:
+                self.rx.append(record)
+            elif record.kind == REC_TX:
+                self.tx.extend((record.time, obj) for obj in _events(record.text))
+            elif record.kind == REC_HTTP:
+                self.http.setdefault((record.meta['method'], record.meta['url']), deque()).append(record)
+            elif record.kind == REC_OPEN and self.opened is None:
+                self.opened = record.time
+        self.unmatched = []
+        self.frames_sent = 0
+        self.events = []
+        self._lock = Lock()
+        self._origins = {}
+        self._http_server = None
+        self._loop = None
+        self._stop = None
+        self._ws_thread = None
+        self._started = Event()
+        self._done = Event()
+        self._feeding = None
+        self._connected = None
+        self._arrived = None
+        self._conn = None
+        self.ws_port = None
+
+    # ---- lifecycle ---------------------------------------------------------
+
+    def start(self) -> 'SessionReplay':
+        """Start listening, HTTP and status service each on a port of its own."""
+        self._http_server = ThreadingHTTPServer((self.host, 0), _Handler)
+        self._http_server.daemon_threads = True
+        self._http_server.replay = self
+        Thread(target=self._http_server.serve_forever, args=(0.05,), daemon=True).start()
+        origins = {self.session.get('server_url')}
+        origins.update('%s://%s' % urlsplit(url)[:2] for _, url in self.http)
+        self._origins = {origin: self._local(origin) for origin in origins if origin}
+        self._loop = asyncio.new_event_loop()
+        self._ws_thread = Thread(target=self._run, daemon=True)
+        self._ws_thread.start()
+        if not self._started.wait(5):
+            raise RuntimeError('replay status service did not start')
+        return self
+
+    def stop(self) -> None:
+        """Stop listening and drop every connection."""
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._ws_thread.join(5)
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+
+    def __enter__(self) -> 'SessionReplay':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @property
+    def server_url(self) -> str:
+        """What SERVICE.SERVER_URL is, for the machine replayed to."""
+        return self._local(self.session.get('server_url') or 'https://app.glowforge.com')
+
+    @property
+    def status_url(self) -> str:
+        """What SERVICE.STATUS_SERVICE_URL is, for the machine replayed to."""
+        return 'ws://%s:%d' % (self.host, self.ws_port)
+
+    def _local(self, origin: str) -> str:
+        scheme, netloc = urlsplit(origin)[:2]
+        return 'http://%s:%d%s%s/%s' % (self.host, self._http_server.server_port, _PREFIX, scheme, netloc)
+
+    def _rewrite(self, frame: str) -> str:
+        for origin, local in self._origins.items():
+            frame = frame.replace(origin, local)
+        return frame
+
+    # ---- running a machine -------------------------------------------------
+
+    def run(self, machine: Callable = None, config: dict = None, timeout: float = None) -> dict:
+        """
+        Put a machine through the session, and compare what it sent with
+        what was recorded.
+        :param machine: makes the machine (a BaseMachine), in the replay's
+            configuration scope; an Emulator by default
+        :type machine: Callable
+        :param config: configuration for the machine, over the process's
+        :type config: dict
+        :param timeout: seconds to wait for the session to play out; forever
+            when None
+        :type timeout: float
+        :return: ``match``, whether the machine sent every recorded event
+            and no other; the unified ``diff`` of the events, one line per
+            event, action by action; the ``events`` recorded and replayed;
+            the ``frames`` sent; HTTP requests ``unmatched`` by a recorded
+            one; the ``elapsed`` seconds from the machine's connection to
+            its last event, the ``recorded`` seconds the session took, and
+            ``speedup``, their ratio
+        :rtype: dict
+        """
+        if machine is None:
+            from gfutilities.device.emulator import Emulator
+            machine = Emulator
+        from gfutilities.service.gfuiservice import GFUIService
+        scope = {'SERVICE.SERVER_URL': self.server_url, 'SERVICE.STATUS_SERVICE_URL': self.status_url,
+                 'SESSION.WS_TOKEN': None, 'SESSION.WS_TOKEN_ISSUED': None, 'SESSION.AUTH_TOKEN': None}
+        scope.update(config or {})
+        with use_scope(scope):
+            service = GFUIService(machine())
+            if not service.connect():
+                raise RuntimeError('the machine could not sign in to the replay')
+            runner = Thread(target=scoped(service.run), daemon=True, name='replay-service')
+            runner.start()
+            finished = self._done.wait(timeout)
+            service.request_stop()
+            runner.join(10)
+        if not finished:
+            logger.warning('the replay did not play out in %ss' % timeout)
+        return self.result()
+
+    def result(self) -> dict:
+        """The comparison of the replay so far with the recording (see run())."""
+        with self._lock:
+            replayed = list(self.events)
+        expected = _script(obj for _, obj in self.tx)
+        got = _script(obj for _, obj in replayed)
+        diff = list(difflib.unified_diff(expected, got, 'recorded', 'replayed', lineterm=''))
+        recorded = None
+        if self.tx:
+            recorded = self.tx[-1][0] - (self.opened if self.opened is not None else self.tx[0][0])
+        elapsed = None
+        if replayed and self._connected is not None:
+            elapsed = replayed[-1][0] - self._connected
+        return {'match': not diff, 'diff': diff, 'events': {'recorded': len(expected), 'replayed': len(got)},
+                'frames': self.frames_sent, 'unmatched': list(self.unmatched), 'elapsed': elapsed,
+                'recorded': recorded, 'speedup': recorded / elapsed if recorded and elapsed else None}
+
+    # ---- status service ----------------------------------------------------
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+
+    async def _serve(self) -> None:
+        self._stop = asyncio.Event()
+        self._arrived = asyncio.Event()
+        async with serve(self._session, self.host, 0, subprotocols=['glowforge']) as server:
+            self.ws_port = server.sockets[0].getsockname()[1]
+            self._started.set()
+            await self._stop.wait()
+        if self._feeding is not None:
+            self._feeding.cancel()
+
+    async def _session(self, conn) -> None:
+        self._conn = conn
+        if self._feeding is None:
+            self._connected = time.monotonic()
+            self._feeding = asyncio.ensure_future(self._feed())
+        try:
+            async for message in conn:
+                now = time.monotonic()
+                with self._lock:
+                    self.events.extend((now, obj) for obj in _events(message))
+                self._arrived.set()
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _reached(self, count: int) -> Union[float, None]:
+        """Wait for the machine to have sent count events; when it had."""
+        deadline = time.monotonic() + self.gate_timeout
+        while True:
+            self._arrived.clear()
+            with self._lock:
+                if len(self.events) >= count:
+                    return self.events[count - 1][0] if count else self._connected
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return None
+            try:
+                await asyncio.wait_for(self._arrived.wait(), left)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _feed(self) -> None:
+        """Send the recorded frames, each once the machine has caught up to
+        it and as long after as it was recorded."""
+        origin = self.opened if self.opened is not None else (self.rx[0].time if self.rx else 0.0)
+        times = [t for t, _ in self.tx]
+        last = (origin, self._connected)
+        for record in self.rx:
+            need = sum(1 for t in times if t < record.time)
+            reached = await self._reached(need)
+            if reached is None:
+                logger.warning('replay: %d of %d events before frame %d; sending it anyway'
+                               % (len(self.events), need, self.frames_sent))
+                reached = time.monotonic()
+            anchor = (times[need - 1], reached) if need else (origin, self._connected)
+            if anchor[0] < last[0]:
+                anchor = last
+            if self.speed:
+                delay = anchor[1] + (record.time - anchor[0]) / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            try:
+                await self._conn.send(self._rewrite(record.text))
+            except websockets.ConnectionClosed:
+                logger.warning('replay: connection closed; frame %d lost' % self.frames_sent)
+            self.frames_sent += 1
+            last = (record.time, time.monotonic())
+        await self._reached(len(times))
+        self._done.set()
+
+    # ---- HTTP --------------------------------------------------------------
+
+    def _response(self, method: str, url: str):
+        """The next recorded response to a request, or the last one again
+        once they are used up."""
+        with self._lock:
+            queue = self.http.get((method, url))
+            if not queue:
+                self.unmatched.append('%s %s' % (method, url))
+                return None
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Every recorded host, behind a path prefix of its own."""
+    protocol_version = 'HTTP/1.1'
+
+    def _replay(self) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        record = None
+        if self.path.startswith(_PREFIX):
+            scheme, _, rest = self.path[len(_PREFIX):].partition('/')
+            netloc, _, rest = rest.partition('/')
+            record = self.server.replay._response(self.command, '%s://%s/%s' % (scheme, netloc, rest))
+        if record is None:
+            status, headers, body = 404, {}, b''
+        else:
+            status, headers, body = record.meta['status'], record.meta['headers'], record.response
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_HEAD = do_DELETE = _replay
+
+    def log_message(self, fmt, *args) -> None:
+        logger.debug('replay http: ' + fmt % args)
+
+
+def _events(frame: str) -> list:
+    """The events in an outbound frame; progress frames are not compared."""
+    events = []
+    for line in split_frame(frame):
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(obj, dict) and obj.get('type') == 'event':
+            events.append(obj)
+    return events
+
+
+def _script(events) -> list:
+    """Events as diffable lines, grouped by action in order of first event.
+    Ids and timestamps differ from run to run and are left out."""
+    actions = {}
+    for obj in events:
+        actions.setdefault(obj.get('action_id'), []).append(
+            '%s %s' % (obj.get('action_id', '-'), obj.get('event')))
+    return [line for lines in actions.values() for line in lines]
+
+
+def replay(path: str, machine: Callable = None, speed: Union[float, None] = 1.0, config: dict = None,
+           timeout: float = None, **kwargs) -> dict:
+    """
+    Replay a recorded session to a new machine; see SessionReplay.
+    :param path: the recording
+    :type path: str
+    :param machine: makes the machine; an Emulator by default
+    :type machine: Callable
+    :param speed: how many times faster than recorded; None for as fast as
+        the machine goes
+    :type speed: Union[float, None]
+    :param config: configuration for the machine
+    :type config: dict
+    :param timeout: seconds to wait for the session to play out
+    :type timeout: float
+    :return: SessionReplay.run()'s comparison
+    :rtype: dict
+    """
+    with SessionReplay(path, speed=speed, **kwargs) as session:
+        return session.run(machine, config, timeout)
+
+
+__all__ = ['GATE_TIMEOUT', 'SessionReplay', 'replay']
@@ -0,0 +1,175 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+from collections import deque
+from http.cookiejar import DefaultCookiePolicy
+import logging
+from pathlib import Path
+import requests
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from threading import Lock, local
+import time
+from typing import Union
+
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from gfutilities._common import *
+from gfutilities.service.recording import record_response
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Connections kept open per storage host. The homing handshake uploads one
+# image at a time, so a couple is plenty; more only helps parallel uploads.
+UPLOAD_POOL_SIZE = 4
+
+# Uploads whose timings are kept, most recent last.
+_TIMINGS_KEPT = 64
+
+# What the connection that carried the current upload cost to open, per
+# thread: the connection classes below fill it in as they connect.
+_opened = local()
+
+
+class _TimedConnectionMixin:
+    """Times the TCP connect and, for https, the TLS handshake after it."""
+    def _new_conn(self):
+        start = time.perf_counter()
+        sock = super()._new_conn()
+        _opened.connect = time.perf_counter() - start
+        _opened.connected_at = time.perf_counter()
+        return sock
+
+    def connect(self) -> None:
+        super().connect()
+        _opened.tls = time.perf_counter() - _opened.connected_at
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools open timed connections."""
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPPool, 'https': _TimedHTTPSPool}
+
+
+class _NoCookies(DefaultCookiePolicy):
+    """Keeps no cookie, and sends none."""
+    def set_ok(self, cookie, request) -> bool:
+        return False
+
+    def return_ok(self, cookie, request) -> bool:
+        return False
+
+
+class UploadSession(Session):
+    """
+    Session for presigned storage uploads
+    A presigned URL carries its own auth, so these uploads must never go
+    through the authenticated Glowforge session (a Bearer header makes the
+    storage host reject them). Posting each one with a bare requests.put()
+    instead opens, and throws away, a fresh TCP connection and TLS handshake
+    per image; the homing handshake chains a dozen uploads to the same host,
+    so the handshakes cost more than the images. This session carries no
+    credentials and keeps its connections open between uploads. Nor does it
+    pick any up: it takes no cookies from the storage host, and no netrc
+    login or proxy from the environment.
+
+    Every upload's cost is kept in ``timings``: ``connect`` (TCP) and ``tls``
+    are 0 when a kept-alive connection carried it, ``transfer`` is the rest
+    of the round trip, request body to response.
+    """
+    def __init__(self, pool_size: int = UPLOAD_POOL_SIZE):
+        """
+        Class Initializer
+        :param pool_size: connections kept open per host
+        :type pool_size: int
+        """
+        Session.__init__(self)
+        self.trust_env = False
+        self.cookies.set_policy(_NoCookies())
+        adapter = _TimedAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.timings = deque(maxlen=_TIMINGS_KEPT)
+        self.hooks['response'].append(record_response)
+
+    def put_image(self, url: str, img, content_type: str = 'image/jpeg',
+                  timeout: int = 30) -> Union[Response, bool]:
+        """
+        PUT an image to a presigned URL.
+        :param url: presigned URL
+        :type url: str
+        :param img: the image, as bytes or another buffer, a binary file object
+            or a path to the file; files are streamed, never read in whole
+        :param content_type: Content-Type of the image
+        :type content_type: str
+        :param timeout: seconds to connect, and between bytes of the response
+        :type timeout: int
+        :return: Requests Response object, or False when the request could not be made
+        :rtype: Union[Response, bool]
+        """
+        if isinstance(img, (str, Path)):
+            with open(img, 'rb') as f:
+                return self.put_image(url, f, content_type, timeout)
+        _opened.connect = _opened.tls = 0.0
+        start = time.perf_counter()
+        try:
+            r = self.put(url, data=img, headers={'Content-Type': content_type}, timeout=timeout)
+        except requests.RequestException as e:
+            logger.error('upload failed: %s' % e)
+            return False
+        total = time.perf_counter() - start
+        timing = {'bytes': int(r.request.headers.get('Content-Length') or 0),
+                  'status': r.status_code,
+                  'reused': not _opened.connect,
+                  'connect': _opened.connect,
+                  'tls': _opened.tls,
+                  'transfer': total - _opened.connect - _opened.tls,
+                  'total': total}
+        self.timings.append(timing)
+        logger.info('upload: %d bytes in %.1f ms (connect %.1f ms, tls %.1f ms%s)'
+                    % (timing['bytes'], total * 1000, timing['connect'] * 1000, timing['tls'] * 1000,
+                       ', kept-alive' if timing['reused'] else ''))
+        return r
+
+
+_upload_session = None
+_upload_session_lock = Lock()
+
+
+def upload_session() -> UploadSession:
+    """
+    The process-wide UploadSession, created on first use, so every upload
+    shares its open connections.
+    :return: the shared session
+    :rtype: UploadSession
+    """
+    global _upload_session
+    with _upload_session_lock:
+        if _upload_session is None:
+            _upload_session = UploadSession()
+        return _upload_session
+
+
+__all__ = ['UPLOAD_POOL_SIZE', 'UploadSession', 'upload_session']
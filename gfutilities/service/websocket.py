@@ -5,23 +5,30 @@ https://community.openglow.org
 
 SPDX-License-Identifier:    MIT
 """
+from collections import OrderedDict, deque
 from datetime import timedelta
 import json
 import logging
 from pathlib import Path
-from queue import Queue
+import random
+import struct
+from queue import Empty, Queue
 import requests
 from requests import Request, Response, Session
-from threading import Lock, Thread
+from threading import Event, Lock, Thread
 import time
 from typing import Any, Union
 
+import urllib3
 import websocket
 
 from gfutilities._common import *
-from gfutilities.configuration import get_cfg, set_cfg
-from gfutilities.puls import decode_all_steps
-from gfutilities.puls.source import PulseSource, PulseSourceError
+from gfutilities.configuration import get_cfg, scoped, set_cfg
+from gfutilities.puls import LaserPowerAccumulator, StepStatsAccumulator
+from gfutilities.puls.source import HeaderTruncated, PulseSource, PulseSourceError, PulseStream, read_header
+from gfutilities.service.jobcache import job_cache
+from gfutilities.service.recording import record_open, record_response, record_rx, record_tx
+from gfutilities.service.upload import upload_session
 
 start_time = time.time()
 response_id = 31
@@ -29,18 +36,269 @@ _response_id_lock = Lock()
 
 # Events queued while the socket is down are stale on reconnect; past this
 # depth new events are dropped (with a warning) instead of growing the
-# queue without bound.
+# queue without bound. A TxQueue evicts to stay under it instead.
 TX_QUEUE_MAX = 1000
 
+# Send classes of an outbound frame, most urgent first.
+TX_TERMINAL = 0
+TX_LIFECYCLE = 1
+TX_PROGRESS = 2
+
+# The outcomes that end an action: '<action_type>:<outcome>', nothing else
+# after the action type. 'print:download:completed' is a phase of a print.
+_TERMINAL_OUTCOMES = ('completed', 'cancelled', 'failed')
+
 logger = logging.getLogger(LOGGER_NAME)
 
 
+class TxQueue(Queue):
+    """
+    Outbound frame queue that sends what matters first.
+
+    A plain FIFO serves frames in the order they were queued, which after a
+    socket outage is hundreds of stale progress frames ahead of the terminal
+    event the service is waiting for, and once it fills it turns away the
+    newest frames, terminal ones included. This queue holds three classes:
+    terminal events (an action's ``:completed``, ``:cancelled``,
+    ``:failed``), lifecycle events (everything else) and progress frames,
+    and hands them out in that order. Progress is latest-wins per action: a
+    new frame replaces the one still queued, and a terminal event discards
+    its action's queued progress outright, so each action has at most one
+    progress frame waiting and none once it is over. An action's terminal
+    event never overtakes that action's own earlier lifecycle events.
+
+    Past ``limit`` frames the oldest progress is evicted first, then the
+    oldest lifecycle event, and a terminal event only when nothing else is
+    left. ``stats`` counts frames replaced, discarded and evicted.
+
+    send_wss_event and send_wss_progress tag what they queue here with its
+    class; anything else put in is a lifecycle frame. It is a Queue, so
+    either WS client drains it unchanged.
+    """
+    def __init__(self, limit: int = TX_QUEUE_MAX):
+        self.limit = limit
+        self.stats = {'coalesced': 0, 'stale': 0, 'evicted': 0}
+        Queue.__init__(self)
+
+    # Queue's storage hooks, called holding its mutex.
+    def _init(self, maxsize: int) -> None:
+        self._seq = 0
+        # Sequence numbers of frames put back at the front count down.
+        self._front = 0
+        self._terminal = deque()
+        self._lifecycle = deque()
+        self._progress = OrderedDict()
+
+    def _qsize(self) -> int:
+        return len(self._terminal) + len(self._lifecycle) + len(self._progress)
+
+    def _put(self, item) -> None:
+        if isinstance(item, tuple) and len(item) == 3:
+            priority, key, frame = item
+        else:
+            priority, key, frame = TX_LIFECYCLE, None, item
+        self._seq += 1
+        entry = (self._seq, key, frame)
+        if priority == TX_PROGRESS:
+            if self._progress.pop(key, None) is not None:
+                self._forget('coalesced')
+            self._progress[key] = entry
+        elif priority == TX_TERMINAL:
+            if key is not None and self._progress.pop(key, None) is not None:
+                self._forget('stale')
+            self._terminal.append(entry)
+        else:
+            self._lifecycle.append(entry)
+        while self._qsize() > self.limit:
+            self._evict()
+
+    def _forget(self, reason: str) -> None:
+        # A frame that will never be handed out: Queue.put counts every put
+        # as unfinished, so take this one back.
+        self.stats[reason] += 1
+        self.unfinished_tasks -= 1
+
+    def _evict(self) -> None:
+        if self._progress:
+            self._progress.popitem(last=False)
+        else:
+            frame = (self._lifecycle or self._terminal).popleft()[2]
+            logger.warning('event TX queue full (socket down?); dropping %s'
+                           % (frame.strip() if isinstance(frame, str) else frame))
+        self._forget('evicted')
+
+    def _get(self):
+        if self._terminal:
+            seq, key, frame = self._terminal[0]
+            for i, (earlier, owner, event) in enumerate(self._lifecycle):
+                if earlier > seq:
+                    break
+                if owner == key:
+                    del self._lifecycle[i]
+                    return event
+            self._terminal.popleft()
+            return frame
+        if self._lifecycle:
+            return self._lifecycle.popleft()[2]
+        return self._progress.popitem(last=False)[1][2]
+
+    def requeue(self, frame: str) -> None:
+        """
+        Put back a frame that was taken but never sent, its socket having
+        closed first: each of its events in its class, ahead of everything
+        of that class queued since. Progress queued since is newer than the
+        frame's and stays; a terminal event in the frame makes its action's
+        queued progress stale, as it would have on the way in.
+        :param frame: the frame, one event or several
+        :type frame: str
+        """
+        with self.mutex:
+            for event in reversed(split_frame(frame)):
+                priority, key = _frame_class(event)
+                self._front -= 1
+                entry = (self._front, key, event + '\n')
+                if priority == TX_PROGRESS:
+                    if key in self._progress:
+                        self.stats['coalesced'] += 1
+                        continue
+                    self._progress[key] = entry
+                    self._progress.move_to_end(key, last=False)
+                elif priority == TX_TERMINAL:
+                    if key is not None and self._progress.pop(key, None) is not None:
+                        self._forget('stale')
+                    self._terminal.appendleft(entry)
+                else:
+                    self._lifecycle.appendleft(entry)
+                self.unfinished_tasks += 1
+                while self._qsize() > self.limit:
+                    self._evict()
+                self.not_empty.notify()
+
+
+def _frame_class(event: str) -> tuple:
+    """The send class and action of an event, read back from its JSON, as
+    send_wss_event and send_wss_progress assigned them."""
+    try:
+        obj = json.loads(event)
+    except ValueError:
+        return TX_LIFECYCLE, None
+    if not isinstance(obj, dict):
+        return TX_LIFECYCLE, None
+    key = obj.get('action_id')
+    if obj.get('type') == 'progress':
+        return TX_PROGRESS, key
+    outcome = str(obj.get('event', '')).split(':', 1)[-1]
+    return (TX_TERMINAL if outcome in _TERMINAL_OUTCOMES else TX_LIFECYCLE), key
+
+
+def _enqueue(msg_q_tx: Queue, frame: str, priority: int, action_id: Any) -> bool:
+    """Queue a frame, with its class on a TxQueue. False when a plain queue
+    is already full and the frame is dropped."""
+    if isinstance(msg_q_tx, TxQueue):
+        msg_q_tx.put((priority, action_id, frame))
+        return True
+    if msg_q_tx.qsize() >= TX_QUEUE_MAX:
+        return False
+    msg_q_tx.put(frame)
+    return True
+
+
+class ReconnectPolicy:
+    """
+    When to reconnect, and whether to sign in first
+    A dropped connection is tried again at once: most drops are a blip, and
+    events pile up in the transmit queue for as long as the machine is away.
+    Attempts that keep failing back off exponentially from ``base`` to
+    ``cap`` seconds, each wait jittered down to as little as half so a fleet
+    knocked off together does not come back together; the backoff starts
+    over once a connection has stayed up ``stable`` seconds.
+
+    The ws_token is single-use and short-lived, but one that the service
+    never saw - because the attempt failed before the handshake (no route,
+    DNS, refused) - is still good, and signing in for a new one is a
+    round trip the reconnect waits on. So a sign-in is asked for only when
+    the token in hand has been presented to the service, or is older than
+    ``lifetime`` (SERVICE.WS_TOKEN_LIFETIME, default 25 s), or its age is
+    unknown.
+
+    ``stats`` keeps the reconnects made, the sign-ins made and skipped, and
+    how long the machine was away each time (last, max, mean).
+    """
+    def __init__(self, base: float = 0.5, cap: float = 30.0, stable: float = 10.0,
+                 lifetime: float = None):
+        """
+        Class Initializer
+        :param base: seconds of the first wait that is not zero
+        :param cap: longest wait, seconds
+        :param stable: seconds a connection must stay up to reset the backoff
+        :param lifetime: seconds a ws_token is taken to stay good
+        """
+        if lifetime is None:
+            lifetime = float(get_cfg('SERVICE.WS_TOKEN_LIFETIME') or 25)
+        self.base = base
+        self.cap = cap
+        self.stable = stable
+        self.lifetime = lifetime
+        self._failures = 0
+        self._opened = None
+        self._lost = None
+        self._spent = None
+        self.stats = {'reconnects': 0, 'sign_ins': 0, 'sign_ins_skipped': 0,
+                      'down_last': None, 'down_max': None, 'down_mean': None}
+
+    def connected(self, token: str) -> None:
+        """The handshake with ``token`` succeeded: it is spent."""
+        now = time.monotonic()
+        self._spent = token
+        self._opened = now
+        if self._lost is not None:
+            down = now - self._lost
+            stats = self.stats
+            stats['reconnects'] += 1
+            stats['down_last'] = down
+            stats['down_max'] = down if stats['down_max'] is None else max(stats['down_max'], down)
+            mean = stats['down_mean'] or 0.0
+            stats['down_mean'] = mean + (down - mean) / stats['reconnects']
+            logger.info('reconnected after %.2fs' % down)
+        self._lost = None
+
+    def presented(self, token: str) -> None:
+        """The service saw ``token`` but the connection did not open."""
+        self._spent = token
+
+    def closed(self) -> None:
+        """The connection, or the attempt at one, is over."""
+        now = time.monotonic()
+        if self._opened is not None and now - self._opened >= self.stable:
+            self._failures = 0
+        self._opened = None
+        if self._lost is None:
+            self._lost = now
+
+    def next_delay(self) -> float:
+        """Seconds to wait before the next attempt."""
+        self._failures += 1
+        if self._failures == 1:
+            return 0.0
+        delay = min(self.cap, self.base * 2 ** (self._failures - 2))
+        return delay * random.uniform(0.5, 1.0)
+
+    def needs_sign_in(self, token: str) -> bool:
+        """Whether ``token`` has to be replaced before the next attempt. The
+        clients count, in ``stats``, the sign-ins they make and skip."""
+        issued = get_cfg('SESSION.WS_TOKEN_ISSUED')
+        return (not token or token == self._spent or issued is None
+                or time.monotonic() - issued >= self.lifetime)
+
+
 class WsClient(Thread):
     """
     Web Socket Client
     Establishes a persistent WSS client that runs the WebSocket event loop in a separate thread.
     Incoming text messages are spooled to the q_msg_rx Queue; messages placed into the q_msg_tx
-    Queue are sent out by a dedicated transmit-pump thread.
+    Queue are sent out by a dedicated transmit-pump thread, packed into frames by FrameCoalescer.
+    ``on_receive``, when set, is shown every message as it arrives, before it is queued, so
+    what cannot wait behind the queue (a cancel of the running action) is acted on at once.
     """
     def __init__(self, q_rx: Queue, q_tx: Queue, session=None):
         """
@@ -59,14 +317,26 @@ class WsClient(Thread):
         self.ready = False
         self._session = session
         self.ws = None
+        self.coalescer = FrameCoalescer()
+        self.on_receive = None
+        self.reconnect = ReconnectPolicy()
+        # The ws_token the socket being built or run was opened with.
+        self._token = None
+        # Frames the pump has handed to the socket, against the coalescer's
+        # count of frames built.
+        self._frames_done = 0
         # daemon: the client must never keep the process alive on its own.
         # Clean teardown is still explicit - see shutdown().
         Thread.__init__(self, daemon=True)
+        # Run in the configuration scope this client was made in (a fleet
+        # machine's; see use_scope), as does the transmit pump.
+        self.run = scoped(self.run)
 
     def _build(self) -> 'websocket.WebSocketApp':
         """Build a WebSocketApp for the ws_token currently in config."""
+        self._token = get_cfg('SESSION.WS_TOKEN')
         return websocket.WebSocketApp(
-            get_cfg('SERVICE.STATUS_SERVICE_URL') + '/' + get_cfg('SESSION.WS_TOKEN'),
+            get_cfg('SERVICE.STATUS_SERVICE_URL') + '/' + self._token,
             header={'User-Agent': get_cfg('SESSION.USER_AGENT')},
             subprotocols=['glowforge'],
             on_open=self._on_open,
@@ -78,6 +348,8 @@ class WsClient(Thread):
     def _on_open(self, _ws) -> None:
         """WS handshake complete - ready to send/receive."""
         logger.info('RX-EVENT: ready')
+        record_open(get_cfg('SERVICE.STATUS_SERVICE_URL'))
+        self.reconnect.connected(self._token)
         self.ready = True
 
     def _on_message(self, _ws, message) -> None:
@@ -86,14 +358,21 @@ class WsClient(Thread):
             logger.error('UNEXPECTED BINARY RX-EVENT (%s bytes)' % len(message))
             return
         logger.debug(message)
+        record_rx(message)
         # The service packs several newline-delimited JSON objects into a
         # single text frame; enqueue each object on its own so the consumer
         # decodes one action at a time.
         for obj in split_frame(message):
+            peek_message(self.on_receive, obj)
             self.msg_q_rx.put(obj)
 
     def _on_error(self, _ws, error) -> None:
         logger.error('RX-EVENT: error: %s' % error)
+        # A failure to resolve or reach the host never got the token to the
+        # service; anything else (a refused handshake, a timeout part way
+        # through one) may have used it up.
+        if not self.ready and not isinstance(error, (OSError, websocket.WebSocketAddressException)):
+            self.reconnect.presented(self._token)
 
     def _on_close(self, _ws, status_code, msg) -> None:
         self.ready = False
@@ -104,12 +383,14 @@ class WsClient(Thread):
         Thread loop.
         Starts the transmit pump, then connects and reconnects until stop is
         requested. The ws_token is single-use and short-lived (~30s), so with
-        a session each reconnect re-runs sign_in for a fresh token (and
-        auth_token) and rebuilds the URL; without one, reconnects reuse the
-        existing token.
+        a session a reconnect re-runs sign_in for a fresh token (and
+        auth_token) and rebuilds the URL whenever the token in hand may be
+        spent (see ReconnectPolicy); without one, reconnects reuse the
+        existing token. The first retry is immediate.
         :return:
         """
-        Thread(target=self._tx_pump, daemon=True).start()
+        Thread(target=scoped(self._tx_pump), daemon=True).start()
+        policy = self.reconnect
         first = True
         while not self.stop:
             # A transient failure anywhere in a session attempt (DNS blip
@@ -118,14 +399,19 @@ class WsClient(Thread):
             # Log, back off, reconnect.
             try:
                 if not first and self._session is not None:
-                    # Lazy import: authentication imports this module.
-                    from gfutilities.service.authentication import authenticate_machine
-                    logger.info('re-authenticating for a fresh ws_token')
-                    if not authenticate_machine(self._session):
-                        logger.error('re-auth failed; will retry')
-                        if self._sleep_or_stop(5):
-                            break
-                        continue
+                    if policy.needs_sign_in(get_cfg('SESSION.WS_TOKEN')):
+                        policy.stats['sign_ins'] += 1
+                        # Lazy import: authentication imports this module.
+                        from gfutilities.service.authentication import authenticate_machine
+                        logger.info('re-authenticating for a fresh ws_token')
+                        if not authenticate_machine(self._session):
+                            logger.error('re-auth failed; will retry')
+                            policy.closed()
+                            if self._sleep_or_stop(max(policy.next_delay(), policy.base)):
+                                break
+                            continue
+                    else:
+                        policy.stats['sign_ins_skipped'] += 1
                 first = False
                 self.ready = False
                 self.ws = self._build()
@@ -133,10 +419,12 @@ class WsClient(Thread):
                 self.ws.run_forever(ping_interval=30, ping_timeout=10)
             except Exception:
                 logger.exception('WS session attempt failed; will reconnect')
+            policy.closed()
             if self.stop:
                 break
-            logger.info('RECONNECTING')
-            if self._sleep_or_stop(5):
+            delay = policy.next_delay()
+            logger.info('RECONNECTING in %.1fs' % delay)
+            if delay and self._sleep_or_stop(delay):
                 break
         logger.info('CLOSING')
 
@@ -160,12 +448,21 @@ class WsClient(Thread):
             self.join(timeout)
         return not self.is_alive()
 
+    @property
+    def tx_pending(self) -> bool:
+        """True while anything queued to send has yet to go out: in q_tx,
+        in the coalescer, or taken by the pump and not sent yet."""
+        return (not self.msg_q_tx.empty() or self.coalescer.pending
+                or self.coalescer.stats['frames'] != self._frames_done)
+
     def _sleep_or_stop(self, secs: float) -> bool:
         """Sleep up to secs seconds, returning True as soon as stop is set."""
-        for _ in range(int(secs * 10)):
-            if self.stop:
-                return True
-            time.sleep(0.1)
+        deadline = time.monotonic() + secs
+        while not self.stop:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            time.sleep(min(0.1, left))
         return self.stop
 
     def _tx_pump(self) -> None:
@@ -175,20 +472,34 @@ class WsClient(Thread):
         :return:
         """
         while not self.stop:
-            if self.ready and not self.msg_q_tx.empty():
-                send_msg = self.msg_q_tx.get()
+            send_msg = self.coalescer.next_frame(self.msg_q_tx) if self.ready else None
+            if send_msg is not None:
                 logger.info('TX-EVENT: ' + send_msg.strip())
                 try:
                     self.ws.send(send_msg)
+                    record_tx(send_msg)
                 except websocket.WebSocketException as e:
                     logger.error('TX FAILED: %s' % e)
-                self.msg_q_tx.task_done()
+                finally:
+                    self._frames_done += 1
             else:
                 time.sleep(0.1)
         if self.ws:
             self.ws.close()
 
 
+def peek_message(on_receive, message: str) -> None:
+    """Show a received message to a client's on_receive hook, if it has one.
+    The hook runs on the receive thread: whatever it raises is logged and
+    the message is queued regardless."""
+    if on_receive is None:
+        return
+    try:
+        on_receive(message)
+    except Exception:
+        logger.exception('on_receive hook failed')
+
+
 def split_frame(message: str) -> list:
     """
     Split a WebSocket text frame into its individual JSON objects.
@@ -203,6 +514,92 @@ def split_frame(message: str) -> list:
     return [line.strip() for line in message.splitlines() if line.strip()]
 
 
+# Outbound events packed into one frame, by default: whatever is already
+# queued when a frame goes out, up to this many bytes. 0 sends each on its own.
+TX_COALESCE_BYTES = 8192
+# How long a frame waits for more events after its first, by default. Waiting
+# trades latency for fewer frames, so the default only takes what is there.
+TX_COALESCE_MS = 0
+
+
+class FrameCoalescer:
+    """
+    Packs queued outbound events into newline-delimited text frames.
+
+    The service packs several JSON objects into a frame and split_frame
+    unpacks them; this is the same on the way out. At a phase transition a
+    machine queues several events in a burst, and sending each as a frame
+    of its own costs a syscall and a frame header apiece on a slow link.
+    A frame takes its first event, then whatever else is queued within
+    ``window_ms``, until the next event would take it past ``max_bytes``;
+    that event starts the next frame.
+
+    Settings default to SERVICE.TX_COALESCE_BYTES / SERVICE.TX_COALESCE_MS,
+    and to the module defaults when those are not configured.
+    """
+    def __init__(self, max_bytes: int = None, window_ms: float = None):
+        if max_bytes is None:
+            max_bytes = get_cfg('SERVICE.TX_COALESCE_BYTES')
+        if window_ms is None:
+            window_ms = get_cfg('SERVICE.TX_COALESCE_MS')
+        self.max_bytes = TX_COALESCE_BYTES if max_bytes is None else int(max_bytes)
+        self.window = (TX_COALESCE_MS if window_ms is None else float(window_ms)) / 1000
+        self._carry = None
+        self._packing = False
+        self.stats = {'events': 0, 'frames': 0, 'frames_saved': 0, 'bytes': 0}
+
+    @property
+    def pending(self) -> bool:
+        """True while events taken from the queue are being packed into a
+        frame, or one is held over for the next."""
+        return self._packing or self._carry is not None
+
+    def _take(self, q: Queue, block: bool, timeout: float = None) -> Any:
+        if self._carry is not None:
+            item, self._carry = self._carry, None
+            return item
+        try:
+            item = q.get(block, timeout)
+        except Empty:
+            return None
+        q.task_done()
+        return item
+
+    def next_frame(self, q: Queue, block: bool = False) -> Union[str, None]:
+        """
+        The next frame to send, built from the held-over event and ``q``.
+        :param q: the TX queue
+        :param block: wait for a first event rather than return None
+        :return: the frame, or None when nothing is queued
+        :rtype: Union[str, None]
+        """
+        first = self._take(q, block)
+        if first is None:
+            return None
+        self._packing = True
+        parts = [first if first.endswith('\n') else first + '\n']
+        size = len(parts[0])
+        deadline = time.monotonic() + self.window
+        while self.max_bytes:
+            remaining = deadline - time.monotonic()
+            item = self._take(q, remaining > 0, max(remaining, 0))
+            if item is None:
+                break
+            if not item.endswith('\n'):
+                item += '\n'
+            if size + len(item) > self.max_bytes:
+                self._carry = item
+                break
+            parts.append(item)
+            size += len(item)
+        self.stats['events'] += len(parts)
+        self.stats['frames'] += 1
+        self.stats['frames_saved'] += len(parts) - 1
+        self.stats['bytes'] += size
+        self._packing = False
+        return ''.join(parts)
+
+
 def record_factory_latest(version: str) -> None:
     """
     Record the latest factory firmware version the service advertises, for
@@ -282,17 +679,20 @@ def get_session() -> Session:
     s = Session()
     set_cfg('SESSION.USER_AGENT', 'OpenGlow/%s' % get_cfg('FACTORY_FIRMWARE.FW_VERSION'))
     s.headers.update({'user-agent': get_cfg('SESSION.USER_AGENT')})
+    # Records the session's requests, while a session is being recorded.
+    s.hooks['response'].append(record_response)
     logger.debug('Returning object : %s' % s)
     return s
 
 
-def img_upload(s: Session, img: bytes, msg: dict) -> bool:
+def img_upload(s: Session, img: Union[bytes, str, Path], msg: dict) -> bool:
     """
     Uploads head/lid image
     :param s: Requests Session object
     :type s: Session
     :param img: Path to file to upload, or bytes object containing image
-    :type img: bytes
+        (a presigned upload also takes any buffer or binary file object)
+    :type img: Union[bytes, str, Path]
     :param msg: WSS message
     :type msg: dict
     :return:
@@ -305,12 +705,16 @@ def img_upload(s: Session, img: bytes, msg: dict) -> bool:
         # action's "endpoint" field and the image is uploaded straight to it.
         # The presigned URL carries its own auth, so it must NOT go through the
         # authenticated Glowforge session (a Bearer header makes GCS reject it);
-        # PUT the raw bytes with a plain request.
-        r = requests.put(endpoint, data=img, headers={'Content-Type': 'image/jpeg'}, timeout=30)
-        ok = r.status_code in (200, 201, 204)
+        # PUT it on the credential-free upload session, which keeps the
+        # storage host's connection open for the next image.
+        r = upload_session().put_image(endpoint, img)
+        ok = bool(r) and r.status_code in (200, 201, 204)
     else:
         # Legacy fallback: POST to the app server (pre-2.6.0 behavior).
         url = get_cfg('SERVICE.SERVER_URL') + '/api/machines/%s/%s' % (msg['action_type'], msg['id'])
+        if isinstance(img, (str, Path)):
+            with open(img, 'rb') as f:
+                img = f.read()
         r = request(s, url, 'POST', data=img, headers={'Content-Type': 'image/jpeg'})
         ok = bool(r)
     if not ok:
@@ -403,8 +807,153 @@ def _declared_length(r) -> int:
         return 0
 
 
+# A download that breaks off is resumed from where it stopped, up to this
+# many times, after a pause that doubles from the first to the cap.
+DOWNLOAD_RESUMES = 5
+_RESUME_BACKOFF = 0.5
+_RESUME_BACKOFF_MAX = 8.0
+
+# What a connection dropping mid-body raises, depending on the layer that
+# notices: requests, urllib3, or the socket itself.
+_BROKEN_DOWNLOAD = (requests.RequestException, urllib3.exceptions.HTTPError, OSError)
+
+
+def _validator(r) -> Union[str, None]:
+    """What If-Range can name the body by: a strong ETag, else Last-Modified."""
+    headers = getattr(r, 'headers', None) or {}
+    etag = headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('last-modified')
+
+
+def _content_range(r) -> tuple:
+    """(first byte, complete length) from a 206's Content-Range; either is
+    None when it cannot be read, the length also when the server says '*'."""
+    try:
+        unit, _, spec = r.headers.get('content-range', '').partition(' ')
+        span, _, total = spec.partition('/')
+        return int(span.partition('-')[0]), (None if total == '*' else int(total))
+    except (AttributeError, ValueError):
+        return None, None
+
+
+class _ResumableBody:
+    """
+    The raw body of a download, picked up again where it broke off.
+    When the connection drops mid-body the rest is asked for with a Range
+    request from the last byte received, and an If-Range naming the body
+    by its ETag (or Last-Modified), so that a job changed on the server in
+    between comes back whole, and is refused, rather than being spliced
+    onto the start of the old one. A service that names its body neither
+    way is not resumed.
+
+    The pieces are what _body_stream gives, so the bytes held are counted
+    against the same budget however many connections brought them in, and a
+    resumed response declaring a body past ``reject_bytes`` is refused
+    before it is read. ``close()`` may be called from any thread: it drops
+    the connection in use and ends the download instead of resuming it.
+    """
+    def __init__(self, s: Session, url: str, r, reject_bytes: int = 0,
+                 resumes: int = DOWNLOAD_RESUMES):
+        """
+        Class Initializer
+        :param s: Requests Session the first response came from
+        :param url: Target URL
+        :param r: the first response, status 200, not yet read
+        :param reject_bytes: refuse a resumed body declared past this size
+        :param resumes: attempts to pick up a broken download, 0 for none
+        """
+        self._s = s
+        self._url = url
+        self._r = r
+        self._reject = reject_bytes
+        self._resumes = resumes
+        self._validator = _validator(r)
+        self._closed = Event()
+        self.received = 0
+        self.resumed = 0
+
+    def __iter__(self):
+        attempt = 0
+        while True:
+            try:
+                for piece in _body_stream(self._r):
+                    self.received += len(piece)
+                    yield piece
+                return
+            except _BROKEN_DOWNLOAD as e:
+                broke = e
+            self._r.close()
+            r = None
+            while r is None:
+                if self._closed.is_set():
+                    raise PulseSourceError('pulse download closed after %d bytes' % self.received)
+                if self._validator is None:
+                    raise PulseSourceError('pulse download broke off after %d bytes and cannot be '
+                                           'resumed, the service names no version of it: %s'
+                                           % (self.received, broke))
+                attempt += 1
+                if attempt > self._resumes:
+                    raise PulseSourceError('pulse download broke off after %d bytes; %d resumes '
+                                           'failed: %s' % (self.received, self._resumes, broke))
+                delay = min(_RESUME_BACKOFF * 2 ** (attempt - 1), _RESUME_BACKOFF_MAX)
+                logger.warning('pulse download broke off after %d bytes (%s); resuming in %.1fs '
+                               '(%d of %d)' % (self.received, broke, delay, attempt, self._resumes))
+                if self._closed.wait(delay):
+                    continue
+                r = self._resume()
+            self._r = r
+            self.resumed += 1
+
+    def _resume(self):
+        """Ask for the rest of the body; None to try again later."""
+        r = request(self._s, self._url, 'GET', stream=True, accept=(200, 206),
+                    headers={'Range': 'bytes=%d-' % self.received, 'If-Range': self._validator})
+        if not r:
+            return None
+        if r.status_code != 206:
+            r.close()
+            raise PulseSourceError('the service answered the resume with the whole body: the job '
+                                   'changed on the server, or it does not serve ranges')
+        start, total = _content_range(r)
+        if start != self.received:
+            r.close()
+            raise PulseSourceError('asked to resume at byte %d, given byte %s'
+                                   % (self.received, start))
+        if self._reject and total and total > self._reject:
+            r.close()
+            raise PulseSourceError('pulse body past %d bytes' % self._reject)
+        if self._closed.is_set():
+            r.close()
+            raise PulseSourceError('pulse download closed after %d bytes' % self.received)
+        return r
+
+    def close(self) -> None:
+        """Drop the connection and end the download."""
+        self._closed.set()
+        self._r.close()
+
+
+def _bounded_body(pieces, declared: int, warn_bytes: int, reject_bytes: int):
+    """The body as ``pieces`` give it, refused once it runs past
+    ``reject_bytes`` and logged once it ends past ``warn_bytes``."""
+    total = 0
+    for piece in pieces:
+        total += len(piece)
+        if reject_bytes and total > reject_bytes:
+            logger.error('refusing the job: the download passed the %d bytes this '
+                         'machine will hold (%d declared)' % (reject_bytes, declared))
+            raise PulseSourceError('pulse body past %d bytes' % reject_bytes)
+        yield piece
+    if warn_bytes and total >= warn_bytes:
+        logger.warning('this job is %d bytes of pulse data, past the %d that is '
+                       'the usual ceiling; the machine will run it' % (total, warn_bytes))
+
+
 def fetch_motion(s: Session, url: str, warn_bytes: int = PULSE_WARN_BYTES,
-                 reject_bytes: int = PULSE_REJECT_BYTES) -> tuple:
+                 reject_bytes: int = PULSE_REJECT_BYTES, prefetch: int = 0,
+                 pipeline: bool = False, resumes: int = DOWNLOAD_RESUMES, cache=None) -> tuple:
     """Downloads a motion/print job into memory and parses its header.
 
     Returns ``(info, source)``, or ``(False, None)`` if the job is not one
@@ -418,12 +967,47 @@ def fetch_motion(s: Session, url: str, warn_bytes: int = PULSE_WARN_BYTES,
     that declares nothing - or declares wrongly - would otherwise be trusted
     with all the memory there is. Either may be 0 to lift it.
 
+    With ``pipeline`` set this returns as soon as the header is in and has
+    passed check_puls_header, and the source is a PulseStream still reading
+    the rest: the ring is fed while the download runs, and a job that will
+    be refused is refused without downloading it. The price is that a body
+    running past ``reject_bytes`` is found while it is being read, and fails
+    that read instead of this call, and that ``program_size`` is unknown
+    until the download is done.
+
+    A download that breaks off is resumed from the last byte received, up to
+    ``resumes`` times with a growing pause between tries, as long as the
+    service still has the same body (see _ResumableBody).
+
+    With a JobCache, a job kept there is asked for with a conditional GET,
+    and a 304 answers from the cache without a download; a body downloaded
+    whole that the cache already holds is recognised by its hash. Either
+    way ``info`` comes back with ``cached`` set and the statistics filled
+    in, so load_motion skips its statistics pass. ``info['validators']``
+    holds the ETag / Last-Modified to keep a new job under.
+
     :param s: Requests Session object
     :param url: Target URL
     :param warn_bytes: log a body at or past this size
     :param reject_bytes: refuse a body past this size
+    :param prefetch: payload bytes for the source to inflate ahead on a
+        worker thread, 0 to inflate as it is read (see PulseSource)
+    :param pipeline: hand back the source before the body is all in
+    :param resumes: times to resume a download that breaks off, 0 for none
+    :param cache: JobCache to answer from, or None
     """
-    r = request(s, url, 'GET', stream=True)
+    if cache is not None:
+        r = request(s, url, 'GET', stream=True, headers=cache.conditional(url), accept=(200, 304))
+    else:
+        r = request(s, url, 'GET', stream=True)
+    if cache is not None and r and r.status_code == 304:
+        r.close()
+        job = cache.get(url)
+        if job is not None:
+            logger.info('pulse data unchanged on the service; using the cached job')
+            return _cached_job(job, prefetch)
+        # Gone from the cache since it was asked for: fetch it after all.
+        r = request(s, url, 'GET', stream=True)
     if not r:
         logger.error('pulse data download failed')
         return False, None
@@ -433,48 +1017,206 @@ def fetch_motion(s: Session, url: str, warn_bytes: int = PULSE_WARN_BYTES,
                      'past the %d this machine will hold' % (declared, reject_bytes))
         r.close()
         return False, None
-    body = bytearray()
-    for piece in _body_stream(r):
-        body += piece
-        if reject_bytes and len(body) > reject_bytes:
-            logger.error('refusing the job: the download passed the %d bytes this '
-                         'machine will hold (%d declared)' % (reject_bytes, declared))
-            r.close()
+    body = _ResumableBody(s, url, r, reject_bytes, resumes)
+    if pipeline:
+        try:
+            source = PulseStream(_bounded_body(body, declared, warn_bytes, reject_bytes),
+                                 on_done=body.close, prefetch=prefetch)
+        except PulseSourceError as e:
+            logger.error('%s' % e)
+            return False, None
+    else:
+        pieces = body
+        body = bytearray()
+        try:
+            for piece in _bounded_body(pieces, declared, warn_bytes, reject_bytes):
+                body += piece
+        except PulseSourceError as e:
+            logger.error('pulse data download failed: %s' % e)
+            pieces.close()
+            return False, None
+        job = cache.match(url, body, **_response_validators(r)) if cache else None
+        if job is not None:
+            logger.info('pulse data matches a cached job')
+            return _cached_job(job, prefetch)
+        try:
+            source = PulseSource(body, prefetch=prefetch)
+        except PulseSourceError as e:
+            logger.error('%s' % e)
             return False, None
-    if warn_bytes and len(body) >= warn_bytes:
-        logger.warning('this job is %d bytes of pulse data, past the %d that is '
-                       'the usual ceiling; the machine will run it' % (len(body), warn_bytes))
-    try:
-        source = PulseSource(body)
-    except PulseSourceError as e:
-        logger.error('%s' % e)
-        return False, None
     # Validate everything the run-time math depends on BEFORE the first byte
     # reaches the ring: a refusal past that point leaves a job loaded with
     # nobody to run it.
     reason = check_puls_header(source.header, get_cfg('MACHINE.SERIAL'))
     if reason is not None:
         logger.error('refusing the job: %s' % reason)
+        source.close()
         return False, None
-    logger.info('pulse data is %s, %d byte body' %
-                ('gzip-compressed' if source.compressed else 'uncompressed',
-                 source.body_size))
+    if pipeline:
+        logger.info('pulse data is %s, streaming (%d bytes declared)' %
+                    ('gzip-compressed' if source.compressed else 'uncompressed', declared))
+    else:
+        logger.info('pulse data is %s, %d byte body' %
+                    ('gzip-compressed' if source.compressed else 'uncompressed',
+                     source.body_size))
     info = {
         'header_data': source.header,
         'header_len': source.header_len,
         'size': 0,
         'run_time': None,
         'stats': None,
+        'laser': None,
+        'cached': False,
+        'validators': _response_validators(r),
     }
     return info, source
 
 
+def _response_validators(r) -> dict:
+    """The ETag and Last-Modified a response names its body by."""
+    headers = getattr(r, 'headers', None) or {}
+    return {'etag': headers.get('etag'), 'last_modified': headers.get('last-modified')}
+
+
+def _cached_job(job: dict, prefetch: int) -> tuple:
+    """fetch_motion's answer for a job from the cache: a source over the kept
+    body and the info kept with it. The kept header is not parsed again, but
+    it is checked again, as the machine it is checked against may not be the
+    one that kept it."""
+    header = (job['header_data'], job['header_raw']) if job.get('header_raw') else None
+    try:
+        source = PulseSource(job['body'], prefetch=prefetch, header=header)
+    except PulseSourceError as e:
+        logger.error('cached job unreadable: %s' % e)
+        return False, None
+    reason = check_puls_header(source.header, get_cfg('MACHINE.SERIAL'))
+    if reason is not None:
+        logger.error('refusing the job: %s' % reason)
+        source.close()
+        return False, None
+    info = {key: job[key] for key in ('header_data', 'header_len', 'size', 'stats', 'laser')}
+    info['run_time'] = motion_run_time(info, info['size'])
+    info['cached'] = True
+    info['validators'] = {}
+    return info, source
+
+
 def motion_run_time(info: dict, size: int) -> timedelta:
     """Playing time of ``size`` payload bytes at the job's step frequency."""
     return timedelta(seconds=size / info['header_data']['STfr'])
 
 
-def load_motion(s: Session, url: str, out_file) -> Union[dict, bool]:
+# Body bytes a probe asks for first, and the most it will ask for when a
+# header turns out longer than that.
+_PROBE_BYTES = 8 * 1024
+_PROBE_MAX = 64 * 1024
+
+
+def _probe_range(s: Session, url: str, spec: str, limit: int) -> tuple:
+    """
+    Up to ``limit`` raw body bytes of a Range request, and the whole body's
+    size when the answer says it. A service that ignores the Range sends the
+    whole body; only the first ``limit`` bytes of it are read.
+    :return: (bytes, whole body size or None, True when the range was served),
+        or (None, None, False) when the request failed
+    :rtype: tuple
+    """
+    r = request(s, url, 'GET', stream=True, headers={'Range': spec}, accept=(200, 206))
+    if not r:
+        return None, None, False
+    try:
+        ranged = r.status_code == 206
+        total = _content_range(r)[1] if ranged else (_declared_length(r) or None)
+        data = bytearray()
+        if ranged or not spec.startswith('bytes=-'):
+            for piece in _body_stream(r):
+                data += piece
+                if len(data) >= limit:
+                    break
+        return bytes(data[:limit]), total, ranged
+    except _BROKEN_DOWNLOAD as e:
+        logger.error('probe failed: %s' % e)
+        return None, None, False
+    finally:
+        r.close()
+
+
+def probe_motion(s: Session, url: str) -> Union[dict, bool]:
+    """
+    What a motion/print job is, without downloading it.
+
+    Asks for the first few KB of the body, enough to parse the header (a
+    compressed body is inflated only that far), and for its last four
+    bytes, the gzip ISIZE trailer, which gives the job's inflated length.
+    From those come ``program_size`` and ``run_time``, so a job can be
+    admitted, refused or scheduled before any memory or link time is spent
+    on it. ``refusal`` is what check_puls_header would refuse it for, or None.
+
+    A service that does not serve ranges answers with the whole body: the
+    head of it is still read, and the connection dropped, but the trailer
+    cannot be had that way, so ``program_size`` and ``run_time`` are then
+    None, as they are for any length the trailer cannot vouch for.
+
+    :param s: Requests Session object
+    :type s: Session
+    :param url: Target URL
+    :type url: str
+    :return: ``header_data``, ``header_len``, ``compressed``, ``body_size``
+        (None when not declared), ``program_size``, ``run_time`` and
+        ``refusal``; False when the header could not be had
+    :rtype: Union[dict, bool]
+    """
+    want = _PROBE_BYTES
+    while True:
+        head, body_size, ranged = _probe_range(s, url, 'bytes=0-%d' % (want - 1), want)
+        if head is None:
+            logger.error('pulse probe failed')
+            return False
+        try:
+            header, raw = read_header(head)
+            break
+        except HeaderTruncated as e:
+            # Only a header longer than the probe is worth a second try.
+            if len(head) < want or want >= _PROBE_MAX:
+                logger.error('pulse probe: %s' % e)
+                return False
+            want *= 4
+        except PulseSourceError as e:
+            logger.error('pulse probe: %s' % e)
+            return False
+    compressed = head[:2] == b'\x1f\x8b'
+    header_bytes = len(raw)
+    program_size = None
+    if not compressed:
+        if body_size is not None:
+            program_size = max(0, body_size - header_bytes)
+    elif ranged:
+        trailer, _, tail_ranged = _probe_range(s, url, 'bytes=-4', 4)
+        if tail_ranged and trailer is not None and len(trailer) == 4:
+            isize = struct.unpack('<I', trailer)[0]
+            # As PulseSource: a trailer short of the header is a truncated or
+            # multi-member stream, not a length to schedule by.
+            if isize >= header_bytes:
+                program_size = isize - header_bytes
+    info = {
+        'header_data': header,
+        'header_len': header_bytes - 8,
+        'compressed': compressed,
+        'body_size': body_size,
+        'program_size': program_size,
+        'run_time': None,
+        'refusal': check_puls_header(header, get_cfg('MACHINE.SERIAL')),
+    }
+    if program_size is not None and info['refusal'] is None:
+        info['run_time'] = motion_run_time(info, program_size)
+    logger.info('pulse probe: %s, %s payload bytes' % (
+        'gzip-compressed' if compressed else 'uncompressed',
+        'unknown' if program_size is None else program_size))
+    return info
+
+
+def load_motion(s: Session, url: str, out_file, pipeline: bool = False,
+                cache=False) -> Union[dict, bool]:
     """
     Downloads a motion/print file and writes all of it out.
 
@@ -488,12 +1230,20 @@ def load_motion(s: Session, url: str, out_file) -> Union[dict, bool]:
     :type url: str
     :param out_file: Where to write the results
     :type out_file: str
+    :param pipeline: write while the download runs (see fetch_motion)
+    :type pipeline: bool
+    :param cache: JobCache to answer from and keep the job in; the default
+        is the one MOTION.CACHE_DIR configures, None for none
     :return: Header dict or False on failure
     :rtype: Union[dict, bool]
     """
-    info, source = fetch_motion(s, url)
+    if cache is False:
+        cache = job_cache()
+    info, source = fetch_motion(s, url, pipeline=pipeline, cache=cache)
     if not info:
         return False
+    # A cached job comes with its statistics; the pass over it is only a copy.
+    counting = not info['cached']
 
     # out_file may be a path or an already-open binary file object. A machine
     # streaming to the exclusive-open pulse device holds one flock'd fd for
@@ -527,15 +1277,20 @@ def load_motion(s: Session, url: str, out_file) -> Union[dict, bool]:
             save_puls = False
 
     size = 0
-    stat = None
+    stats = StepStatsAccumulator() if counting else None
+    laser = LaserPowerAccumulator() if counting else None
     with out_ctx as f:
         try:
             while True:
-                chunk = source.read(_WRITE_CHUNK)
+                # A view of the inflater's own output: the write to the ring
+                # is the only copy the payload sees on its way through.
+                chunk = source.read_view(_WRITE_CHUNK)
                 if not chunk:
                     break
                 size += len(chunk)
-                stat = decode_all_steps(chunk, stat)
+                if counting:
+                    stats.update(chunk)
+                    laser.update(chunk)
                 f.write(chunk)
                 if raw:
                     try:
@@ -552,13 +1307,25 @@ def load_motion(s: Session, url: str, out_file) -> Union[dict, bool]:
             logger.error('pulse write failed after %d bytes - the job may exceed '
                          'the device ring capacity: %s' % (size, e))
             raise
+        except PulseSourceError as e:
+            # Only a pipelined download fails this late, with the job part
+            # written: the caller safes the machine as for any failed load.
+            logger.error('pulse data failed after %d bytes: %s' % (size, e))
+            return False
         finally:
             if raw:
                 raw.close()
 
     info['size'] = size
     info['run_time'] = motion_run_time(info, size)
-    info['stats'] = stat
+    if counting:
+        # An empty job reports no statistics rather than a page of zeros.
+        info['stats'] = stats.result() if size else None
+        info['laser'] = laser.result(info['header_data']['STfr'])
+        # A pipelined download that was abandoned has no whole body to keep.
+        if cache is not None and getattr(source, 'downloaded', True):
+            cache.store(url, source.body, info, header_raw=source.header_raw,
+                        **info['validators'])
     if save_puls:
         try:
             with open(base_file_name + '.info', 'w') as jf:
@@ -570,7 +1337,7 @@ def load_motion(s: Session, url: str, out_file) -> Union[dict, bool]:
 
 
 def request(s: Session, url: str, method: str, timeout: int = 15, stream: bool = False,
-            _retry_auth: bool = True, **kwargs) -> Union[Response, bool]:
+            _retry_auth: bool = True, accept: tuple = (200,), **kwargs) -> Union[Response, bool]:
     """
     Submits requests to provided url using the established Session object
     :param s: Requests Session object
@@ -586,6 +1353,9 @@ def request(s: Session, url: str, method: str, timeout: int = 15, stream: bool =
     :param _retry_auth: on a 401, re-sign-in and replay the request once.
         The sign-in request itself passes False to avoid recursion.
     :type _retry_auth: bool
+    :param accept: the statuses that are an answer; only a caller that asked
+        for a range or made the request conditional expects a 206 or a 304
+    :type accept: tuple
     :param kwargs:
     :return: Requests Response object, or False on error.
     :rtype: Union[Response, bool]
@@ -607,8 +1377,8 @@ def request(s: Session, url: str, method: str, timeout: int = 15, stream: bool =
         from gfutilities.service.authentication import authenticate_machine
         if authenticate_machine(s):
             return request(s, url, method, timeout=timeout, stream=stream,
-                           _retry_auth=False, **kwargs)
-    if r.status_code != 200:
+                           _retry_auth=False, accept=accept, **kwargs)
+    if r.status_code not in accept:
         logger.error('FAILED: ' + r.reason)
         return False
     return r
@@ -621,21 +1391,21 @@ def send_wss_event(msg_q_tx: Queue, action_id: Union[int, None], event: str, **k
         response_id += 1
         rid = response_id
 
-    if msg_q_tx.qsize() >= TX_QUEUE_MAX:
-        logger.warning('event TX queue full (socket down?); dropping %s' % event)
-        return
-
     if 'data' in kwargs:
         data = ',"%s":%s' % (kwargs['data']['key'], kwargs['data']['value'])
     else:
         data = ''
     if action_id is None:
-        action_id = ''
+        action_field = ''
     else:
-        action_id = '"action_id":%s,' % action_id
-    msg_q_tx.put(u'{"id":%s,"timestamp":%s,"type":"event","version":1,'
-                 u'%s"level":"INFO","event":"%s"%s}\n' %
-                 (rid, int(((time.time() - start_time) * 100) + 3800), action_id, event, data))
+        action_field = '"action_id":%s,' % action_id
+    outcome = event.split(':', 1)[-1]
+    priority = TX_TERMINAL if outcome in _TERMINAL_OUTCOMES else TX_LIFECYCLE
+    frame = (u'{"id":%s,"timestamp":%s,"type":"event","version":1,'
+             u'%s"level":"INFO","event":"%s"%s}\n' %
+             (rid, int(((time.time() - start_time) * 100) + 3800), action_field, event, data))
+    if not _enqueue(msg_q_tx, frame, priority, action_id):
+        logger.warning('event TX queue full (socket down?); dropping %s' % event)
 
 
 def send_wss_progress(msg_q_tx: Queue, action_id: Union[int, None], progress: str,
@@ -650,11 +1420,12 @@ def send_wss_progress(msg_q_tx: Queue, action_id: Union[int, None], progress: st
     a transfer and in playback ticks for a run.
 
     A frame that cannot be sent is dropped rather than queued: progress is
-    perishable, and the next one is thirty seconds behind it.
+    perishable, and the next one is thirty seconds behind it. On a TxQueue
+    it replaces whatever progress of the action is still waiting instead.
     """
     global response_id
     global start_time
-    if msg_q_tx.qsize() >= TX_QUEUE_MAX:
+    if not isinstance(msg_q_tx, TxQueue) and msg_q_tx.qsize() >= TX_QUEUE_MAX:
         logger.warning('event TX queue full (socket down?); dropping %s' % progress)
         return
     with _response_id_lock:      # called from several threads
@@ -671,7 +1442,7 @@ def send_wss_progress(msg_q_tx: Queue, action_id: Union[int, None], progress: st
     if values:
         frame += ',"settings":{"values":%s}' % json.dumps(values, sort_keys=True,
                                                           separators=(',', ':'))
-    msg_q_tx.put(frame + '}\n')
+    _enqueue(msg_q_tx, frame + '}\n', TX_PROGRESS, action_id)
 
 
 def update_header(s: Session, header: str, value: str) -> bool:
@@ -690,11 +1461,14 @@ def update_header(s: Session, header: str, value: str) -> bool:
     return True
 
 
-def ws_connect(msg_q_rx: Queue, msg_q_tx: Queue, session: Session = None) -> Union['WsClient', bool]:
+def ws_connect(msg_q_rx: Queue, msg_q_tx: Queue, session: Session = None,
+               on_receive=None, loop=None) -> Union['WsClient', bool]:
     """
     Establishes Web Socket Session.
     Returns the running client so the caller can stop it cleanly
-    (WsClient.shutdown) when the session ends.
+    (WsClient.shutdown) when the session ends. SERVICE.WS_CLIENT set to
+    ``asyncio`` picks AsyncWsClient over the threaded WsClient; the two
+    are used the same way.
     :param msg_q_rx: WSS RX essage Queue
     :type msg_q_rx: Queue
     :param msg_q_tx: WSS TX Message Queue
@@ -702,24 +1476,32 @@ def ws_connect(msg_q_rx: Queue, msg_q_tx: Queue, session: Session = None) -> Uni
     :param session: authenticated Session used to refresh the single-use
         ws_token on reconnect (see WsClient); None keeps a single-connect client
     :type session: Session
-    :return: the connected WsClient, or False on failure
+    :param on_receive: called on the receive thread with every message
+        before it is queued (see WsClient)
+    :param loop: an asyncws EventLoopThread for the asyncio client to run
+        on, shared with others; the threaded client has no use for it
+    :return: the connected client, or False on failure
     :rtype: Union[WsClient, bool]
     """
     logger.info('CONNECTING')
-    ws = WsClient(msg_q_rx, msg_q_tx, session)
+    if get_cfg('SERVICE.WS_CLIENT') == 'asyncio':
+        # Lazy import: asyncws imports this module.
+        from gfutilities.service.asyncws import AsyncWsClient
+        ws = AsyncWsClient(msg_q_rx, msg_q_tx, session, loop=loop)
+    else:
+        ws = WsClient(msg_q_rx, msg_q_tx, session)
+    ws.on_receive = on_receive
     ws.start()
-    ws_ready = False
-    # Wait 15 seconds for session to establish, or error out
-    for x in range(0, 16):
-        if not ws.ready:
-            time.sleep(1)
-        else:
-            ws_ready = True
-            break
-    if ws_ready:
+    # Wait 15 seconds for session to establish, or error out. Looked at
+    # often: the service sends its first action the moment the socket
+    # opens, and it waits in the queue until this returns.
+    deadline = time.monotonic() + 15
+    while not ws.ready and time.monotonic() < deadline:
+        time.sleep(0.02)
+    if ws.ready:
         logger.info('ESTABLISHED')
         return ws
     else:
         logger.error('FAILED')
-        ws.stop = True
+        ws.shutdown(timeout=0)
         return False
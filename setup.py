@@ -18,6 +18,12 @@ setup(
         'urllib3>=2',
         'websocket-client>=1.7',
     ],
+    extras_require={
+        # Vectorized pulse-stream decoding; everything works without it.
+        'numpy': ['numpy'],
+        # The asyncio websocket client (SERVICE.WS_CLIENT = asyncio).
+        'asyncio': ['websockets>=13'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
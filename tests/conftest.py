@@ -0,0 +1,77 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import sys
+import threading
+import zlib
+
+import pytest
+
+from gfutilities.configuration import set_cfg
+
+
+def make_job(payload: bytes, compress: bool = True, serial: int = 0, extra: int = 0) -> bytes:
+    """A pulse file, gzip-compressed as the service serves one unless
+    ``compress`` is unset; ``extra`` further tags make a longer header."""
+    fields = (b'STfr' + (10000).to_bytes(4, 'little')
+              + b'MCsn' + serial.to_bytes(4, 'little')
+              + b'PDfm' + (0).to_bytes(4, 'little'))
+    fields += b''.join(b'T%03x' % n + n.to_bytes(4, 'little') for n in range(extra))
+    raw = b'\x00GF1' + (8 + len(fields)).to_bytes(4, 'little') + fields + payload
+    if not compress:
+        return raw
+    packer = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return packer.compress(raw) + packer.flush()
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """Base of a job host's handler: HTTP/1.1 and quiet. Each test file
+    adds the do_GET its tests need."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+
+class _JobServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The downloads under test hang up mid-response on purpose (a probe
+        # has read what it wanted, a resume test cuts the connection).
+        if isinstance(sys.exc_info()[1], OSError):
+            return
+        ThreadingHTTPServer.handle_error(self, request, client_address)
+
+
+@pytest.fixture
+def job_host():
+    """
+    Start a job host on localhost: ``job_host(handler, body, **attributes)``
+    serves body at the returned server's ``url`` through handler, a
+    JobHandler, which finds body, ``requests`` (empty) and the attributes
+    on its server.
+    """
+    servers = []
+
+    def start(handler, body, **attributes):
+        set_cfg('MACHINE.SERIAL', None)
+        server = _JobServer(('127.0.0.1', 0), handler)
+        server.body = body
+        server.requests = []
+        server.url = 'http://127.0.0.1:%d/job.puls' % server.server_port
+        for name, value in attributes.items():
+            setattr(server, name, value)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,312 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import asyncio
+from queue import Queue
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('websockets')
+
+from websockets.asyncio.server import serve
+
+from gfutilities.configuration import set_cfg
+from gfutilities.service import websocket as ws
+from gfutilities.service.asyncws import AsyncWsClient
+
+
+class _Service:
+    """A status service on localhost: records what it receives, sends what
+    it is told to, and can drop every connection."""
+
+    def __init__(self):
+        self.received = Queue()
+        self.paths = []
+        self.connections = []
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        assert self._started.wait(5)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._serve())
+
+    async def _serve(self):
+        self._stop = asyncio.Event()
+        async with serve(self._handler, '127.0.0.1', 0, subprotocols=['glowforge']) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self._started.set()
+            await self._stop.wait()
+
+    async def _handler(self, conn):
+        self.paths.append(conn.request.path)
+        self.connections.append(conn)
+        async for message in conn:
+            self.received.put((time.monotonic(), message))
+
+    def send(self, text):
+        asyncio.run_coroutine_threadsafe(self.connections[-1].send(text), self._loop).result(5)
+
+    def drop(self):
+        for conn in list(self.connections):
+            asyncio.run_coroutine_threadsafe(conn.close(), self._loop).result(5)
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(5)
+
+
+@pytest.fixture
+def service():
+    svc = _Service()
+    set_cfg('SERVICE.STATUS_SERVICE_URL', 'ws://127.0.0.1:%d' % svc.port)
+    set_cfg('SESSION.WS_TOKEN', 'TOKEN')
+    set_cfg('SESSION.USER_AGENT', 'ua')
+    set_cfg('SERVICE.WS_CLIENT', 'asyncio')
+    yield svc
+    set_cfg('SERVICE.WS_CLIENT', None)
+    svc.close()
+
+
+def test_ws_connect_picks_the_asyncio_client(service):
+    client = ws.ws_connect(Queue(), Queue())
+    try:
+        assert isinstance(client, AsyncWsClient)
+        assert client.ready and client.is_alive()
+        assert service.paths == ['/TOKEN']
+    finally:
+        assert client.shutdown(timeout=5)
+    assert not client.is_alive()
+
+
+def test_frames_go_out_as_soon_as_they_are_queued(service):
+    q_tx = Queue()
+    client = ws.ws_connect(Queue(), q_tx)
+    try:
+        delays = []
+        for n in range(20):
+            queued = time.monotonic()
+            ws.send_wss_event(q_tx, 1, 'print:running:%d' % n)
+            arrived, message = service.received.get(timeout=5)
+            assert 'print:running:%d' % n in message
+            delays.append(arrived - queued)
+        # A 100 ms poll between the queue and the wire would put the median
+        # near 50 ms.
+        assert sorted(delays)[10] < 0.03
+        # The count is taken once send() returns, which can be after the
+        # service has the frame.
+        deadline = time.monotonic() + 1
+        while client.stats['sent'] < 20 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.stats['sent'] == 20
+    finally:
+        client.shutdown(timeout=5)
+
+
+def test_each_object_of_a_frame_is_queued_on_its_own(service):
+    q_rx = Queue()
+    client = ws.ws_connect(q_rx, Queue())
+    try:
+        service.send('{"id":32,"type":"log"}\n{"id":33,"type":"event"}')
+        assert q_rx.get(timeout=5) == '{"id":32,"type":"log"}'
+        assert q_rx.get(timeout=5) == '{"id":33,"type":"event"}'
+    finally:
+        client.shutdown(timeout=5)
+
+
+def test_reconnects_and_sends_what_queued_meanwhile(service, monkeypatch):
+    monkeypatch.setattr(AsyncWsClient, 'reconnect_delay', 0.2)
+    q_tx = Queue()
+    client = ws.ws_connect(Queue(), q_tx)
+    try:
+        service.drop()
+        deadline = time.monotonic() + 5
+        while client.ready and time.monotonic() < deadline:
+            time.sleep(0.01)
+        ws.send_wss_event(q_tx, 7, 'print:cancelled')
+        _, message = service.received.get(timeout=5)
+        assert 'print:cancelled' in message
+        assert client.stats['connects'] == 2
+        assert len(service.paths) == 2
+    finally:
+        client.shutdown(timeout=5)
+
+
+def test_an_outage_leaves_the_queue_its_order(service, monkeypatch):
+    q_tx = ws.TxQueue()
+    client = ws.ws_connect(Queue(), q_tx)
+    monkeypatch.setattr(client.reconnect, 'next_delay', lambda: 0.5)
+    try:
+        service.drop()
+        deadline = time.monotonic() + 5
+        while client.ready and time.monotonic() < deadline:
+            time.sleep(0.01)
+        for tick in range(20):
+            ws.send_wss_progress(q_tx, 9, 'print:progress', tick)
+            time.sleep(0.005)
+        ws.send_wss_event(q_tx, 9, 'print:cancelled')
+        # Nothing was taken from the queue while the socket was down, so
+        # the terminal event made the action's progress stale there.
+        _, message = service.received.get(timeout=5)
+        assert 'print:cancelled' in message and 'print:progress' not in message
+        assert q_tx.stats['stale'] == 1
+        time.sleep(0.2)
+        assert service.received.empty()
+    finally:
+        client.shutdown(timeout=5)
+
+
+def test_pings_measure_the_round_trip(service, monkeypatch):
+    monkeypatch.setattr(AsyncWsClient, 'ping_interval', 0.05)
+    client = ws.ws_connect(Queue(), Queue())
+    try:
+        deadline = time.monotonic() + 5
+        while client.stats['pings'] < 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        stats = client.stats
+        assert stats['pings'] >= 3
+        assert 0 <= stats['rtt_min'] <= stats['rtt_mean'] <= stats['rtt_max'] < 1
+    finally:
+        client.shutdown(timeout=5)
+
+
+def test_a_stopped_client_leaves_the_queue_to_the_next(service):
+    q_tx = Queue()
+    first = ws.ws_connect(Queue(), q_tx)
+    assert first.shutdown(timeout=5)
+    second = ws.ws_connect(Queue(), q_tx)
+    try:
+        ws.send_wss_event(q_tx, None, 'machine:ready')
+        _, message = service.received.get(timeout=5)
+        assert 'machine:ready' in message
+    finally:
+        second.shutdown(timeout=5)
+
+
+def test_an_idle_bridge_sleeps_until_shutdown_wakes_it(service):
+    q_tx = Queue()
+    client = ws.ws_connect(Queue(), q_tx)
+    takes = []
+    next_frame = client.coalescer.next_frame
+    client.coalescer.next_frame = lambda *a, **kw: takes.append(1) or next_frame(*a, **kw)
+    time.sleep(0.6)
+    assert takes == []
+    started = time.monotonic()
+    assert client.shutdown(timeout=5)
+    client._bridge_thread.join(1)
+    assert not client._bridge_thread.is_alive()
+    assert time.monotonic() - started < 0.5
+    assert takes == []
+
+
+def test_clients_share_a_loop_in_scopes_of_their_own(service):
+    from gfutilities.configuration import get_cfg, use_scope
+    from gfutilities.service.asyncws import EventLoopThread
+
+    shared = EventLoopThread()
+    shared.start()
+    clients, queues = [], []
+    try:
+        for n in range(2):
+            q_tx = Queue()
+            with use_scope({'SESSION.WS_TOKEN': 'TOKEN%d' % n}):
+                clients.append(ws.ws_connect(Queue(), q_tx, loop=shared))
+            queues.append(q_tx)
+        assert sorted(service.paths) == ['/TOKEN0', '/TOKEN1']
+        for n, q_tx in enumerate(queues):
+            ws.send_wss_event(q_tx, None, 'machine:ready:%d' % n)
+            _, message = service.received.get(timeout=5)
+            assert 'machine:ready:%d' % n in message
+        assert all(client.is_alive() and client._loop is shared.loop for client in clients)
+    finally:
+        for client in clients:
+            assert client.shutdown(timeout=5)
+        assert shared.shutdown(timeout=5)
+    assert get_cfg('SESSION.WS_TOKEN') == 'TOKEN'
+
+
+def test_gfuiservice_hands_each_message_to_on_receive(service):
+    from gfutilities.service.gfuiservice import GFUIService
+
+    class _Machine:
+        def __init__(self):
+            self.cancelled = []
+
+        def cancel_running(self, action_id, received=None):
+            self.cancelled.append(action_id)
+
+    seen = []
+    svc = GFUIService(_Machine(), on_receive=seen.append)
+    svc.session = None
+    svc._ws = ws.ws_connect(svc.q_msg_rx, svc.q_msg_tx, on_receive=svc._received)
+    try:
+        service.send('{"id":7,"status":"cancelled"}')
+        assert svc.q_msg_rx.get(timeout=5) == '{"id":7,"status":"cancelled"}'
+        assert seen == ['{"id":7,"status":"cancelled"}']
+        assert svc._machine.cancelled == [7]
+    finally:
+        svc._ws.shutdown(timeout=5)
+
+
+def test_the_gfuiservice_loop_runs_on_either_client(service):
+    from gfutilities.service.gfuiservice import GFUIService
+
+    class _Machine:
+        def start(self, session, q_tx):
+            ws.send_wss_event(q_tx, None, 'machine:started')
+
+        def stop(self):
+            pass
+
+    svc = GFUIService(_Machine())
+    svc._ws = ws.ws_connect(svc.q_msg_rx, svc.q_msg_tx)
+    runner = threading.Thread(target=svc.run)
+    runner.start()
+    _, message = service.received.get(timeout=5)
+    assert 'machine:started' in message
+    svc.request_stop()
+    runner.join(5)
+    assert not runner.is_alive()
+    assert svc._ws is None
+
+
+def test_events_queued_together_go_out_together(service):
+    q_tx = Queue()
+    for phase in ('print:download:completed', 'print:warmup:starting', 'print:running'):
+        ws.send_wss_event(q_tx, 3, phase)
+    client = ws.ws_connect(Queue(), q_tx)
+    try:
+        _, message = service.received.get(timeout=5)
+        assert [m.split('"event":"')[1].split('"')[0] for m in ws.split_frame(message)] == \
+            ['print:download:completed', 'print:warmup:starting', 'print:running']
+        assert client.coalescer.stats['frames_saved'] == 2
+    finally:
+        client.shutdown(timeout=5)
+
+
+def test_disconnect_flushes_what_the_client_has_taken(service):
+    from gfutilities.service.gfuiservice import GFUIService
+
+    set_cfg('SERVICE.TX_COALESCE_MS', 300)
+    try:
+        svc = GFUIService(None)
+        svc._ws = ws.ws_connect(svc.q_msg_rx, svc.q_msg_tx)
+        ws.send_wss_event(svc.q_msg_tx, 4, 'print:completed')
+        # The client has the event, packing a frame around it: the queue
+        # is empty, and the event is not out yet.
+        deadline = time.monotonic() + 5
+        while not svc.q_msg_tx.empty() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        svc._disconnect()
+        _, message = service.received.get(timeout=1)
+        assert 'print:completed' in message
+    finally:
+        set_cfg('SERVICE.TX_COALESCE_MS', None)
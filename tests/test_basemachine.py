@@ -7,6 +7,8 @@ SPDX-License-Identifier:    MIT
 """
 import json
 from queue import Queue
+import threading
+import time
 
 from gfutilities.device import basemachine
 from gfutilities.device.basemachine import BaseMachine
@@ -89,7 +91,7 @@ def test_cancel_of_other_action_ignored():
 def test_user_image_captures_bed_and_emits_lifecycle():
     m = StubMachine()
     m.run_capture({'action_type': 'user_image', 'id': 3, 'status': 'ready'})
-    m._action_thread.join(timeout=5)
+    assert m.wait_idle(5)
     assert m.lid_captured == 1
     assert _events(m._q_msg_tx) == ['user_image:starting', 'user_image:completed']
     assert m.running_action_id is None
@@ -116,7 +118,7 @@ def test_lid_image_records_action_settings():
     m = StubMachine()
     m.run_capture({'action_type': 'lid_image', 'id': 4, 'status': 'ready',
                    'settings': {'LCfl': 1}})
-    m._action_thread.join(timeout=5)
+    assert m.wait_idle(5)
     assert m._action_settings == {'LCfl': 1}
 
 
@@ -124,7 +126,7 @@ def test_head_image_receives_normalized_settings():
     m = StubMachine()
     m.run_capture({'action_type': 'head_image', 'id': 5, 'status': 'ready',
                    'settings': {'HCil': 3, 'HCex': 2047}})
-    m._action_thread.join(timeout=5)
+    assert m.wait_idle(5)
     assert m.head_settings == {'HCil': 3, 'HCex': 2047}
     assert m._action_settings == {'HCil': 3, 'HCex': 2047}
 
@@ -132,7 +134,7 @@ def test_head_image_receives_normalized_settings():
 def test_head_image_without_settings_passes_none():
     m = StubMachine()
     m.run_capture({'action_type': 'head_image', 'id': 6, 'status': 'ready'})
-    m._action_thread.join(timeout=5)
+    assert m.wait_idle(5)
     assert m.head_settings is None
 
 
@@ -140,7 +142,7 @@ def test_lid_image_receives_its_settings():
     m = StubMachine()
     m.run_capture({'action_type': 'lid_image', 'id': 10, 'status': 'ready',
                    'settings': {'LCfl': 1}})
-    m._action_thread.join(timeout=5)
+    assert m.wait_idle(5)
     assert m.lid_settings == {'LCfl': 1}
 
 
@@ -148,7 +150,7 @@ def test_a_user_image_carries_its_settings_to_the_lid_capture():
     m = StubMachine()
     m.run_capture({'action_type': 'user_image', 'id': 11, 'status': 'ready',
                    'settings': {'LCfl': 0}})
-    m._action_thread.join(timeout=5)
+    assert m.wait_idle(5)
     assert m.lid_settings == {'LCfl': 0}
     assert m.lid_lamps == [0]
 
@@ -184,7 +186,7 @@ def test_lidar_image_uses_first_settings_entry():
     m = StubMachine()
     m.run_capture({'action_type': 'lidar_image', 'id': 7, 'status': 'ready',
                    'settings': [{'HCil': 9}, {'HCil': 0}]})
-    m._action_thread.join(timeout=5)
+    assert m.wait_idle(5)
     assert m.head_settings == {'HCil': 9}
 
 
@@ -267,12 +269,251 @@ class HuntMachine(StubMachine):
 def test_hunt_completed_when_not_cancelled():
     m = HuntMachine(cancel=False)
     m.run_puls({'action_type': 'hunt', 'id': 7, 'status': 'ready'})
-    m._action_thread.join(timeout=5)
+    assert m.wait_idle(5)
     assert _events(m._q_msg_tx) == ['hunt:starting', 'hunt:completed']
 
 
 def test_hunt_cancelled_when_handler_aborts():
     m = HuntMachine(cancel=True)
     m.run_puls({'action_type': 'hunt', 'id': 8, 'status': 'ready'})
-    m._action_thread.join(timeout=5)
+    assert m.wait_idle(5)
     assert _events(m._q_msg_tx) == ['hunt:starting', 'hunt:cancelled']
+
+
+# ---- cancel fast path --------------------------------------------------------
+
+def test_cancel_running_flags_the_running_action_only():
+    m = StubMachine()
+    m._ok_to_run_action(5, 'motion', 'ready')
+    assert m.cancel_running(6) is False
+    assert m._running_action_cancelled is False
+    assert m.cancel_running('5') is True
+    assert m._running_action_cancelled is True
+    assert m.cancel_timings[5]['path'] == 'fast'
+
+
+def test_cancel_running_while_idle_is_ignored():
+    m = StubMachine()
+    assert m.cancel_running(5) is False
+    assert m.cancel_running(None) is False
+    assert not m.cancel_timings
+
+
+class _PausingLock:
+    """A claim lock that holds the first thread to take it inside, until
+    the test lets it go."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.inside = threading.Event()
+        self.go = threading.Event()
+        self._armed = True
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._armed:
+            self._armed = False
+            self.inside.set()
+            self.go.wait(5)
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def test_a_late_cancel_does_not_cancel_the_next_action():
+    m = StubMachine()
+    assert m._ok_to_run_action(1, 'motion', 'ready')
+    m._claim_lock = gate = _PausingLock()
+    late = threading.Thread(target=m.cancel_running, args=(1,))
+    late.start()
+    # The cancel of 1 has found it running; meanwhile 1 ends and 2 is
+    # claimed.
+    assert gate.inside.wait(5)
+    handover = threading.Thread(target=lambda: (m._release_action(),
+                                                m._ok_to_run_action(2, 'motion', 'ready')))
+    handover.start()
+    time.sleep(0.05)
+    gate.go.set()
+    late.join(5)
+    handover.join(5)
+    assert m.running_action_id == 2
+    assert m._running_action_cancelled is False
+
+
+def test_dispatched_cancel_after_the_fast_path_keeps_the_first_timing():
+    m = StubMachine()
+    m._ok_to_run_action(5, 'motion', 'ready')
+    m.cancel_running(5, received=time.monotonic() - 0.25)
+    assert m._ok_to_run_action(5, 'motion', 'cancelled') is False
+    timing = m.cancel_timings[5]
+    assert timing['path'] == 'fast'
+    assert timing['flag_latency'] >= 0.25
+
+
+def test_dispatched_cancel_is_timed_when_the_fast_path_missed_it():
+    m = StubMachine()
+    m._ok_to_run_action(5, 'motion', 'ready')
+    m._ok_to_run_action(5, 'motion', 'cancelled')
+    assert m.cancel_timings[5]['path'] == 'dispatch'
+
+
+def test_cancel_timings_stay_bounded():
+    m = StubMachine()
+    for action_id in range(1, basemachine._CANCEL_HISTORY + 6):
+        m.running_action_id = action_id
+        m.cancel_running(action_id)
+    assert len(m.cancel_timings) == basemachine._CANCEL_HISTORY
+    assert next(iter(m.cancel_timings)) == 6
+
+
+
+def test_cancel_timings_take_cancels_from_both_threads():
+    m = StubMachine()
+    errors = []
+
+    def cancel(path):
+        try:
+            for action_id in range(1, 2000):
+                with m._claim_lock:
+                    m.running_action_id = action_id
+                if path == 'fast':
+                    m.cancel_running(action_id)
+                else:
+                    m._ok_to_run_action(action_id, 'motion', 'cancelled')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=cancel, args=(path,)) for path in ('fast', 'dispatch')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert errors == []
+    assert len(m.cancel_timings) == basemachine._CANCEL_HISTORY
+
+class _WaitingHunt(StubMachine):
+    """A hunt that runs until it is cancelled, as a real one polls the flag."""
+    def __init__(self):
+        StubMachine.__init__(self)
+        self.started = threading.Event()
+
+    def _hunt(self, msg):
+        self.started.set()
+        deadline = time.monotonic() + 5
+        while not self._running_action_cancelled and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+
+def test_fast_cancel_times_the_terminal_event():
+    m = _WaitingHunt()
+    m.run_puls({'action_type': 'hunt', 'id': 9, 'status': 'ready'})
+    assert m.started.wait(5)
+    assert m.cancel_running(9, received=time.monotonic())
+    assert m.wait_idle(5)
+    assert _events(m._q_msg_tx) == ['hunt:starting', 'hunt:cancelled']
+    timing = m.cancel_timings[9]
+    assert timing['terminal'] is not None
+    assert 0 <= timing['flag_latency'] <= timing['terminal_latency'] < 1
+
+
+
+class _WaitingCapture(StubMachine):
+    """A lid capture that runs until it is cancelled, and notes whether its
+    terminal event was timed by the time the action is over."""
+    def __init__(self):
+        StubMachine.__init__(self)
+        self.started = threading.Event()
+        self.timed_at_return = None
+
+    def _lid_image(self, msg, settings=None):
+        self.started.set()
+        deadline = time.monotonic() + 5
+        while not self._running_action_cancelled and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def _note_action(self, msg, queued, started, finished):
+        self.timed_at_return = self.cancel_timings[msg['id']]['terminal'] is not None
+        StubMachine._note_action(self, msg, queued, started, finished)
+
+
+def test_a_capture_times_its_terminal_event_as_it_sends_it():
+    m = _WaitingCapture()
+    m.run_capture({'action_type': 'lid_image', 'id': 11, 'status': 'ready'})
+    assert m.started.wait(5)
+    assert m.cancel_running(11, received=time.monotonic())
+    assert m.wait_idle(5)
+    assert _events(m._q_msg_tx) == ['lid_image:starting', 'lid_image:completed']
+    assert m.timed_at_return is True
+
+# ---- the action worker -------------------------------------------------------
+
+class _SlowCleanup(StubMachine):
+    """A machine whose post-action cleanup takes a while after the claim
+    would, in the thread-per-action days, have been waited out."""
+    def __init__(self):
+        StubMachine.__init__(self)
+        self.threads = set()
+        self.release = threading.Event()
+
+    def _lid_image(self, msg, settings=None):
+        StubMachine._lid_image(self, msg, settings)
+        self.threads.add(threading.current_thread())
+
+    def _action_cleanup(self):
+        self.release.wait(5)
+
+
+def test_one_worker_runs_every_action():
+    m = _SlowCleanup()
+    m.release.set()
+    for action_id in range(1, 6):
+        m.run_capture({'action_type': 'lid_image', 'id': action_id, 'status': 'ready'})
+        assert m.wait_idle(5)
+    assert m.lid_captured == 5 and len(m.threads) == 1
+    assert [t['action_id'] for t in m.action_timings] == [1, 2, 3, 4, 5]
+
+
+def test_handing_off_never_blocks_the_dispatch():
+    m = _SlowCleanup()
+    m.run_capture({'action_type': 'lid_image', 'id': 1, 'status': 'ready'})
+    deadline = time.monotonic() + 5
+    while m.lid_captured < 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    # The first action is still in its cleanup; the dispatch thread hands
+    # the next one over regardless, as soon as the claim allows it.
+    m.running_action_id = None
+    start = time.monotonic()
+    m.run_capture({'action_type': 'lid_image', 'id': 2, 'status': 'ready'})
+    assert time.monotonic() - start < 0.5
+    assert not m.wait_idle(0.05)
+    m.release.set()
+    assert m.wait_idle(5)
+    assert m.lid_captured == 2 and m.running_action_id is None
+    second = m.action_timings[-1]
+    assert second['action_id'] == 2 and second['wait'] > 0
+
+
+def test_action_stats_are_kept_per_action_type():
+    m = HuntMachine(cancel=False)
+    m.run_puls({'action_type': 'hunt', 'id': 1, 'status': 'ready'})
+    assert m.wait_idle(5)
+    for action_id in (2, 3):
+        m.run_capture({'action_type': 'lid_image', 'id': action_id, 'status': 'ready'})
+        assert m.wait_idle(5)
+    stats = m.action_stats()
+    assert stats['hunt']['count'] == 1
+    assert stats['lid_image']['count'] == 2
+    assert 0 <= stats['hunt']['wait']['mean'] <= stats['hunt']['wait']['max']
+    assert stats['hunt']['run']['max'] >= 0
+
+
+def test_a_stopped_machine_starts_a_new_worker_for_its_next_session():
+    m = StubMachine()
+    m.run_capture({'action_type': 'lid_image', 'id': 1, 'status': 'ready'})
+    assert m.wait_idle(5)
+    first = m._action_worker
+    m.stop()
+    first.join(5)
+    assert not first.is_alive() and m._action_worker is None
+    m.run_capture({'action_type': 'lid_image', 'id': 2, 'status': 'ready'})
+    assert m.wait_idle(5)
+    assert m.lid_captured == 2 and m._action_worker is not first
@@ -0,0 +1,64 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import asyncio
+import threading
+
+from gfutilities.configuration import current_scope, get_cfg, scoped, set_cfg, use_scope
+
+
+def test_a_scope_reads_through_and_writes_to_itself():
+    set_cfg('TEST.SHARED', 'shared')
+    set_cfg('TEST.OWN', 'process')
+    try:
+        with use_scope({'TEST.OWN': 'scope'}) as scope:
+            assert get_cfg('TEST.SHARED') == 'shared'
+            assert get_cfg('TEST.OWN') == 'scope'
+            set_cfg('TEST.SET', 1)
+            set_cfg('TEST.SHARED', 'kept', keep_value=True)
+            assert current_scope() is scope
+        assert scope == {'TEST.OWN': 'scope', 'TEST.SET': 1}
+        assert get_cfg('TEST.OWN') == 'process' and get_cfg('TEST.SET') is None
+        assert current_scope() is None
+    finally:
+        for key in ('TEST.SHARED', 'TEST.OWN'):
+            set_cfg(key, None)
+
+
+def test_scopes_on_different_threads_do_not_meet():
+    seen = {}
+    barrier = threading.Barrier(2)
+
+    def machine(serial):
+        with use_scope({}):
+            set_cfg('MACHINE.SERIAL', serial)
+            barrier.wait()
+            seen[serial] = get_cfg('MACHINE.SERIAL')
+
+    threads = [threading.Thread(target=machine, args=(s,)) for s in ('1', '2')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert seen == {'1': '1', '2': '2'}
+    assert get_cfg('MACHINE.SERIAL') is None
+
+
+def test_a_scoped_target_takes_its_scope_along():
+    got = []
+    with use_scope({'TEST.OWN': 'scope'}):
+        plain = threading.Thread(target=lambda: got.append(get_cfg('TEST.OWN')))
+        bound = threading.Thread(target=scoped(lambda: got.append(get_cfg('TEST.OWN'))))
+        plain.start()
+        plain.join(5)
+        bound.start()
+        bound.join(5)
+
+        async def task():
+            return get_cfg('TEST.OWN')
+        got.append(asyncio.run(task()))
+    assert got == [None, 'scope', 'scope']
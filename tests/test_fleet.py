@@ -0,0 +1,76 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import os
+
+import pytest
+
+pytest.importorskip('websockets')
+
+from gfutilities.configuration import get_cfg, set_cfg
+from gfutilities.service.fleet import Fleet, _percentiles
+from gfutilities.service.mockservice import MockService
+
+_CFG = ('SERVICE.SERVER_URL', 'SERVICE.STATUS_SERVICE_URL', 'EMULATOR.IMAGE_SRC_DIR',
+        'EMULATOR.MOTION_DL_DIR', 'FACTORY_FIRMWARE.CHECK', 'LOGGING.SAVE_PULS', 'SERVICE.WS_CLIENT')
+
+
+@pytest.fixture
+def mock(tmp_path):
+    saved = {key: get_cfg(key) for key in _CFG}
+    images = tmp_path / 'img'
+    images.mkdir()
+    for n in range(1, 5):
+        (images / ('HOME_%d.jpg' % n)).write_bytes(b'home %d' % n)
+    set_cfg('EMULATOR.IMAGE_SRC_DIR', str(images))
+    set_cfg('EMULATOR.MOTION_DL_DIR', str(tmp_path / 'motion'))
+    set_cfg('FACTORY_FIRMWARE.CHECK', None)
+    set_cfg('LOGGING.SAVE_PULS', None)
+    # websocket-client only notices a socket closed under it at its next
+    # ping timeout when several run at once; the asyncio client stops at once.
+    set_cfg('SERVICE.WS_CLIENT', 'asyncio')
+    service = MockService().start()
+    service.configure()
+    yield service
+    service.stop()
+    for key, value in saved.items():
+        set_cfg(key, value)
+
+
+def test_a_fleet_runs_the_script_once_per_machine(mock, tmp_path):
+    before = get_cfg('MACHINE.SERIAL'), get_cfg('SESSION.WS_TOKEN')
+    fleet = Fleet(6, serial_base=40000000, ramp=0.01)
+    with fleet:
+        assert mock.wait(machines=6, timeout=60)
+        # The connections are tasks on one loop, not a loop each.
+        clients = [m.service._ws for m in fleet.machines if m.service._ws is not None]
+        assert clients and {client._loop for client in clients} == {fleet._ws_loop.loop}
+    summary = fleet.summary()
+    assert sorted({r['serial'] for r in mock.results}) == ['S%d' % (40000000 + n) for n in range(6)]
+    assert all(r['outcome'] == 'completed' for r in mock.results)
+    assert summary['actions'] == 6 * 7 and summary['throughput'] > 0
+    assert summary['by_action']['lid_image']['count'] == 24
+    assert 0 < summary['latency']['p50'] <= summary['latency']['p99'] <= summary['latency']['max']
+    # Each machine signed in for itself, and homed from its own first image:
+    # the homing stage and the settings report live in its own scope.
+    assert mock.stats['sign_ins'] == 6 and len(mock.uploads) == 24
+    assert sorted(os.listdir(tmp_path / 'motion')) == [str(40000000 + n) for n in range(6)]
+    assert (get_cfg('MACHINE.SERIAL'), get_cfg('SESSION.WS_TOKEN')) == before
+
+
+def test_a_machine_gets_its_own_config():
+    fleet = Fleet(3, config=lambda index, serial: {'MACHINE.PASSWORD': 'pw%d' % index})
+    assert [m.scope['MACHINE.PASSWORD'] for m in fleet.machines] == ['pw0', 'pw1', 'pw2']
+    assert [m.scope['MACHINE.HOSTNAME'] for m in fleet.machines] == ['FLEET-0', 'FLEET-1', 'FLEET-2']
+    with pytest.raises(ValueError):
+        Fleet(0)
+
+
+def test_percentiles_are_nearest_rank():
+    spread = _percentiles([float(n) for n in range(1, 101)])
+    assert (spread['p50'], spread['p90'], spread['p99'], spread['max']) == (50, 90, 99, 100)
+    assert _percentiles([])['p50'] is None
@@ -6,8 +6,11 @@ https://community.openglow.org
 SPDX-License-Identifier:    MIT
 """
 import json
+import threading
+import time
 from queue import Queue
 
+from gfutilities.configuration import set_cfg
 from gfutilities.service import websocket
 from gfutilities.service.websocket import send_wss_progress, split_frame
 
@@ -83,3 +86,243 @@ def test_progress_is_dropped_rather_than_queued_behind_a_dead_socket():
         q.put('{}\n')
     send_wss_progress(q, 42, 'print:progress', 7)
     assert q.qsize() == websocket.TX_QUEUE_MAX
+
+
+# -- packing outbound events ----------------------------------------------
+
+def _burst(q: Queue, n: int) -> list:
+    for i in range(n):
+        websocket.send_wss_event(q, 9, 'print:phase:%d' % i)
+    return list(q.queue)
+
+
+def test_a_burst_goes_out_as_one_frame_that_splits_back():
+    q = Queue()
+    events = _burst(q, 3)
+    packer = websocket.FrameCoalescer()
+    frame = packer.next_frame(q)
+    assert split_frame(frame) == [e.strip() for e in events]
+    assert packer.next_frame(q) is None
+    assert packer.stats == {'events': 3, 'frames': 1, 'frames_saved': 2,
+                            'bytes': len(frame)}
+
+
+def test_the_byte_cap_holds_the_next_event_over():
+    q = Queue()
+    events = _burst(q, 5)
+    packer = websocket.FrameCoalescer(max_bytes=len(events[0]) * 2 + 1)
+    frames = []
+    while True:
+        frame = packer.next_frame(q)
+        if frame is None:
+            break
+        frames.append(frame)
+    assert [len(split_frame(f)) for f in frames] == [2, 2, 1]
+    assert ''.join(frames) == ''.join(events)
+    assert packer.stats['frames_saved'] == 2
+
+
+def test_an_event_past_the_cap_still_goes_alone():
+    q = Queue()
+    q.put('x' * 100)
+    q.put('y' * 100)
+    packer = websocket.FrameCoalescer(max_bytes=50)
+    assert packer.next_frame(q) == 'x' * 100 + '\n'
+    assert packer.next_frame(q) == 'y' * 100 + '\n'
+
+
+def test_a_zero_cap_sends_every_event_alone():
+    q = Queue()
+    _burst(q, 3)
+    packer = websocket.FrameCoalescer(max_bytes=0)
+    assert [len(split_frame(packer.next_frame(q))) for _ in range(3)] == [1, 1, 1]
+    assert packer.stats['frames_saved'] == 0
+
+
+def test_the_window_waits_for_a_late_event():
+    q = Queue()
+    q.put('{"a":1}\n')
+    threading.Timer(0.02, q.put, ('{"b":2}\n',)).start()
+    packer = websocket.FrameCoalescer(window_ms=500)
+    assert packer.next_frame(q) == '{"a":1}\n{"b":2}\n'
+
+
+def test_the_packing_is_configurable():
+    set_cfg('SERVICE.TX_COALESCE_BYTES', '0')
+    set_cfg('SERVICE.TX_COALESCE_MS', '25')
+    try:
+        packer = websocket.FrameCoalescer()
+        assert packer.max_bytes == 0 and packer.window == 0.025
+    finally:
+        set_cfg('SERVICE.TX_COALESCE_BYTES', None)
+        set_cfg('SERVICE.TX_COALESCE_MS', None)
+
+
+def test_the_pump_sends_a_burst_in_one_frame():
+    class _Socket:
+        def __init__(self):
+            self.sent = []
+
+        def send(self, frame):
+            self.sent.append(frame)
+
+        def close(self):
+            pass
+
+    q = Queue()
+    client = websocket.WsClient(Queue(), q)
+    client.ws = _Socket()
+    events = _burst(q, 4)
+    client.ready = True
+    pump = threading.Thread(target=client._tx_pump)
+    pump.start()
+    deadline = time.monotonic() + 5
+    while not client.ws.sent and time.monotonic() < deadline:
+        time.sleep(0.01)
+    client.stop = True
+    pump.join(5)
+    assert client.ws.sent == [''.join(events)]
+    assert q.unfinished_tasks == 0
+
+
+
+def test_a_frame_being_sent_is_still_pending():
+    release = threading.Event()
+
+    class _Socket:
+        def send(self, frame):
+            release.wait(5)
+
+        def close(self):
+            pass
+
+    q = Queue()
+    client = websocket.WsClient(Queue(), q)
+    client.ws = _Socket()
+    client.ready = True
+    assert not client.tx_pending
+    websocket.send_wss_event(q, 1, 'print:completed')
+    pump = threading.Thread(target=client._tx_pump)
+    pump.start()
+    deadline = time.monotonic() + 5
+    while not q.empty() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert client.tx_pending
+    release.set()
+    while client.tx_pending and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert not client.tx_pending
+    client.stop = True
+    pump.join(5)
+
+
+# -- what goes out first ----------------------------------------------------
+
+def _events(q) -> list:
+    out = []
+    while not q.empty():
+        frame = json.loads(q.get_nowait())
+        q.task_done()
+        out.append(frame.get('event') or (frame['progress'], frame['action_id'], frame['current']))
+    return out
+
+
+def test_after_an_outage_the_terminal_event_is_not_behind_the_progress():
+    q = websocket.TxQueue()
+    websocket.send_wss_event(q, 5, 'print:running')
+    for tick in range(300):
+        send_wss_progress(q, 5, 'print:progress', tick)
+    websocket.send_wss_event(q, 5, 'print:completed')
+    # The finished action's progress is gone; its own earlier event still
+    # goes ahead of its terminal one.
+    assert q.qsize() == 2
+    assert _events(q) == ['print:running', 'print:completed']
+    assert q.stats['coalesced'] == 299 and q.stats['stale'] == 1
+    assert q.unfinished_tasks == 0
+
+
+def test_progress_is_latest_wins_per_action():
+    q = websocket.TxQueue()
+    for tick in range(3):
+        send_wss_progress(q, 1, 'print:progress', tick)
+        send_wss_progress(q, 2, 'print:download', tick * 10, units='bytes')
+    assert _events(q) == [('print:progress', 1, 2), ('print:download', 2, 20)]
+
+
+def test_terminal_events_go_before_lifecycle_then_progress():
+    q = websocket.TxQueue()
+    send_wss_progress(q, 1, 'print:progress', 7)
+    websocket.send_wss_event(q, 2, 'head_image:capture:starting')
+    websocket.send_wss_event(q, 1, 'print:cancelled')
+    websocket.send_wss_event(q, None, 'settings:completed')
+    assert _events(q) == ['print:cancelled', 'settings:completed',
+                          'head_image:capture:starting']
+
+
+def test_a_full_queue_evicts_stale_progress_before_any_event():
+    q = websocket.TxQueue(limit=4)
+    for action in range(3):
+        send_wss_progress(q, action, 'print:progress', 1)
+    websocket.send_wss_event(q, 9, 'print:running')
+    websocket.send_wss_event(q, 9, 'print:completed')
+    websocket.send_wss_event(q, 8, 'lid_image:completed')
+    assert q.qsize() == 4 and q.stats['evicted'] == 2
+    assert _events(q) == ['print:running', 'print:completed', 'lid_image:completed',
+                          ('print:progress', 2, 1)]
+
+
+def test_a_full_queue_of_events_still_takes_a_terminal_one():
+    q = websocket.TxQueue(limit=3)
+    for n in range(3):
+        websocket.send_wss_event(q, n, 'hunt:starting')
+    websocket.send_wss_event(q, 7, 'print:failed')
+    assert _events(q) == ['print:failed', 'hunt:starting', 'hunt:starting']
+
+
+def test_the_pump_drains_a_tx_queue_most_urgent_first():
+    q = websocket.TxQueue()
+    send_wss_progress(q, 3, 'print:progress', 1)
+    websocket.send_wss_event(q, 3, 'print:cancelled')
+    websocket.send_wss_event(q, 4, 'hunt:starting')
+    frame = websocket.FrameCoalescer().next_frame(q)
+    assert [json.loads(f)['event'] for f in split_frame(frame)] == \
+        ['print:cancelled', 'hunt:starting']
+    q.join()                            # every put accounted for
+
+
+def test_anything_else_put_on_a_tx_queue_is_a_lifecycle_frame():
+    q = websocket.TxQueue()
+    q.put('{"raw":1}\n')
+    websocket.send_wss_event(q, 1, 'print:completed')
+    assert q.get_nowait().startswith('{"id"')
+    assert q.get_nowait() == '{"raw":1}\n'
+
+
+def test_the_service_queues_through_a_tx_queue():
+    from gfutilities.service.gfuiservice import GFUIService
+    assert isinstance(GFUIService(None).q_msg_tx, websocket.TxQueue)
+
+
+def test_a_frame_put_back_goes_ahead_in_its_classes():
+    q = websocket.TxQueue()
+    websocket.send_wss_event(q, 1, 'print:running')
+    send_wss_progress(q, 1, 'print:progress', 1)
+    taken = websocket.FrameCoalescer().next_frame(q)
+    assert len(websocket.split_frame(taken)) == 2
+    send_wss_progress(q, 1, 'print:progress', 2)
+    websocket.send_wss_event(q, 2, 'head_image:capture:starting')
+    q.requeue(taken)
+    # The older progress gives way to the newer; the lifecycle event goes
+    # back to the front.
+    assert _events(q) == ['print:running', 'head_image:capture:starting', ('print:progress', 1, 2)]
+    assert q.unfinished_tasks == 0
+
+
+def test_a_terminal_event_put_back_still_makes_progress_stale():
+    q = websocket.TxQueue()
+    websocket.send_wss_event(q, 3, 'print:cancelled')
+    taken = websocket.FrameCoalescer().next_frame(q)
+    send_wss_progress(q, 3, 'print:progress', 9)
+    q.requeue(taken)
+    assert _events(q) == ['print:cancelled']
+    assert q.stats['stale'] == 1 and q.unfinished_tasks == 0
@@ -0,0 +1,117 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import random
+from io import BytesIO
+
+from gfutilities.puls import decode_all_steps, generate_linear_puls
+
+
+def _reference(x, y):
+    """A linear move written the obvious way, a step and its dwell at a time.
+
+    generate_linear_puls() lays the move out in one buffer from integer
+    arithmetic. This is the byte stream it has to reproduce exactly.
+    """
+    out = bytearray()
+    expected_count = abs(x) if abs(x) >= abs(y) else abs(y)
+    max_speed = 5
+    min_speed = 55
+    acc = 10
+    acc_dist = int((min_speed - max_speed) / acc)
+    acc_dist = acc_dist if acc_dist < (expected_count / 2) else int(expected_count / 2)
+    steps = 0
+    d = min_speed
+    for xs, ys in _reference_steps(x, y):
+        steps += 1
+        s = 0
+        if xs != 0:
+            s |= 0b00000001 if xs > 0 else 0b00000011
+        if ys != 0:
+            s |= 0b00001100 if ys > 0 else 0b00000100
+        out += bytes([s])
+        if steps <= acc_dist:
+            d = d - acc if d > max_speed - acc else max_speed
+        elif steps >= (expected_count - acc_dist):
+            d = d + acc if d < min_speed + acc else min_speed
+        out += b'\0' * d
+    return bytes(out)
+
+
+def _reference_steps(x, y):
+    xd = 1 if x >= 0 else -1
+    yd = 1 if y >= 0 else -1
+    xt = abs(x)
+    yt = abs(y)
+    if xt >= yt:
+        maj_target, min_target, maj_dir, min_dir = xt, yt, xd, yd
+    else:
+        maj_target, min_target, maj_dir, min_dir = yt, xt, yd, xd
+    maj_per_min = round(maj_target / min_target, 4) if min_target > 0 else maj_target
+    maj_cnt = 0
+    min_cnt = 0
+    while maj_cnt < maj_target or min_cnt < min_target:
+        if maj_cnt < maj_target:
+            maj_cnt += 1
+            if maj_cnt % maj_per_min < 1 and min_cnt < min_target:
+                min_out = min_dir
+                min_cnt += 1
+            else:
+                min_out = 0
+        else:
+            maj_dir = 0
+            min_out = min_dir
+            min_cnt += 1
+        yield maj_dir if xt >= yt else min_out, min_out if xt >= yt else maj_dir
+
+
+def _generate(x, y) -> bytes:
+    out = BytesIO()
+    generate_linear_puls(x, y, out)
+    return out.getvalue()
+
+
+def test_small_moves_are_byte_identical():
+    for x in range(-25, 26):
+        for y in range(-25, 26):
+            assert _generate(x, y) == _reference(x, y), (x, y)
+
+
+def test_awkward_ratios_are_byte_identical():
+    # Ratios that round at the fourth place, and near-diagonals whose
+    # rounding leaves minor steps over for the end of the move.
+    rnd = random.Random(55)
+    moves = [(1000, 999), (999, 1000), (3000, 7), (7, -3000), (-10000, 3333),
+             (4096, 4095), (12345, 6789), (1, 1), (2, 1), (3, 0), (0, -3)]
+    moves += [(rnd.randrange(-20000, 20000), rnd.randrange(-20000, 20000)) for _ in range(30)]
+    for x, y in moves:
+        assert _generate(x, y) == _reference(x, y), (x, y)
+
+
+def test_move_travels_what_it_was_asked_to():
+    stats = decode_all_steps(_generate(-700, 300))
+    assert (stats['XEND'], stats['YEND']) == (-700, 300)
+
+
+def test_path_and_file_object_outputs_agree(tmp_path):
+    path = tmp_path / 'move.puls'
+    generate_linear_puls(300, -200, str(path))
+    assert path.read_bytes() == _generate(300, -200)
+
+
+def test_a_long_move_is_written_in_large_blocks():
+    class _Counting(BytesIO):
+        writes = 0
+
+        def write(self, b):
+            _Counting.writes += 1
+            return BytesIO.write(self, b)
+
+    out = _Counting()
+    generate_linear_puls(100000, 40000, out)
+    assert len(out.getvalue()) > 100000
+    assert _Counting.writes <= len(out.getvalue()) // (1024 * 1024) + 1
@@ -0,0 +1,85 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import os
+
+import pytest
+
+from gfutilities.device.imagebank import ImageBank, image_bank
+
+
+def _write(directory, name, data):
+    (directory / name).write_bytes(data)
+
+
+@pytest.fixture
+def images(tmp_path):
+    for n in range(1, 5):
+        _write(tmp_path, 'HOME_%d.jpg' % n, b'home %d' % n)
+    _write(tmp_path, 'HEAD_LASER_.230.jpg', b'laser')
+    _write(tmp_path, 'HEAD_NO_LASER_.230.jpg', b'no laser')
+    _write(tmp_path, 'notes.txt', b'not an image')
+    return tmp_path
+
+
+def test_images_are_found_by_role(images):
+    bank = ImageBank(images)
+    assert bank.home(2) == b'home 2'
+    assert bank.head(True, '.230') == b'laser'
+    assert bank.head(False, '.230') == b'no laser'
+    # No LID_IMAGE.jpg: the bed as homing left it.
+    assert bank.lid() == b'home 4'
+    assert 'notes.txt' not in bank
+    with pytest.raises(FileNotFoundError):
+        bank.head(True, '.125')
+
+
+def test_every_capture_gets_the_same_buffer(images):
+    bank = ImageBank(images)
+    assert bank.home(1) is bank.home(1)
+    assert bank.loads == 6
+
+
+def test_changes_to_the_directory_are_picked_up(images):
+    bank = ImageBank(images, reload_interval=0)
+    _write(images, 'LID_IMAGE.jpg', b'lid')
+    assert bank.lid() == b'lid'
+    _write(images, 'HOME_1.jpg', b'home 1, moved')
+    stat = os.stat(images / 'HOME_1.jpg')
+    os.utime(images / 'HOME_1.jpg', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+    assert bank.home(1) == b'home 1, moved'
+    # Only what changed was read again.
+    assert bank.loads == 8
+    os.remove(images / 'LID_IMAGE.jpg')
+    assert bank.lid() == b'home 4'
+
+
+def test_changes_wait_for_the_reload_interval(images):
+    bank = ImageBank(images, reload_interval=60)
+    _write(images, 'LID_IMAGE.jpg', b'lid')
+    assert bank.lid() == b'home 4'
+    assert bank.reload()
+    assert bank.lid() == b'lid'
+
+
+def test_emulators_share_a_directorys_bank(images):
+    from gfutilities.configuration import get_cfg, set_cfg
+    from gfutilities.device import emulator
+
+    saved = {key: get_cfg(key) for key in ('EMULATOR.IMAGE_SRC_DIR', 'EMULATOR.MATERIAL_THICKNESS')}
+    set_cfg('EMULATOR.IMAGE_SRC_DIR', str(images))
+    set_cfg('EMULATOR.MATERIAL_THICKNESS', '.230')
+    try:
+        first, second = emulator.Emulator(), emulator.Emulator()
+        assert first._images() is second._images() is image_bank(str(images) + '/')
+        bank = first._images()
+        loads = bank.loads
+        assert first._capture_head({}, {'HCil': 3}) is second._capture_head({}, {'HCil': 3})
+        assert bank.loads == loads
+    finally:
+        for key, value in saved.items():
+            set_cfg(key, value)
@@ -0,0 +1,203 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+from io import BytesIO
+import random
+
+import pytest
+
+from conftest import JobHandler, make_job
+from gfutilities.configuration import set_cfg
+from gfutilities.service import jobcache
+from gfutilities.service import websocket as ws
+from gfutilities.service.jobcache import JobCache
+
+
+def _info(size=100):
+    return {'header_data': {'STfr': 10000, 'MCsn': 0, 'PDfm': 0}, 'header_len': 36,
+            'size': size, 'stats': {'XEND': 1}, 'laser': {'levels': {64: 10}, 'on_ticks': 10}}
+
+
+# ---- JobCache --------------------------------------------------------------
+
+def test_a_stored_job_comes_back_by_address(tmp_path):
+    cache = JobCache(tmp_path)
+    body = make_job(b'\x01' * 1000)
+    cache.store('https://store/job.puls?sig=1', body, _info(), etag='"a"')
+    # Signed afresh, the same object.
+    assert cache.conditional('https://store/job.puls?sig=2') == {'If-None-Match': '"a"'}
+    job = cache.get('https://store/job.puls?sig=2')
+    assert job['body'] == body and job['size'] == 100
+    assert job['laser']['levels'] == {64: 10}
+
+
+def test_last_modified_is_the_fallback_validator(tmp_path):
+    cache = JobCache(tmp_path)
+    cache.store('https://store/a', b'x', _info(), last_modified='Mon, 01 Jan 2026 00:00:00 GMT')
+    assert cache.conditional('https://store/a') == {'If-Modified-Since': 'Mon, 01 Jan 2026 00:00:00 GMT'}
+    cache.store('https://store/b', b'y', _info())
+    assert cache.conditional('https://store/b') == {}
+    assert cache.conditional('https://store/unknown') == {}
+
+
+def test_a_body_under_a_new_address_is_matched_by_content(tmp_path):
+    cache = JobCache(tmp_path)
+    cache.store('https://store/a', b'body', _info())
+    assert cache.match('https://store/b', b'other') is None
+    assert cache.match('https://store/b', b'body', etag='"b"')['size'] == 100
+    assert cache.conditional('https://store/b') == {'If-None-Match': '"b"'}
+    assert len(list(tmp_path.glob('*.puls'))) == 1
+
+
+def test_least_recently_used_bodies_go_first(tmp_path):
+    cache = JobCache(tmp_path, max_bytes=2500)
+    for name in 'abc':
+        cache.store('https://store/' + name, name.encode() * 1000, _info())
+    assert cache.get('https://store/a') is None
+    cache.get('https://store/b')             # b is now more recent than c
+    cache.store('https://store/d', b'd' * 1000, _info())
+    assert cache.get('https://store/c') is None
+    assert cache.get('https://store/b') and cache.get('https://store/d')
+    assert cache.size == 2000 and cache.stats['evicted'] == 2
+
+
+def test_a_body_past_the_budget_is_not_kept(tmp_path):
+    cache = JobCache(tmp_path, max_bytes=100)
+    assert cache.store('https://store/a', b'x' * 101, _info()) is None
+    assert cache.size == 0
+
+
+def test_the_index_survives_a_restart(tmp_path):
+    JobCache(tmp_path).store('https://store/a', b'body', _info(), etag='"a"')
+    cache = JobCache(tmp_path)
+    assert cache.conditional('https://store/a') == {'If-None-Match': '"a"'}
+    assert cache.get('https://store/a')['body'] == b'body'
+
+
+def test_a_corrupt_body_is_dropped(tmp_path):
+    cache = JobCache(tmp_path)
+    sha = cache.store('https://store/a', b'body', _info(), etag='"a"')
+    (tmp_path / (sha + '.puls')).write_bytes(b'bodY')
+    assert cache.get('https://store/a') is None
+    assert cache.conditional('https://store/a') == {}
+    assert not (tmp_path / (sha + '.puls')).exists()
+
+
+def test_an_unreadable_index_starts_empty(tmp_path):
+    (tmp_path / 'index.json').write_text('{not json')
+    assert JobCache(tmp_path).size == 0
+
+
+def test_use_survives_a_restart(tmp_path):
+    cache = JobCache(tmp_path, max_bytes=2500)
+    cache.store('https://store/a', b'a' * 1000, _info())
+    cache.store('https://store/b', b'b' * 1000, _info())
+    cache.get('https://store/a')             # a is now more recent than b
+    cache = JobCache(tmp_path, max_bytes=2500)
+    cache.store('https://store/c', b'c' * 1000, _info())
+    assert cache.get('https://store/b') is None and cache.get('https://store/a')
+
+
+def test_the_configured_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobcache, '_job_caches', {})
+    set_cfg('MOTION.CACHE_DIR', None)
+    assert jobcache.job_cache() is None
+    set_cfg('MOTION.CACHE_DIR', str(tmp_path / 'jobs'))
+    set_cfg('MOTION.CACHE_BYTES', '4096')
+    try:
+        cache = jobcache.job_cache()
+        assert cache.max_bytes == 4096 and jobcache.job_cache() is cache
+        # Machines with caches of their own take turns without rebuilding them.
+        set_cfg('MOTION.CACHE_DIR', str(tmp_path / 'other'))
+        other = jobcache.job_cache()
+        assert other is not cache and other.directory == tmp_path / 'other'
+        set_cfg('MOTION.CACHE_DIR', str(tmp_path / 'jobs'))
+        assert jobcache.job_cache() is cache
+    finally:
+        set_cfg('MOTION.CACHE_DIR', None)
+        set_cfg('MOTION.CACHE_BYTES', None)
+
+
+# ---- load_motion through the cache -----------------------------------------
+
+class _JobHost(JobHandler):
+    """Serves one job, answering a matching If-None-Match with a 304."""
+
+    def do_GET(self):
+        host = self.server
+        host.requests.append(self.headers.get('If-None-Match'))
+        if host.etag and self.headers.get('If-None-Match') == host.etag:
+            self.send_response(304)
+            self.send_header('ETag', host.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if host.etag:
+            self.send_header('ETag', host.etag)
+        self.send_header('Content-Length', str(len(host.body)))
+        self.end_headers()
+        self.wfile.write(host.body)
+
+
+@pytest.fixture
+def host(job_host):
+    set_cfg('LOGGING.SAVE_PULS', None)
+    return job_host(_JobHost, make_job(random.Random(2).randbytes(100000)), etag='"v1"')
+
+
+def test_a_repeat_print_is_answered_by_a_304(host, tmp_path):
+    cache = JobCache(tmp_path)
+    first_out, second_out = BytesIO(), BytesIO()
+    first = ws.load_motion(ws.get_session(), host.url + '?sig=1', first_out, cache=cache)
+    second = ws.load_motion(ws.get_session(), host.url + '?sig=2', second_out, cache=cache)
+    assert not first['cached'] and second['cached']
+    assert host.requests == [None, '"v1"']
+    assert second_out.getvalue() == first_out.getvalue()
+    for key in ('size', 'stats', 'laser', 'header_data', 'run_time'):
+        assert second[key] == first[key]
+    assert cache.stats['hits'] == 1
+
+
+def test_a_cached_job_is_not_parsed_again(host, tmp_path, monkeypatch):
+    cache = JobCache(tmp_path)
+    first = ws.load_motion(ws.get_session(), host.url, BytesIO(), cache=cache)
+
+    def _parse_header(self):
+        raise AssertionError('header parsed again')
+
+    monkeypatch.setattr(ws.PulseSource, '_parse_header', _parse_header)
+    second = ws.load_motion(ws.get_session(), host.url, BytesIO(), cache=cache)
+    assert second['cached'] and second['header_data'] == first['header_data']
+    assert second['header_len'] == first['header_len']
+
+
+def test_a_changed_job_is_downloaded_again(host, tmp_path):
+    cache = JobCache(tmp_path)
+    ws.load_motion(ws.get_session(), host.url, BytesIO(), cache=cache)
+    host.body, host.etag = make_job(b'\x02' * 5000), '"v2"'
+    info = ws.load_motion(ws.get_session(), host.url, BytesIO(), cache=cache)
+    assert not info['cached'] and info['size'] == 5000
+    assert cache.conditional(host.url) == {'If-None-Match': '"v2"'}
+
+
+def test_without_validators_the_content_hash_skips_the_stats_pass(host, tmp_path, monkeypatch):
+    host.etag = None
+    cache = JobCache(tmp_path)
+    first = ws.load_motion(ws.get_session(), host.url, BytesIO(), cache=cache)
+    monkeypatch.setattr(ws, 'StepStatsAccumulator', None)     # never built again
+    second = ws.load_motion(ws.get_session(), host.url, BytesIO(), cache=cache)
+    assert second['cached'] and second['stats'] == first['stats']
+    assert host.requests == [None, None]
+    assert cache.stats['content_hits'] == 1
+
+
+def test_a_pipelined_download_is_kept_once_it_is_all_in(host, tmp_path):
+    cache = JobCache(tmp_path)
+    first = ws.load_motion(ws.get_session(), host.url, BytesIO(), pipeline=True, cache=cache)
+    second = ws.load_motion(ws.get_session(), host.url, BytesIO(), pipeline=True, cache=cache)
+    assert second['cached'] and second['stats'] == first['stats']
+    assert host.requests == [None, '"v1"']
@@ -0,0 +1,98 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import random
+
+import pytest
+
+from gfutilities.puls import LaserPowerAccumulator, decode_all_steps
+
+
+def _engines():
+    out = [False]
+    try:
+        import numpy  # noqa: F401
+        out.append(True)
+    except ImportError:
+        pass
+    return out
+
+
+def _reference(puls, power=0):
+    """Laser-on ticks per level, one byte at a time."""
+    levels = {}
+    for value in puls:
+        if value & 0x80:
+            power = value & 0x7f
+        elif value & 0x10:
+            levels[power] = levels.get(power, 0) + 1
+    return levels, power
+
+
+@pytest.mark.parametrize('vectorized', _engines())
+def test_levels_match_a_byte_by_byte_walk_across_chunks(vectorized):
+    rnd = random.Random(2026)
+    for _ in range(10):
+        data = bytes(rnd.choice((0x10, 0x11, 0x1d, 0x01, 0x00, 0x80 | rnd.randrange(128)))
+                     for _ in range(rnd.randrange(1, 6000)))
+        laser = LaserPowerAccumulator(initial_power=5, vectorized=vectorized)
+        for start in range(0, len(data), 257):
+            laser.update(data[start:start + 257])
+        levels, power = _reference(data, 5)
+        result = laser.result()
+        assert result['levels'] == levels
+        assert laser.power == power
+        assert result['ticks'] == len(data)
+        assert result['power_changes'] == sum(1 for v in data if v & 0x80)
+
+
+@pytest.mark.parametrize('vectorized', _engines())
+def test_laser_on_ticks_agree_with_the_statistics(vectorized):
+    rnd = random.Random(3)
+    data = bytes(rnd.randrange(256) for _ in range(100000))
+    laser = LaserPowerAccumulator(vectorized=vectorized)
+    laser.update(data)
+    assert laser.result()['on_ticks'] == decode_all_steps(data)['LE']
+
+
+@pytest.mark.parametrize('vectorized', _engines())
+def test_level_carries_into_the_next_chunk(vectorized):
+    laser = LaserPowerAccumulator(vectorized=vectorized)
+    laser.update(b'\x10\x80\x10' + bytes([0x80 | 100]))
+    laser.update(b'\x10' * 4)
+    assert laser.result()['levels'] == {0: 2, 100: 4}
+
+
+def test_time_and_energy_at_the_step_frequency():
+    laser = LaserPowerAccumulator(tube_watts=40)
+    # Half a second at full power, half a second at zero, a second off; the
+    # two power bytes are ticks of their own.
+    laser.update(bytes([0xff]) + b'\x10' * 4999 + bytes([0x80]) + b'\x10' * 4999 + b'\x00' * 10000)
+    result = laser.result(stfr=10000)
+    assert result['seconds'] == 2.0
+    assert result['on_seconds'] == pytest.approx(0.9998)
+    assert result['duty'] == pytest.approx(0.4999)
+    assert result['energy'] == pytest.approx(0.4999)
+    assert result['joules'] == pytest.approx(0.4999 * 40)
+
+
+def test_without_a_step_frequency_only_ticks_are_reported():
+    laser = LaserPowerAccumulator()
+    laser.update(b'\x10')
+    assert 'seconds' not in laser.result()
+    assert 'energy' not in laser.result()
+
+
+def test_an_empty_job():
+    result = LaserPowerAccumulator().result(stfr=1000)
+    assert result['on_ticks'] == 0 and result['levels'] == {}
+    assert result['duty'] == 0.0 and result['energy'] == 0.0
+
+
+def test_impossible_initial_power_is_refused():
+    with pytest.raises(ValueError):
+        LaserPowerAccumulator(initial_power=128)
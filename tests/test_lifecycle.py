@@ -6,6 +6,7 @@ https://community.openglow.org
 SPDX-License-Identifier:    MIT
 """
 import logging
+import threading
 from io import BytesIO
 from queue import Queue
 
@@ -63,7 +64,7 @@ def test_reconnect_reauths_for_fresh_token(monkeypatch):
 
     def fake_sleep(_secs):
         calls['n'] += 1
-        if calls['n'] >= 2:      # stop during the 2nd reconnect wait
+        if calls['n'] >= 1:      # stop during the first wait: the first retry has none
             c.stop = True
             return True
         return False
@@ -73,6 +74,7 @@ def test_reconnect_reauths_for_fresh_token(monkeypatch):
     # first connect (no re-auth) + 1 reconnect (re-auth) before stop
     assert len(_FakeWSApp.urls) == 2
     assert len(reauth) == 1
+    assert c.reconnect.stats['sign_ins'] == 1 and c.reconnect.stats['sign_ins_skipped'] == 0
 
 
 def test_no_session_never_reauths(monkeypatch):
@@ -95,6 +97,93 @@ def test_no_session_never_reauths(monkeypatch):
     assert reauth == []
 
 
+class _RefusedWSApp(_FakeWSApp):
+    """Every attempt fails before the handshake, as with no route to the host."""
+    def __init__(self, url, **kw):
+        _FakeWSApp.__init__(self, url, **kw)
+        self.on_error = kw.get('on_error')
+
+    def run_forever(self, **kw):
+        self.on_error(self, ConnectionRefusedError('refused'))
+
+
+def test_a_token_the_service_never_saw_is_used_again(monkeypatch):
+    import time
+    _ws_cfg()
+    set_cfg('SESSION.WS_TOKEN_ISSUED', time.monotonic())
+    monkeypatch.setattr('websocket.WebSocketApp', _RefusedWSApp)
+    _FakeWSApp.urls = []
+    reauth = []
+    monkeypatch.setattr('gfutilities.service.authentication.authenticate_machine',
+                        lambda s: (reauth.append(s), True)[1])
+    c = ws.WsClient(Queue(), Queue(), session=object())
+    monkeypatch.setattr(c, '_sleep_or_stop', lambda secs: setattr(c, 'stop', True) or True)
+    try:
+        c.run()
+    finally:
+        set_cfg('SESSION.WS_TOKEN_ISSUED', None)
+    assert len(_FakeWSApp.urls) == 2
+    assert reauth == []
+    assert c.reconnect.stats['sign_ins_skipped'] == 1
+
+
+def test_reconnect_policy_retries_at_once_then_backs_off():
+    policy = ws.ReconnectPolicy(base=0.5, cap=4.0, lifetime=25)
+    delays = [policy.next_delay() for _ in range(7)]
+    assert delays[0] == 0.0
+    for n, delay in enumerate(delays[1:]):
+        full = min(4.0, 0.5 * 2 ** n)
+        assert full / 2 <= delay <= full
+
+
+def test_reconnect_policy_starts_over_after_a_stable_connection():
+    import time
+    policy = ws.ReconnectPolicy(stable=0.05, lifetime=25)
+    policy.next_delay(), policy.next_delay()
+    policy.connected('T1')
+    policy.closed()                        # dropped at once: still backing off
+    assert policy.next_delay() > 0
+    policy.connected('T2')
+    time.sleep(0.06)
+    policy.closed()
+    assert policy.next_delay() == 0.0
+
+
+def test_reconnect_policy_signs_in_only_for_a_spent_or_stale_token(monkeypatch):
+    import time
+    policy = ws.ReconnectPolicy(lifetime=25)
+    set_cfg('SESSION.WS_TOKEN_ISSUED', None)
+    assert policy.needs_sign_in('T1')                  # age unknown
+    set_cfg('SESSION.WS_TOKEN_ISSUED', time.monotonic())
+    try:
+        assert not policy.needs_sign_in('T1')
+        policy.presented('T1')
+        assert policy.needs_sign_in('T1')
+        assert not policy.needs_sign_in('T2')
+        set_cfg('SESSION.WS_TOKEN_ISSUED', time.monotonic() - 30)
+        assert policy.needs_sign_in('T2')
+    finally:
+        set_cfg('SESSION.WS_TOKEN_ISSUED', None)
+    # Asking is not signing in: the clients count what they do.
+    assert policy.stats['sign_ins'] == 0 and policy.stats['sign_ins_skipped'] == 0
+
+
+def test_reconnect_policy_times_each_outage():
+    import time
+    policy = ws.ReconnectPolicy(lifetime=25)
+    policy.connected('T1')                 # the first connect is not a reconnect
+    for down in (0.02, 0.06):
+        policy.closed()
+        time.sleep(down / 2)
+        policy.closed()                    # a failed attempt does not restart the clock
+        time.sleep(down / 2)
+        policy.connected('T')
+    stats = policy.stats
+    assert stats['reconnects'] == 2
+    assert 0.06 <= stats['down_last'] == stats['down_max'] < 1
+    assert 0.04 <= stats['down_mean'] < stats['down_max']
+
+
 def test_sleep_or_stop_returns_on_stop():
     c = ws.WsClient(Queue(), Queue())
     c.stop = True
@@ -152,6 +241,13 @@ def test_request_reauth_failure_gives_up(monkeypatch):
     assert s.sent == 2
 
 
+def test_request_takes_only_a_200_unless_told_otherwise():
+    assert ws.request(_Sess([206]), 'https://app.example/x', 'GET') is False
+    assert ws.request(_Sess([304]), 'https://app.example/x', 'GET') is False
+    r = ws.request(_Sess([206]), 'https://app.example/x', 'GET', accept=(200, 206))
+    assert r.status_code == 206
+
+
 # ---- C4: load_motion disk-filler + oversize handling -----------------------
 
 def _fake_puls(body: bytes) -> bytes:
@@ -195,6 +291,8 @@ def test_load_motion_writes_body_and_no_disk_filler(tmp_path, monkeypatch):
     info = ws.load_motion(None, 'http://x', out)
     assert out.getvalue() == body
     assert info['size'] == len(body)
+    assert info['laser']['ticks'] == len(body)
+    assert info['laser']['on_ticks'] == info['stats']['LE']
     # nothing dumped into the log dir
     assert list((tmp_path / 'log').glob('*.puls')) == []
     assert list((tmp_path / 'log').glob('*.info')) == []
@@ -290,9 +388,9 @@ def test_ws_client_is_daemon():
     assert ws.WsClient(Queue(), Queue()).daemon
 
 
-def test_action_thread_is_daemon():
-    from gfutilities.device.basemachine import _ActionThread
-    assert _ActionThread(None, {}).daemon
+def test_action_worker_is_daemon():
+    from gfutilities.device.basemachine import _ActionWorker
+    assert _ActionWorker(None).daemon
 
 
 def test_ws_connect_returns_stoppable_client(monkeypatch):
@@ -310,7 +408,7 @@ def test_gfuiservice_connect_keeps_ws_reference(monkeypatch):
     sentinel = object()
     monkeypatch.setattr(gfuiservice, 'get_session', lambda: object())
     monkeypatch.setattr(gfuiservice, 'authenticate_machine', lambda s: True)
-    monkeypatch.setattr(gfuiservice, 'ws_connect', lambda rx, tx, s: sentinel)
+    monkeypatch.setattr(gfuiservice, 'ws_connect', lambda rx, tx, s, **kw: sentinel)
     set_cfg('FACTORY_FIRMWARE.CHECK', None)
     svc = gfuiservice.GFUIService(_FakeMachine())
     assert svc.connect() is True
@@ -426,3 +524,122 @@ def test_fetch_motion_limits_lift_at_zero(monkeypatch):
 
     assert info and source is not None
     assert source.body_size == len(data)
+
+
+# ---- pipelined download: the ring is fed while the body arrives ------------
+
+class _GatedResp(_StreamResp):
+    """A download that stalls after its first piece until ``gate`` is set."""
+
+    def __init__(self, data, declared=None):
+        super().__init__(data, declared)
+        self.gate = threading.Event()
+
+    def iter_content(self, chunk_size=1024):
+        for n, piece in enumerate(super().iter_content(chunk_size)):
+            if n == 1:
+                self.gate.wait(5)
+            yield piece
+
+
+def test_pipelined_fetch_refuses_a_job_before_downloading_it(monkeypatch):
+    set_cfg('MACHINE.SERIAL', '1111')
+    fields = (b'STfr' + (10000).to_bytes(4, 'little')
+              + b'MCsn' + (2222).to_bytes(4, 'little')
+              + b'PDfm' + (0).to_bytes(4, 'little'))
+    data = b'\x00GF1' + (8 + len(fields)).to_bytes(4, 'little') + fields + bytes(500000)
+    resp = _GatedResp(data, declared=len(data))
+    monkeypatch.setattr(ws, 'request', lambda *a, **k: resp)
+    try:
+        info, source = ws.fetch_motion(None, 'http://x', pipeline=True)
+        assert info is False and source is None
+        assert resp.chunks_read <= 2        # refused on the header alone
+        assert resp.closed
+    finally:
+        resp.gate.set()
+        set_cfg('MACHINE.SERIAL', None)
+
+
+def test_pipelined_fetch_returns_with_the_download_still_running(monkeypatch):
+    set_cfg('LOGGING.SAVE_PULS', None)
+    body = bytes(range(256)) * 2000
+    resp = _GatedResp(_fake_puls(body), declared=len(_fake_puls(body)))
+    monkeypatch.setattr(ws, 'request', lambda *a, **k: resp)
+    info, source = ws.fetch_motion(None, 'http://x', pipeline=True)
+    assert info and not source.downloaded
+    assert source.program_size is None
+    first = source.read(1000)
+    assert first == body[:1000]
+    resp.gate.set()
+    rest = source.read(len(body))
+    assert first + rest == body
+    assert source.downloaded and resp.closed
+
+
+def test_pipelined_load_motion_writes_the_same_job(monkeypatch):
+    set_cfg('LOGGING.SAVE_PULS', None)
+    body = bytes(range(100)) * 3000
+    monkeypatch.setattr(ws, 'request', lambda *a, **k: _StreamResp(_fake_puls(body)))
+    out = BytesIO()
+    info = ws.load_motion(None, 'http://x', out, pipeline=True)
+    assert out.getvalue() == body
+    assert info['size'] == len(body)
+    assert info['stats']['LE'] == info['laser']['on_ticks']
+
+
+def test_pipelined_body_past_the_limit_fails_the_read(monkeypatch):
+    # Undeclared, so it is only caught on the way in, after the header has
+    # passed and reading has begun: the read fails rather than the fetch.
+    resp = _StreamResp(_fake_puls(bytes(300000)))
+    monkeypatch.setattr(ws, 'request', lambda *a, **k: resp)
+    info, source = ws.fetch_motion(None, 'http://x', reject_bytes=65536, pipeline=True)
+    assert info
+    with pytest.raises(ws.PulseSourceError):
+        while source.read(65536):
+            pass
+    assert resp.closed
+
+
+# ---- cancel fast path --------------------------------------------------------
+
+def test_on_receive_sees_each_object_before_it_is_queued():
+    q = Queue()
+    seen = []
+    c = ws.WsClient(q, Queue())
+    c.on_receive = lambda raw: seen.append((raw, q.qsize()))
+    c._on_message(None, '{"id": 1}\n{"id": 2}')
+    assert seen == [('{"id": 1}', 0), ('{"id": 2}', 1)]
+    assert q.qsize() == 2
+
+
+def test_a_failing_on_receive_still_queues_the_message(caplog):
+    def _boom(raw):
+        raise RuntimeError('hook')
+    q = Queue()
+    c = ws.WsClient(q, Queue())
+    c.on_receive = _boom
+    with caplog.at_level(logging.ERROR):
+        c._on_message(None, '{"id": 1}')
+    assert q.get_nowait() == '{"id": 1}'
+    assert 'on_receive hook failed' in caplog.text
+
+
+class _CancelMachine(_FakeMachine):
+    def __init__(self):
+        _FakeMachine.__init__(self)
+        self.cancels = []
+
+    def cancel_running(self, action_id, received=None):
+        self.cancels.append(action_id)
+        return True
+
+
+def test_fast_cancel_passes_only_cancels_to_the_machine():
+    from gfutilities.service.gfuiservice import GFUIService
+    m = _CancelMachine()
+    svc = GFUIService(m)
+    svc._fast_cancel('{"id": 4, "action_type": "motion", "status": "ready"}')
+    svc._fast_cancel('{"id": 4, "action_type": "motion", "status": "cancelled"')  # truncated
+    svc._fast_cancel('"cancelled"')
+    svc._fast_cancel('{"id": 4, "action_type": "motion", "status": "cancelled"}')
+    assert m.cancels == [4]
@@ -0,0 +1,147 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+from io import BytesIO
+import threading
+
+import pytest
+
+pytest.importorskip('websockets')
+
+import websocket
+
+from gfutilities.configuration import get_cfg, set_cfg
+from gfutilities.puls.source import PulseSource
+from gfutilities.service import websocket as ws
+from gfutilities.service.authentication import authenticate_machine
+from gfutilities.service.jobcache import JobCache
+from gfutilities.service.mockservice import MockService, default_jobs
+
+_CFG = ('SERVICE.SERVER_URL', 'SERVICE.STATUS_SERVICE_URL', 'MACHINE.SERIAL', 'MACHINE.PASSWORD',
+        'SESSION.WS_TOKEN', 'SESSION.WS_TOKEN_ISSUED', 'SESSION.AUTH_TOKEN', 'FACTORY_FIRMWARE.CHECK',
+        'FACTORY_FIRMWARE.FW_VERSION', 'EMULATOR.IMAGE_SRC_DIR', 'EMULATOR.MOTION_DL_DIR',
+        'EMULATOR.ACTIVE', 'EMULATOR.BYPASS_HOMING', 'SETTINGS.SET', 'LOGGING.SAVE_PULS')
+
+
+@pytest.fixture
+def mock():
+    saved = {key: get_cfg(key) for key in _CFG}
+    service = MockService(password='secret').start()
+    service.configure(serial='12345678', password='secret')
+    yield service
+    service.stop()
+    for key, value in saved.items():
+        set_cfg(key, value)
+
+
+def _signed_in():
+    s = ws.get_session()
+    assert authenticate_machine(s)
+    return s
+
+
+def test_sign_in_and_the_firmware_probe(mock):
+    s = _signed_in()
+    set_cfg('FACTORY_FIRMWARE.FW_VERSION', '2.6.0-2228')
+    assert ws.firmware_check(s) is False
+    mock.firmware_version = '2.7.0-1'
+    assert ws.firmware_check(s)['version'] == '2.7.0-1'
+    set_cfg('MACHINE.PASSWORD', 'wrong')
+    assert not authenticate_machine(ws.get_session())
+    assert mock.stats['sign_ins'] == 1 and mock.stats['sign_ins_refused'] == 1
+
+
+def test_a_ws_token_opens_one_connection(mock):
+    _signed_in()
+    url = '%s/%s' % (mock.status_url, get_cfg('SESSION.WS_TOKEN'))
+    websocket.create_connection(url, subprotocols=['glowforge']).close()
+    with pytest.raises(websocket.WebSocketBadStatusException):
+        websocket.create_connection(url, subprotocols=['glowforge'])
+    assert mock.stats['ws_connects'] == 1 and mock.stats['ws_refused'] == 1
+
+
+def test_jobs_are_served_with_ranges_and_validators(mock, tmp_path):
+    set_cfg('MACHINE.SERIAL', None)
+    url = mock._job_url('print')
+    probe = ws.probe_motion(ws.get_session(), url)
+    assert probe['body_size'] == len(default_jobs()['print'])
+    assert probe['run_time'] and probe['refusal'] is None
+    cache = JobCache(tmp_path)
+    first = ws.load_motion(ws.get_session(), url, BytesIO(), cache=cache)
+    second = ws.load_motion(ws.get_session(), mock._job_url('print'), BytesIO(), cache=cache)
+    assert not first['cached'] and second['cached']
+    assert mock.stats['not_modified'] == 1
+    assert first['size'] == probe['program_size']
+    assert first['header_data'] == PulseSource(mock.jobs['print']).header
+
+
+def test_an_upload_needs_its_own_signature(mock):
+    s = _signed_in()
+    endpoint = mock._upload_url(7)
+    assert ws.img_upload(s, b'jpeg', {'endpoint': endpoint})
+    assert not ws.img_upload(s, b'jpeg', {'endpoint': endpoint.replace('X-Signature=', 'X-Signature=0')})
+    assert ws.img_upload(s, b'legacy', {'action_type': 'lid_image', 'id': 8})
+    assert mock.uploads == {'/upload/7.jpg': b'jpeg', '/api/machines/lid_image/8': b'legacy'}
+    assert mock.stats['uploads_refused'] == 1
+
+
+def test_an_emulator_runs_the_whole_script(mock, tmp_path):
+    from gfutilities import Emulator, GFUIService
+
+    images = tmp_path / 'img'
+    images.mkdir()
+    for n in range(1, 5):
+        (images / ('HOME_%d.jpg' % n)).write_bytes(b'home %d' % n)
+    set_cfg('EMULATOR.IMAGE_SRC_DIR', str(images))
+    set_cfg('EMULATOR.MOTION_DL_DIR', str(tmp_path))
+    set_cfg('EMULATOR.BYPASS_HOMING', None)
+    set_cfg('SETTINGS.SET', None)
+    set_cfg('LOGGING.SAVE_PULS', None)
+    set_cfg('FACTORY_FIRMWARE.CHECK', True)
+
+    service = GFUIService(Emulator())
+    assert service.connect()
+    runner = threading.Thread(target=service.run)
+    runner.start()
+    try:
+        assert mock.wait(timeout=30)
+    finally:
+        service.request_stop()
+        runner.join(10)
+    assert [r['action_type'] for r in mock.results] == ['settings'] + ['lid_image'] * 4 + ['hunt', 'print']
+    assert all(r['outcome'] == 'completed' for r in mock.results)
+    assert sorted(mock.uploads.values()) == [b'home %d' % n for n in range(1, 5)]
+    assert mock.stats['job_requests'] == 2
+    summary = mock.summary()
+    assert summary['actions'] == 7 and summary['completed'] == 7 and summary['throughput'] > 0
+    print_ = summary['by_action']['print']
+    assert 0 < print_['first']['mean'] <= print_['terminal']['max']
+
+
+def test_a_silent_machine_times_out_each_action(mock):
+    mock.script = mock.script[:2]
+    mock.action_timeout = 0.2
+    _signed_in()
+    conn = websocket.create_connection('%s/%s' % (mock.status_url, get_cfg('SESSION.WS_TOKEN')),
+                                       subprotocols=['glowforge'])
+    try:
+        assert mock.wait(timeout=5)
+    finally:
+        conn.close()
+    assert [r['outcome'] for r in mock.results] == ['timeout', 'timeout']
+
+
+@pytest.mark.parametrize('spec', ['bytes=-', 'bytes=abc-', 'bytes=0-9,20-29', 'items=0-9', 'bytes=9-3'])
+def test_a_range_the_host_cannot_serve_is_refused(mock, spec):
+    response = ws.get_session().get(mock._job_url('print'), headers={'Range': spec})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */%d' % len(mock.jobs['print'])
+
+
+def test_a_suffix_range_is_served(mock):
+    response = ws.get_session().get(mock._job_url('print'), headers={'Range': 'bytes=-10'})
+    assert response.status_code == 206 and response.content == mock.jobs['print'][-10:]
@@ -0,0 +1,144 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+from io import BytesIO
+
+import pytest
+
+from gfutilities.puls import (LaserPowerAccumulator, MotionSegment, PositionTrace,
+                              StepStatsAccumulator, plan_motion, write_motion)
+from gfutilities.puls.source import PulseSource
+from gfutilities.service.websocket import check_puls_header
+
+SQUARE = [(4000, 0, 60), (4000, 4000, 60), (0, 4000, 60), (0, 0, 60)]
+
+
+def _drain(source) -> bytes:
+    out = bytearray()
+    while True:
+        chunk = source.read(65536)
+        if not chunk:
+            return bytes(out)
+        out += chunk
+
+
+def _job(segments, **kwargs):
+    out = BytesIO()
+    size = write_motion(segments, out, **kwargs)
+    return out.getvalue(), size
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_file_is_a_job_the_machine_would_run(compress):
+    body, size = _job(SQUARE, compress=compress)
+    source = PulseSource(body)
+    assert source.compressed is compress
+    assert check_puls_header(source.header, 123456) is None
+    assert source.header['STfr'] == 10000 and source.header['PDfm'] == 0
+    assert source.program_size == size
+    assert len(_drain(source)) == size
+
+
+def test_serial_lock_and_extra_tags_land_in_the_header():
+    body, _ = _job([(10, 10)], serial=123456, header={'PDct': 1})
+    header = PulseSource(body).header
+    assert header['MCsn'] == 123456 and header['PDct'] == 1
+    assert check_puls_header(header, 999) is not None
+
+
+def test_path_ends_where_it_was_sent_and_never_overshoots():
+    path = [(3000, 1000), (-500, 2500, 30), (-500, -700), (1234, -4321, 127)]
+    body, _ = _job(path)
+    payload = _drain(PulseSource(body))
+    stats = StepStatsAccumulator()
+    stats.update(payload)
+    assert (stats.result()['XEND'], stats.result()['YEND']) == (1234, -4321)
+    trace = PositionTrace()
+    trace.update(payload)
+    result = trace.result()
+    assert (result['XMIN'], result['XMAX']) == (-500, 3000)
+    assert (result['YMIN'], result['YMAX']) == (-4321, 2500)
+
+
+def test_laser_fires_at_the_segment_power_and_only_while_cutting():
+    path = [(2000, 0, 0), (4000, 0, 100), (4000, 2000, 100), (0, 2000, 0), (0, 0, 40)]
+    body, _ = _job(path)
+    payload = _drain(PulseSource(body))
+    laser = LaserPowerAccumulator()
+    laser.update(payload)
+    result = laser.result(10000)
+    assert set(result['levels']) == {100, 40}
+    # One power byte per change of level, none for travel.
+    assert result['power_changes'] == 2
+    assert result['on_ticks'] + 2 + sum(1 for v in payload if not v & 0x90) == len(payload)
+
+
+def test_ends_at_rest_and_carries_speed_straight_through():
+    plan = plan_motion([(1000, 0), (2000, 0), (3000, 0)], max_speed=5000, accel=100000)
+    assert plan[0].entry == 0.0 and plan[-1].exit == 0.0
+    # Collinear: the junctions are no corner at all.
+    assert plan[0].exit == plan[1].entry == pytest.approx(5000)
+    assert plan[1].cruise == 5000
+
+
+def test_a_corner_slows_and_a_reversal_stops():
+    square = plan_motion([(1000, 0), (1000, 1000)], junction_deviation=2.0)
+    assert 0 < square[0].exit < square[0].cruise
+    back = plan_motion([(1000, 0), (0, 0)])
+    assert back[0].exit == 0.0
+
+
+def test_short_segments_never_reach_cruise_but_can_always_stop():
+    accel = 100000
+    plan = plan_motion([(20, 0), (40, 0), (60, 0)], max_speed=8000, accel=accel)
+    for seg in plan:
+        assert seg.cruise < 8000
+        assert seg.exit ** 2 <= seg.entry ** 2 + 2 * accel * seg.length + 1e-6
+        assert seg.entry ** 2 <= seg.exit ** 2 + 2 * accel * seg.length + 1e-6
+
+
+def test_runtime_follows_the_profile():
+    # One 10000-step move at 5000 steps/s: each 0.05 s ramp covers 125
+    # steps, leaving 9750 to cruise in 1.95 s. 2.05 s is 20500 ticks at 10 kHz.
+    _, size = _job([(10000, 0)], max_speed=5000, accel=100000)
+    assert abs(size - 20500) <= 2
+
+
+def test_never_two_steps_in_a_tick():
+    body, _ = _job([(5000, 3000), (0, 0)], max_speed=10000, accel=10 ** 7)
+    payload = _drain(PulseSource(body))
+    stats = StepStatsAccumulator()
+    stats.update(payload)
+    assert stats.result()['XTOT'] == 10000
+
+
+def test_impossible_requests_are_refused():
+    with pytest.raises(ValueError):
+        _job([(10, 0, 200)])
+    with pytest.raises(ValueError):
+        _job([(10, 0)], stfr=1000, max_speed=2000)
+
+
+def test_a_polyline_is_a_path_of_travel_moves():
+    plan = plan_motion([(10, 0), MotionSegment(10, 10, 5), (10, 10)])
+    assert [(s.dx, s.dy, s.power) for s in plan] == [(10, 0, 0), (0, 10, 5)]
+
+
+def test_written_to_a_path(tmp_path):
+    path = tmp_path / 'job.puls'
+    size = write_motion(SQUARE, str(path), compress=True)
+    assert PulseSource(path.read_bytes()).program_size == size
+
+
+def test_engines_write_the_same_bytes():
+    pytest.importorskip('numpy')
+    path = [(3000, 1000, 20), (2999, 1001), (-500, 2500, 30), (-500, -700),
+            (1234, -4321, 127), (1235, -4321), (0, 0, 1)]
+    for kwargs in ({}, {'max_speed': 10000, 'accel': 10 ** 7}, {'max_speed': 300, 'accel': 1000}):
+        fast, _ = _job(path, vectorized=True, **kwargs)
+        slow, _ = _job(path, vectorized=False, **kwargs)
+        assert fast == slow
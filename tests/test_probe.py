@@ -0,0 +1,123 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+from datetime import timedelta
+import random
+
+import pytest
+
+from conftest import JobHandler, make_job
+from gfutilities.configuration import set_cfg
+from gfutilities.puls.source import HeaderTruncated, PulseSource, PulseSourceError, read_header
+from gfutilities.service import websocket as ws
+
+
+class _JobHost(JobHandler):
+    """Serves one job, with byte ranges (suffix ranges too) unless
+    ``server.ranges`` is unset; counts the body bytes it sends."""
+
+    def do_GET(self):
+        host = self.server
+        body = host.body
+        spec = self.headers.get('Range') if host.ranges else None
+        host.requests.append(self.headers.get('Range'))
+        if spec:
+            first, _, last = spec.split('=')[1].partition('-')
+            if first:
+                start, end = int(first), min(len(body) - 1, int(last))
+            else:
+                start, end = len(body) - int(last), len(body) - 1
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(body)))
+        else:
+            start, end = 0, len(body) - 1
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        # A client that has read what it wanted leaves; the host lets it.
+        for at in range(start, end + 1, 16384):
+            self.wfile.write(body[at:min(at + 16384, end + 1)])
+            host.sent += min(16384, end + 1 - at)
+
+
+@pytest.fixture
+def host(job_host):
+    return job_host(_JobHost, make_job(random.Random(3).randbytes(2000000)), ranges=True, sent=0)
+
+
+def test_read_header_from_a_compressed_prefix():
+    body = make_job(bytes(100000))
+    header, raw = read_header(body[:200])
+    source = PulseSource(body)
+    assert header == source.header and raw == source.header_raw
+
+
+def test_read_header_wants_the_whole_header():
+    with pytest.raises(HeaderTruncated):
+        read_header(make_job(b'', compress=False)[:20])
+    with pytest.raises(PulseSourceError) as e:
+        read_header(b'not a pulse file')
+    assert not isinstance(e.value, HeaderTruncated)
+
+
+def test_a_probe_reads_the_header_and_the_trailer_only(host):
+    info = ws.probe_motion(ws.get_session(), host.url)
+    assert info['compressed'] and info['refusal'] is None
+    assert info['header_data'] == PulseSource(host.body).header
+    assert info['program_size'] == 2000000
+    assert info['run_time'] == timedelta(seconds=200)
+    assert info['body_size'] == len(host.body)
+    assert host.requests == ['bytes=0-%d' % (ws._PROBE_BYTES - 1), 'bytes=-4']
+    assert host.sent == ws._PROBE_BYTES + 4
+
+
+def test_a_plain_body_is_measured_by_its_size(host):
+    host.body = make_job(bytes(5000), compress=False)
+    info = ws.probe_motion(ws.get_session(), host.url)
+    assert not info['compressed'] and info['program_size'] == 5000
+    assert len(host.requests) == 1
+
+
+def test_a_long_header_is_probed_again_with_more(host):
+    host.body = make_job(bytes(1000), compress=False, extra=1100)
+    info = ws.probe_motion(ws.get_session(), host.url)
+    assert info['header_data']['T44b'] == 1099 and info['program_size'] == 1000
+    assert host.requests[1] == 'bytes=0-%d' % (4 * ws._PROBE_BYTES - 1)
+
+
+def test_a_locked_job_is_reported_refused(host):
+    host.body = make_job(bytes(1000), serial=87654321)
+    set_cfg('MACHINE.SERIAL', '12345678')
+    try:
+        info = ws.probe_motion(ws.get_session(), host.url)
+    finally:
+        set_cfg('MACHINE.SERIAL', None)
+    assert info['refusal'] and info['run_time'] is None
+
+
+def test_without_ranges_only_the_head_is_read(host):
+    host.ranges = False
+    # Past what the socket buffers could hold, so what is sent is what is read.
+    host.body = make_job(bytes(32000000), compress=False)
+    info = ws.probe_motion(ws.get_session(), host.url)
+    assert info['header_data']['STfr'] == 10000
+    assert info['program_size'] == 32000000
+    assert len(host.requests) == 1
+    assert host.sent < len(host.body)
+
+
+def test_a_body_that_is_not_a_job_fails_the_probe(host):
+    host.body = b'<html>no</html>' * 100
+    assert ws.probe_motion(ws.get_session(), host.url) is False
+
+
+def test_without_ranges_a_compressed_job_has_no_known_length(host):
+    host.ranges = False
+    info = ws.probe_motion(ws.get_session(), host.url)
+    assert info['compressed'] and info['header_data']['STfr'] == 10000
+    assert info['program_size'] is None and info['run_time'] is None
+    assert len(host.requests) == 1
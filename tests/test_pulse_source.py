@@ -6,7 +6,11 @@ https://community.openglow.org
 SPDX-License-Identifier:    MIT
 """
 import gzip
+import logging
 import struct
+import threading
+import time
+import zlib
 
 import pytest
 
@@ -150,3 +154,328 @@ def test_a_length_that_cannot_be_true_is_left_unknown():
     body = bytearray(gzip.compress(_puls(b'abcdef')))
     body[-4:] = struct.pack('<I', 4)
     assert PulseSource(bytes(body)).program_size is None
+
+
+# -- seeking, and the checkpoints that make it cheap ----------------------
+
+def _random_payload(size, seed=7) -> bytes:
+    # Compressible, but not so much that an interval is one deflate block.
+    import random
+    rnd = random.Random(seed)
+    return bytes(rnd.choice(b'\x00\x00\x00\x01\x03\x0c\x10\x11\x80') for _ in range(size))
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_seek_lands_on_the_right_byte_either_way(compress):
+    payload = _random_payload(300000)
+    body = _puls(payload)
+    source = PulseSource(gzip.compress(body) if compress else body, checkpoint_every=32768)
+    _drain(source, 4096)                               # the first pass
+    for offset in (0, 1, 150000, 299999, 65536, 32767, 200001, 5):
+        assert source.seek(offset) == offset
+        assert source.tell() == source.served == offset
+        assert source.read(1000) == payload[offset:offset + 1000]
+
+
+def test_seek_past_the_end_leaves_the_source_spent():
+    payload = _random_payload(5000)
+    for body in (_puls(payload), gzip.compress(_puls(payload))):
+        source = PulseSource(body, checkpoint_every=1024)
+        assert source.seek(10 ** 6) == len(payload)
+        assert source.read(10) == b''
+        assert source.exhausted
+
+
+def test_seek_before_the_first_pass_gets_there():
+    payload = _random_payload(100000)
+    source = PulseSource(gzip.compress(_puls(payload)), checkpoint_every=8192)
+    assert source.seek(70000) == 70000
+    assert _drain(source) == payload[70000:]
+    # And the pass that seek made left checkpoints behind it.
+    assert len(source._checkpoints) > 5
+
+
+def test_seek_restarts_from_a_checkpoint_not_the_top(monkeypatch):
+    payload = _random_payload(400000)
+    source = PulseSource(gzip.compress(_puls(payload)), checkpoint_every=16384)
+    _drain(source, 65536)
+    inflated = []
+    real = source._fill
+
+    def counting_fill(want):
+        before = source._produced
+        real(want)
+        inflated.append(source._produced - before)
+
+    monkeypatch.setattr(source, '_fill', counting_fill)
+    source.seek(350000)
+    # One interval at most, not the 350 KB ahead of the target.
+    assert sum(inflated) <= 16384 + 65536
+    assert source.read(100) == payload[350000:350100]
+
+
+def test_checkpoint_index_stays_bounded():
+    payload = _random_payload(500000)
+    source = PulseSource(gzip.compress(_puls(payload)), checkpoint_every=1024, max_checkpoints=8)
+    _drain(source, 4096)
+    assert len(source._checkpoints) <= 8
+    assert source._checkpoints[0][0] == 0
+    assert source.seek(123456) == 123456
+    assert source.read(64) == payload[123456:123520]
+
+
+def test_without_checkpoints_a_rewind_still_works():
+    payload = _random_payload(50000)
+    source = PulseSource(gzip.compress(_puls(payload)))
+    _drain(source)
+    assert source._checkpoints == []
+    assert source.seek(10) == 10
+    assert _drain(source) == payload[10:]
+
+
+def test_seek_before_the_payload_is_refused():
+    with pytest.raises(ValueError):
+        PulseSource(_puls(b'abc')).seek(-1)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_readinto_reuses_one_buffer_for_the_whole_job(compress):
+    payload = _random_payload(300000)
+    body = _puls(payload)
+    source = PulseSource(gzip.compress(body) if compress else body)
+    buffer = bytearray(7000)
+    out = bytearray()
+    while True:
+        n = source.readinto(buffer)
+        if not n:
+            break
+        out += buffer[:n]
+    assert out == payload
+    assert source.exhausted
+    assert source.served == len(payload)
+    assert source.readinto(bytearray(16)) == 0
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_read_view_hands_out_the_payload_uncopied(compress):
+    payload = _random_payload(300000)
+    body = _puls(payload)
+    source = PulseSource(gzip.compress(body) if compress else body)
+    views = []
+    while True:
+        view = source.read_view(50000)
+        if not view:
+            break
+        assert 0 < len(view) <= 50000
+        assert view.readonly
+        views.append(view)
+    # Still valid after later reads: each is the source's own memory.
+    assert b''.join(views) == payload
+    assert source.served == len(payload)
+    assert len(source.read_view(10)) == 0
+
+
+def test_the_read_calls_mix_and_follow_seek():
+    payload = _random_payload(100000)
+    source = PulseSource(gzip.compress(_puls(payload)), checkpoint_every=16384)
+    buffer = bytearray(1000)
+    assert source.read(10) == payload[:10]
+    assert source.readinto(buffer) == 1000 and buffer == payload[10:1010]
+    assert bytes(source.read_view(500)) == payload[1010:1510]
+    assert source.tell() == 1510
+    source.seek(40000)
+    assert bytes(source.read_view(100)) == payload[40000:40100]
+    source.readinto(memoryview(buffer)[:10])
+    assert buffer[:10] == payload[40100:40110]
+    assert source.read(5) == payload[40110:40115]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_prefetch_hands_out_the_same_payload(compress):
+    payload = _random_payload(600000)
+    body = _puls(payload)
+    source = PulseSource(gzip.compress(body) if compress else body, prefetch=65536)
+    assert source.program_size == len(payload)
+    out = bytearray()
+    buffer = bytearray(5000)
+    while True:
+        piece = source.read(3000)
+        n = source.readinto(buffer)
+        view = source.read_view(7000)
+        if not (piece or n or view):
+            break
+        out += piece + buffer[:n] + view
+    assert out == payload
+    assert source.exhausted
+    assert source.served == len(payload)
+    stats = source.prefetch_stats
+    assert stats['high_water'] == 65536 and stats['low_water'] == 32768
+    assert stats['reads'] > 0
+    assert 0 <= stats['waits'] <= stats['reads']
+
+
+def test_a_worker_that_will_not_stop_fails_reads_rather_than_hangs(monkeypatch, caplog):
+    from gfutilities.puls import source as source_mod
+    monkeypatch.setattr(source_mod, '_WORKER_JOIN', 0.1)
+    stuck, release = threading.Event(), threading.Event()
+    decode = PulseSource._decode
+
+    def _stuck_decode(self, limit):
+        if threading.current_thread().name == 'pulse-inflate':
+            stuck.set()
+            release.wait(5)
+        return decode(self, limit)
+
+    monkeypatch.setattr(PulseSource, '_decode', _stuck_decode)
+    source = PulseSource(gzip.compress(_puls(_random_payload(400000))), prefetch=100000)
+    assert stuck.wait(5)
+    with caplog.at_level(logging.WARNING):
+        source.close()
+    assert any('still running' in r.getMessage() for r in caplog.records)
+    with pytest.raises(PulseSourceError):
+        source.read(1000)
+    release.set()
+
+
+def test_prefetch_stages_ahead_and_stops_at_the_high_watermark():
+    payload = _random_payload(400000)
+    source = PulseSource(gzip.compress(_puls(payload)), prefetch=100000, low_water=10000)
+    deadline = time.monotonic() + 5
+    while len(source._out) < 100000 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    # Filled to the high watermark without a read, and no further.
+    assert 100000 <= len(source._out) < 100000 + 65536
+    assert source.served == 0
+    assert source.read(80000) == payload[:80000]
+    source.close()
+    assert _drain(source) == payload[80000:]
+
+
+def test_a_read_past_the_high_watermark_is_still_whole():
+    payload = _random_payload(300000)
+    source = PulseSource(gzip.compress(_puls(payload)), prefetch=4096)
+    assert source.read(200000) == payload[:200000]
+    assert source.read(200000) == payload[200000:]
+    assert source.read(10) == b''
+
+
+def test_prefetch_survives_a_seek():
+    payload = _random_payload(300000)
+    source = PulseSource(gzip.compress(_puls(payload)), checkpoint_every=32768,
+                         prefetch=65536)
+    assert source.read(1000) == payload[:1000]
+    assert source.seek(250000) == 250000
+    assert _drain(source) == payload[250000:]
+    assert source.seek(10) == 10
+    assert source.read(100) == payload[10:110]
+    assert source._worker is not None
+    source.close()
+
+
+def test_a_corrupt_stream_fails_the_read_not_the_worker():
+    body = bytearray(gzip.compress(_puls(_random_payload(200000))))
+    body[len(body) // 2:len(body) // 2 + 64] = bytes(64)
+    source = PulseSource(bytes(body), prefetch=16384)
+    with pytest.raises(zlib.error):
+        _drain(source, 65536)
+    source.close()
+
+
+def test_prefetch_settings_are_checked():
+    with pytest.raises(ValueError):
+        PulseSource(_puls(b'x'), prefetch=-1)
+    with pytest.raises(ValueError):
+        PulseSource(_puls(b'x'), prefetch=1000, low_water=1000)
+    assert PulseSource(_puls(b'x')).prefetch_stats is None
+
+
+def _trickle(body, size, gate=None, after=1, fail=None):
+    """A download: ``body`` in ``size`` pieces, holding at ``gate`` once
+    ``after`` pieces are out, and raising ``fail`` instead of ending."""
+    for n, start in enumerate(range(0, len(body), size)):
+        if gate is not None and n == after:
+            assert gate.wait(5)
+        yield body[start:start + size]
+    if fail is not None:
+        raise fail
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_stream_parses_the_header_before_the_body_is_in(compress):
+    from gfutilities.puls.source import PulseStream
+    payload = _random_payload(200000)
+    body = _puls(payload)
+    body = gzip.compress(body) if compress else body
+    gate = threading.Event()
+    done = []
+    source = PulseStream(_trickle(body, 4096, gate, after=3), on_done=lambda: done.append(1))
+    assert source.header['STfr'] == 10000
+    assert source.compressed is compress
+    assert source.program_size is None and not source.downloaded
+    assert source.body_size < len(body)
+    # Payload comes out of what has arrived while the rest is held back.
+    assert source.read(100) == payload[:100]
+    gate.set()
+    assert source.read(len(payload)) == payload[100:]
+    assert source.exhausted
+    assert source.downloaded and done == [1]
+    assert source.program_size == len(payload)
+    assert source.body == body
+
+
+def test_stream_holds_the_download_back_behind_the_inflater():
+    from gfutilities.puls.source import PulseStream
+    payload = _random_payload(200000)
+    source = PulseStream(_trickle(_puls(payload), 1000), max_ahead=8192)
+    time.sleep(0.1)
+    # Held at max_ahead past what the reader has taken, not run to the end.
+    assert source.body_size - source._in <= 8192 + 1000
+    assert source.body_size < 100000
+    assert _drain(source, 5000) == payload
+    assert source.downloaded
+
+
+def test_stream_fails_the_read_that_needs_a_lost_download():
+    from gfutilities.puls.source import PulseStream
+    body = _puls(_random_payload(100000))
+    source = PulseStream(_trickle(body[:50000], 4096, fail=OSError('reset by peer')))
+    assert source.read(40000)
+    with pytest.raises(PulseSourceError):
+        source.read(40000)
+    assert not source.downloaded
+
+
+def test_closing_a_stream_abandons_the_download():
+    from gfutilities.puls.source import PulseStream
+    gate = threading.Event()
+    done = []
+    source = PulseStream(_trickle(_puls(_random_payload(100000)), 4096, gate),
+                         on_done=lambda: done.append(1))
+    source.close()
+    assert done == [1]
+    gate.set()
+    with pytest.raises(PulseSourceError):
+        _drain(source)
+
+
+def test_closing_a_stream_stops_a_worker_waiting_on_the_download():
+    from gfutilities.puls.source import PulseStream
+    gate = threading.Event()
+    source = PulseStream(_trickle(gzip.compress(_puls(_random_payload(400000))), 4096, gate),
+                         prefetch=100000)
+    # The worker has inflated what arrived and waits for more.
+    time.sleep(0.1)
+    closing = threading.Thread(target=source.close, daemon=True)
+    closing.start()
+    closing.join(2)
+    assert not closing.is_alive()
+    gate.set()
+
+
+def test_a_stream_that_is_not_a_puls_file_is_refused():
+    from gfutilities.puls.source import PulseStream
+    done = []
+    with pytest.raises(PulseSourceError):
+        PulseStream(_trickle(b'<html>404</html>' * 100, 64), on_done=lambda: done.append(1))
+    assert done == [1]
@@ -7,7 +7,10 @@ SPDX-License-Identifier:    MIT
 """
 import random
 
-from gfutilities.puls.pulsedata import _decode_step_codes, decode_all_steps
+import pytest
+
+from gfutilities.puls import pulsedata
+from gfutilities.puls.pulsedata import StepStatsAccumulator, _decode_step_codes, decode_all_steps
 
 
 def _reference(puls, data=None, mode=(8, 2)):
@@ -122,3 +125,67 @@ def test_decode_cost_is_flat_in_stream_length():
     long_ = decode_all_steps(b'\x01' * 1000000)
     assert long_['XTOT'] == short['XTOT'] * 10000
     assert long_['XEND'] == short['XEND'] * 10000
+
+
+# -- the two engines -------------------------------------------------------
+
+def test_numpy_engine_is_picked_when_installed():
+    assert StepStatsAccumulator().vectorized is (pulsedata.np is not None)
+
+
+def test_engines_agree_on_every_byte_value_and_random_streams():
+    pytest.importorskip('numpy')
+    rnd = random.Random(1337)
+    streams = [bytes([v]) for v in range(256)] + [b'', bytes(range(256)) * 3]
+    streams += [bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 4096)))
+                for _ in range(20)]
+    for data in streams:
+        fast = StepStatsAccumulator(vectorized=True)
+        slow = StepStatsAccumulator(vectorized=False)
+        fast.update(data)
+        slow.update(data)
+        assert fast.result() == slow.result() == _reference(data)
+        # Plain ints, not numpy scalars: the stats are written out as json.
+        assert all(type(fast.result()[k]) is int for k in ('XP', 'ZEND', 'LP'))
+
+
+def test_vectorized_engine_without_numpy_is_refused(monkeypatch):
+    monkeypatch.setattr(pulsedata, 'np', None)
+    with pytest.raises(ValueError):
+        StepStatsAccumulator(vectorized=True)
+    assert StepStatsAccumulator().vectorized is False
+
+
+def test_buffer_types_a_chunk_can_arrive_as():
+    data = bytes(range(256)) * 4
+    expected = decode_all_steps(data)
+    assert decode_all_steps(bytearray(data)) == expected
+    assert decode_all_steps(memoryview(data)) == expected
+
+
+# -- a whole job through one accumulator ------------------------------------
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_accumulator_over_chunks_is_the_one_pass_answer(vectorized):
+    if vectorized:
+        pytest.importorskip('numpy')
+    rnd = random.Random(31337)
+    whole = bytes(rnd.randrange(256) for _ in range(10000))
+    stats = StepStatsAccumulator(mode=(16, 4), vectorized=vectorized)
+    for start in range(0, len(whole), 777):
+        stats.update(whole[start:start + 777])
+    # One histogram, converted once: no per-chunk rounding to carry.
+    assert stats.result() == _reference(whole, mode=(16, 4))
+    assert stats.size == len(whole)
+
+
+def test_result_can_be_asked_for_mid_job():
+    stats = StepStatsAccumulator()
+    stats.update(b'\x01' * 5)
+    assert stats.result()['XEND'] == 5
+    stats.update(b'\x03' * 2)
+    assert stats.result()['XEND'] == 3
+
+
+def test_empty_accumulator_is_all_zero():
+    assert StepStatsAccumulator().result() == _reference(b'')
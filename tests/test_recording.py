@@ -0,0 +1,126 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import json
+import threading
+
+import pytest
+
+pytest.importorskip('websockets')
+
+from gfutilities.configuration import get_cfg, set_cfg
+from gfutilities.service.mockservice import MockService
+from gfutilities.service.recording import (REC_HTTP, REC_OPEN, REC_RX, REC_SESSION, REC_TX, SessionRecorder,
+                                           read_recording, recording)
+from gfutilities.service.replay import SessionReplay
+
+_CFG = ('SERVICE.SERVER_URL', 'SERVICE.STATUS_SERVICE_URL', 'MACHINE.SERIAL', 'MACHINE.PASSWORD',
+        'SESSION.WS_TOKEN', 'SESSION.WS_TOKEN_ISSUED', 'SESSION.AUTH_TOKEN', 'FACTORY_FIRMWARE.CHECK',
+        'EMULATOR.IMAGE_SRC_DIR', 'EMULATOR.MOTION_DL_DIR', 'EMULATOR.BYPASS_HOMING', 'SETTINGS.SET',
+        'LOGGING.SAVE_PULS', 'SERVICE.WS_CLIENT')
+
+
+@pytest.fixture
+def machine_cfg(tmp_path):
+    saved = {key: get_cfg(key) for key in _CFG}
+    images = tmp_path / 'img'
+    images.mkdir()
+    for n in range(1, 5):
+        (images / ('HOME_%d.jpg' % n)).write_bytes(b'home %d' % n)
+    set_cfg('EMULATOR.IMAGE_SRC_DIR', str(images))
+    set_cfg('EMULATOR.MOTION_DL_DIR', str(tmp_path))
+    set_cfg('EMULATOR.BYPASS_HOMING', None)
+    set_cfg('SETTINGS.SET', None)
+    set_cfg('LOGGING.SAVE_PULS', None)
+    set_cfg('FACTORY_FIRMWARE.CHECK', True)
+    # The asyncio client stops at once; the threaded one can take its ping
+    # timeout to. The first test records through the threaded one.
+    set_cfg('SERVICE.WS_CLIENT', 'asyncio')
+    yield tmp_path
+    for key, value in saved.items():
+        set_cfg(key, value)
+
+
+def _record(path, script):
+    from gfutilities import Emulator, GFUIService
+
+    with MockService(script=script, password='secret') as mock:
+        mock.configure(serial='12345678', password='secret')
+        with SessionRecorder(str(path)) as recorder:
+            service = GFUIService(Emulator())
+            assert service.connect()
+            runner = threading.Thread(target=service.run)
+            runner.start()
+            try:
+                assert mock.wait(timeout=30)
+            finally:
+                service.request_stop()
+                runner.join(10)
+    assert recording() is None
+    return recorder
+
+
+def test_a_session_is_recorded_without_its_credentials(machine_cfg, monkeypatch):
+    monkeypatch.setattr('gfutilities.service.recording.BLOB_MIN', 64)
+    set_cfg('SERVICE.WS_CLIENT', None)
+    path = machine_cfg / 'session.gfrec'
+    recorder = _record(path, ('settings', 'lid_image', 'print', 'print'))
+    records = list(read_recording(str(path)))
+    assert recorder.records >= len(records)
+    assert records[0].kind == REC_SESSION and records[0].meta['serial'] == '12345678'
+    kinds = [r.kind for r in records]
+    assert REC_OPEN in kinds and REC_RX in kinds and REC_TX in kinds
+    http = [r for r in records if r.kind == REC_HTTP]
+    sign_in = next(r for r in http if r.meta['url'].endswith('/machines/sign_in'))
+    assert sign_in.request == b'' and json.loads(sign_in.response)['ws_token'] == 'REDACTED'
+    assert all('Authorization' not in r.meta['request_headers'] for r in http)
+    jobs = [r for r in http if '/jobs/' in r.meta['url']]
+    assert len(jobs) == 2 and jobs[0].response == jobs[1].response
+    upload = next(r for r in http if r.meta['method'] == 'PUT')
+    assert upload.request == b'home 1'
+    raw = path.read_bytes()
+    # The job is stored once, however often it was served.
+    assert raw.count(jobs[0].response) == 1
+    assert b'secret' not in raw and get_cfg('SESSION.AUTH_TOKEN').encode() not in raw
+
+
+def test_a_cut_off_recording_reads_to_its_last_whole_record(machine_cfg):
+    path = machine_cfg / 'session.gfrec'
+    _record(path, ('settings',))
+    whole = list(read_recording(str(path)))
+    path.write_bytes(path.read_bytes()[:-3])
+    assert list(read_recording(str(path))) == whole[:-1]
+
+
+@pytest.mark.parametrize('speed', [None, 1.0])
+def test_a_replayed_session_sends_the_recorded_events(machine_cfg, speed):
+    path = machine_cfg / 'session.gfrec'
+    _record(path, ('settings', 'lid_image', 'lid_image', 'hunt', 'print'))
+    with SessionReplay(str(path), speed=speed) as session:
+        assert session.server_url != get_cfg('SERVICE.SERVER_URL')
+        result = session.run(timeout=30)
+    assert result['match'], '\n'.join(result['diff'])
+    assert result['events']['recorded'] == result['events']['replayed'] > 0
+    assert result['frames'] == 5 and not result['unmatched']
+    assert result['elapsed'] > 0 and result['recorded'] > 0
+
+
+def test_a_machine_that_differs_shows_in_the_diff(machine_cfg):
+    from gfutilities import Emulator
+    from gfutilities.service.websocket import send_wss_event
+
+    path = machine_cfg / 'session.gfrec'
+    _record(path, ('settings', 'lid_image'))
+
+    class Broken(Emulator):
+        def _lid_image(self, msg, settings=None):
+            send_wss_event(self._q_msg_tx, msg['id'], 'lid_image:failed')
+
+    with SessionReplay(str(path), speed=None, gate_timeout=1.0) as session:
+        result = session.run(Broken, timeout=10)
+    assert not result['match']
+    assert any(line.startswith('+') and 'lid_image:failed' in line for line in result['diff'])
@@ -0,0 +1,140 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import random
+import socket
+
+import pytest
+
+from conftest import JobHandler, make_job
+from gfutilities.service import websocket as ws
+
+
+class _JobHost(JobHandler):
+    """Serves one job with Range/If-Range, and drops the connection at the
+    absolute body offsets in ``server.cuts``, one per response. With
+    ``server.replace`` set, the job is replaced by a new version the first
+    time the connection drops; with ``server.declare`` unset, a full body is
+    sent chunked, with no length."""
+
+    def do_GET(self):
+        host = self.server
+        body = host.body
+        host.requests.append((self.headers.get('Range'), self.headers.get('If-Range')))
+        start = 0
+        if self.headers.get('Range') and self.headers.get('If-Range') == host.etag:
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(body) - 1, len(body)))
+        else:
+            self.send_response(200)
+        if host.etag:
+            self.send_header('ETag', host.etag)
+        chunked = not start and not host.declare
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.wfile.write(b'%x\r\n' % len(body))
+        else:
+            self.send_header('Content-Length', str(len(body) - start))
+            self.end_headers()
+        end = max(start, min(len(body), host.cuts.pop(0))) if host.cuts else len(body)
+        self.wfile.write(body[start:end])
+        if end < len(body):
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            if host.replace:
+                host.etag, host.replace = host.replace, None
+        elif chunked:
+            self.wfile.write(b'\r\n0\r\n\r\n')
+
+
+@pytest.fixture
+def host(job_host, monkeypatch):
+    monkeypatch.setattr(ws, '_RESUME_BACKOFF', 0.001)
+    return job_host(_JobHost, make_job(random.Random(1).randbytes(400000)),
+                    etag='"v1"', replace=None, declare=True, cuts=[])
+
+
+def _drain(source) -> bytes:
+    out = bytearray()
+    while True:
+        piece = source.read(65536)
+        if not piece:
+            return bytes(out)
+        out += piece
+
+
+def _offsets(host, count, seed):
+    return sorted(random.Random(seed).sample(range(1, len(host.body)), count))
+
+
+def test_an_unbroken_download_asks_for_no_range(host):
+    info, source = ws.fetch_motion(ws.get_session(), host.url)
+    assert info and bytes(source.body) == host.body
+    assert host.requests == [(None, None)]
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_a_broken_download_resumes_where_it_stopped(host, seed):
+    cuts = _offsets(host, 4, seed)
+    host.cuts = list(cuts)
+    info, source = ws.fetch_motion(ws.get_session(), host.url)
+    assert info and bytes(source.body) == host.body
+    assert host.requests[1:] == [('bytes=%d-' % cut, '"v1"') for cut in cuts]
+
+
+def test_a_pipelined_download_resumes_under_the_reader(host):
+    host.cuts = _offsets(host, 3, 9)
+    info, source = ws.fetch_motion(ws.get_session(), host.url, pipeline=True)
+    assert info
+    assert len(_drain(source)) == 400000
+    assert source.downloaded and bytes(source.body) == host.body
+    assert len(host.requests) == 4
+
+
+def test_an_undeclared_body_resumes_too(host):
+    host.declare = False
+    host.cuts = [123457]
+    info, source = ws.fetch_motion(ws.get_session(), host.url)
+    assert info and bytes(source.body) == host.body
+    # A chunk cut short is dropped whole, so the resume may start earlier.
+    first = int(host.requests[1][0].split('=')[1].rstrip('-'))
+    assert 0 < first <= 123457 and host.requests[1][1] == '"v1"'
+    assert len(host.requests) == 2
+
+
+def test_a_job_replaced_on_the_server_is_not_spliced(host):
+    host.cuts = [100000]
+    host.replace = '"v2"'
+    # The resume names v1; the server has v2 now and sends all of it.
+    assert ws.fetch_motion(ws.get_session(), host.url) == (False, None)
+    assert host.requests[1] == ('bytes=100000-', '"v1"')
+    assert len(host.requests) == 2
+
+
+def test_a_body_with_no_version_is_not_resumed(host):
+    host.etag = None
+    host.cuts = [100000]
+    assert ws.fetch_motion(ws.get_session(), host.url) == (False, None)
+    assert len(host.requests) == 1
+
+
+def test_resumes_are_bounded(host):
+    host.cuts = [50000 * n for n in range(1, 8)]
+    assert ws.fetch_motion(ws.get_session(), host.url, resumes=3) == (False, None)
+    assert len(host.requests) == 4
+
+
+def test_a_resumed_body_is_held_to_the_same_budget(host):
+    # Undeclared at first, so only the resumed response says how big it is.
+    host.declare = False
+    host.cuts = [len(host.body) // 2]
+    assert ws.fetch_motion(ws.get_session(), host.url,
+                           reject_bytes=len(host.body) - 1000) == (False, None)
+    assert len(host.requests) == 2
@@ -0,0 +1,135 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+import gzip
+import random
+import struct
+
+import pytest
+
+from gfutilities.puls import PositionTrace, decode_all_steps, trace_source
+from gfutilities.puls.source import PulseSource
+
+def _engines():
+    out = [False]
+    try:
+        import numpy  # noqa: F401
+        out.append(True)
+    except ImportError:
+        pass
+    return out
+
+
+def _reference(puls, origin=(0, 0, 0)):
+    """Every position the job passes through, one byte at a time."""
+    step = {'X': {0x01: 1, 0x03: -1}, 'Y': {0x0c: 1, 0x04: -1}, 'Z': {0x60: 1, 0x20: -1}}
+    mask = {'X': 0x03, 'Y': 0x0c, 'Z': 0x60}
+    pos = dict(zip('XYZ', origin))
+    trail = [(0,) + tuple(origin)]
+    for tick, value in enumerate(puls, 1):
+        if not value & 0x80:
+            for axis in 'XYZ':
+                pos[axis] += step[axis].get(value & mask[axis], 0)
+        trail.append((tick, pos['X'], pos['Y'], pos['Z']))
+    return trail
+
+
+def _excursion(trail):
+    return {axis: (min(p[i] for p in trail), max(p[i] for p in trail))
+            for i, axis in enumerate('XYZ', 1)}
+
+
+@pytest.mark.parametrize('vectorized', _engines())
+def test_excursion_matches_a_byte_by_byte_walk(vectorized):
+    rnd = random.Random(808)
+    for _ in range(10):
+        data = bytes(rnd.choice((0x01, 0x03, 0x0c, 0x04, 0x60, 0x20, 0x0d, 0x80, 0x00))
+                     for _ in range(rnd.randrange(1, 5000)))
+        trace = PositionTrace(vectorized=vectorized)
+        for start in range(0, len(data), 333):
+            trace.update(data[start:start + 333])
+        result = trace.result()
+        trail = _reference(data)
+        for axis, (low, high) in _excursion(trail).items():
+            assert (result[axis + 'MIN'], result[axis + 'MAX']) == (low, high), axis
+        assert (result['XEND'], result['YEND'], result['ZEND']) == trail[-1][1:]
+        assert result['TICKS'] == len(data)
+
+
+@pytest.mark.parametrize('vectorized', _engines())
+def test_end_position_agrees_with_the_statistics(vectorized):
+    rnd = random.Random(5)
+    data = bytes(rnd.randrange(256) for _ in range(200000))
+    trace = PositionTrace(vectorized=vectorized)
+    trace.update(data)
+    stats = decode_all_steps(data)
+    result = trace.result()
+    for axis in 'XYZ':
+        assert result[axis + 'END'] == stats[axis + 'END']
+        assert result[axis + 'ENDMM'] == stats[axis + 'MM']
+
+
+def test_a_move_out_and_back_is_caught_though_it_ends_home():
+    # The case end positions cannot see: out 800 steps and straight back.
+    trace = PositionTrace()
+    trace.update(b'\x01' * 800 + b'\x03' * 800)
+    result = trace.result()
+    assert result['XEND'] == 0
+    assert result['XMAX'] == 800
+    assert result['XMAXMM'] == pytest.approx(15.0)
+    assert result['BBOX'] == (0.0, 0.0, pytest.approx(15.0), 0.0)
+    assert trace.outside({'X': (0, 10)}) == ['X']
+    assert trace.outside({'X': (0, 20), 'Y': (0, 1)}) == []
+
+
+def test_origin_offsets_every_position():
+    trace = PositionTrace(origin=(100, -50, 3))
+    trace.update(b'\x03' * 10)
+    result = trace.result()
+    assert (result['XMIN'], result['XMAX'], result['YMIN'], result['ZMAX']) == (90, 100, -50, 3)
+
+
+@pytest.mark.parametrize('vectorized', _engines())
+def test_polyline_samples_on_the_stride_and_ends_where_the_job_does(vectorized):
+    rnd = random.Random(12)
+    data = bytes(rnd.choice((0x01, 0x03, 0x0c, 0x04, 0x61, 0x00)) for _ in range(1000))
+    trace = PositionTrace(sample_every=64, vectorized=vectorized)
+    for start in range(0, len(data), 100):
+        trace.update(data[start:start + 100])
+    trail = _reference(data)
+    expected = trail[::64]
+    if expected[-1] != trail[-1]:
+        expected.append(trail[-1])
+    assert trace.polyline == expected
+
+
+@pytest.mark.parametrize('vectorized', _engines())
+def test_polyline_stays_bounded_on_a_long_job(vectorized):
+    data = (b'\x01' * 500 + b'\x0c' * 500) * 200      # 200k ticks
+    trace = PositionTrace(sample_every=10, max_points=256, vectorized=vectorized)
+    trace.update(data)
+    line = trace.polyline
+    assert len(line) <= 257
+    stride = line[1][0] - line[0][0]
+    assert stride > 10 and all(b[0] - a[0] == stride for a, b in zip(line[:-2], line[1:-1]))
+    assert line[-1] == (len(data), 100000, 100000, 0)
+
+
+def test_no_polyline_unless_asked():
+    trace = PositionTrace()
+    trace.update(b'\x01')
+    assert trace.polyline is None
+
+
+def test_trace_source_drains_a_compressed_job():
+    fields = b''.join(t + struct.pack('<I', v) for t, v in
+                      ((b'STfr', 10000), (b'MCsn', 0), (b'PDfm', 0)))
+    payload = b'\x0c' * 70000 + b'\x04' * 30000
+    body = gzip.compress(b'\x80GF1' + struct.pack('<I', 8 + len(fields)) + fields + payload)
+    trace = trace_source(PulseSource(body), chunk=4096)
+    result = trace.result()
+    assert (result['YMAX'], result['YEND'], result['TICKS']) == (70000, 40000, len(payload))
@@ -0,0 +1,104 @@
+"""
+(C) Copyright 2026
+Scott Wiederhold, s.e.wiederhold@gmail.com
+https://community.openglow.org
+
+SPDX-License-Identifier:    MIT
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+import threading
+
+import pytest
+
+from gfutilities.service import upload
+from gfutilities.service import websocket as ws
+from gfutilities.service.upload import UploadSession
+
+
+class _Storage(BaseHTTPRequestHandler):
+    """A storage host: keeps connections alive and records every PUT."""
+    protocol_version = 'HTTP/1.1'
+    puts = []
+    cookie = None
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        _Storage.puts.append((self.path, dict(self.headers), body, self.client_address))
+        self.send_response(200)
+        if _Storage.cookie:
+            self.send_header('Set-Cookie', _Storage.cookie)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def storage():
+    _Storage.puts = []
+    _Storage.cookie = None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Storage)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+def test_uploads_share_one_connection(storage):
+    s = UploadSession()
+    for n in range(3):
+        assert s.put_image(storage + '/img%d?sig=x' % n, b'jpeg%d' % n).status_code == 200
+    # One client port for all three: the connection was kept alive.
+    assert len({put[3] for put in _Storage.puts}) == 1
+    assert [t['reused'] for t in s.timings] == [False, True, True]
+    assert s.timings[0]['connect'] > 0
+    assert s.timings[1]['connect'] == s.timings[1]['tls'] == 0
+    assert all(t['bytes'] == 5 and t['transfer'] >= 0 for t in s.timings)
+
+
+def test_a_file_is_streamed_from_disk(storage, tmp_path):
+    path = tmp_path / 'HOME_1.jpg'
+    path.write_bytes(bytes(range(256)) * 100)
+    s = UploadSession()
+    assert s.put_image(storage + '/home', path)
+    assert s.put_image(storage + '/buffer', BytesIO(b'abc'))
+    assert _Storage.puts[0][2] == path.read_bytes()
+    assert _Storage.puts[1][2] == b'abc'
+    assert s.timings[0]['bytes'] == 25600
+
+
+def test_an_unreachable_host_fails_without_raising():
+    s = UploadSession()
+    assert s.put_image('http://127.0.0.1:1/img', b'x', timeout=2) is False
+    assert not s.timings
+
+
+def test_img_upload_goes_through_the_shared_session_without_credentials(storage, monkeypatch):
+    monkeypatch.setattr(upload, '_upload_session', None)
+    glowforge = ws.get_session()
+    glowforge.headers['Authorization'] = 'Bearer secret'
+    assert ws.img_upload(glowforge, b'jpeg', {'endpoint': storage + '/img?sig=x'})
+    assert ws.img_upload(glowforge, b'jpeg', {'endpoint': storage + '/img?sig=y'})
+    assert all('Authorization' not in put[1] for put in _Storage.puts)
+    assert _Storage.puts[0][1]['Content-Type'] == 'image/jpeg'
+    assert [t['reused'] for t in upload.upload_session().timings] == [False, True]
+
+
+def test_a_cookie_from_the_storage_host_is_not_sent_back(storage):
+    _Storage.cookie = 'session=abc; Path=/'
+    s = UploadSession()
+    assert s.put_image(storage + '/img1?sig=x', b'jpeg')
+    assert s.put_image(storage + '/img2?sig=y', b'jpeg')
+    assert 'Cookie' not in _Storage.puts[1][1]
+    assert not s.cookies
+
+
+def test_the_environment_has_no_say(storage, monkeypatch):
+    # A proxy that is not there: an upload through it would fail.
+    monkeypatch.setenv('HTTP_PROXY', 'http://127.0.0.1:1')
+    monkeypatch.delenv('NO_PROXY', raising=False)
+    monkeypatch.delenv('no_proxy', raising=False)
+    assert UploadSession().put_image(storage + '/img?sig=x', b'jpeg').status_code == 200